@@ -1,5 +1,5 @@
 requirejs.config({waitSeconds:0});
-require([
+var appModules = [
   './jquery.js',
   './handlebars.min.js',
   './elasticlunr.min.js',
@@ -7,7 +7,17 @@ require([
   'text!templates/question_list.mustache',
    'text!templates/word_list.mustache',
   'text!data.json'
-], function (_, Mustache, elasticlunr, questionView, questionList, wordList, data, indexDump) {
+];
+
+// data.index.json is the search index prebuilt by the pipeline (lunr_index.py).
+// It is optional: if it cannot be loaded the app starts without it and builds
+// the index itself.
+require(appModules.concat(['text!data.index.json']), startApp, function () {
+  requirejs.undef('text!data.index.json');
+  require(appModules, startApp);
+});
+
+function startApp(_, Mustache, elasticlunr, questionView, questionList, wordList, data, indexDump) {
 
 //,  'text!example_index.json',   'text!example_data.json', 
 
@@ -170,9 +180,25 @@ var shortlist = tagNames;
   })
 
   
-  questions.forEach(function (question) {
-    idx.addDoc(question);
-  });
+  // Use the prebuilt index only if it was made from this data.json: same
+  // elasticlunr version, and the size and CRC-32 recorded by lunr_index.py
+  // match the bytes loaded.
+  var dump = null;
+  if (indexDump) {
+    try { dump = JSON.parse(indexDump); } catch (e) { dump = null; }
+  }
+  var dumpMatches = !!dump && dump.version === elasticlunr.version && !!dump.data;
+  if (dumpMatches) {
+    var dataBytes = new TextEncoder().encode(data);
+    dumpMatches = dump.data.bytes === dataBytes.length && dump.data.crc32 === crc32(dataBytes);
+  }
+  if (dumpMatches) {
+    idx = elasticlunr.Index.load(dump);
+  } else {
+    questions.forEach(function (question) {
+      idx.addDoc(question);
+    });
+  }
   
   
 window.idx = idx;
@@ -365,7 +391,7 @@ function dowork(results, totalResultsToRender, term) {
     })[0])
   })
 
-})
+}
 
 function murmurhash3_32_gc(key, seed) {
 	var remainder, bytes, h1, h1b, c1, c1b, c2, c2b, k1, i;
@@ -420,3 +446,23 @@ function murmurhash3_32_gc(key, seed) {
 }
 
 
+var crc32Table = null;
+
+// CRC-32 (as zlib.crc32 in Python) of a Uint8Array.
+function crc32(bytes) {
+	if (!crc32Table) {
+		crc32Table = new Uint32Array(256);
+		for (var n = 0; n < 256; n++) {
+			var c = n;
+			for (var k = 0; k < 8; k++) {
+				c = c & 1 ? 0xedb88320 ^ (c >>> 1) : c >>> 1;
+			}
+			crc32Table[n] = c;
+		}
+	}
+	var crc = 0xffffffff;
+	for (var i = 0; i < bytes.length; i++) {
+		crc = crc32Table[(crc ^ bytes[i]) & 0xff] ^ (crc >>> 8);
+	}
+	return (crc ^ 0xffffffff) >>> 0;
+}
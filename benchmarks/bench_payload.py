@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Compare ``data.json`` with the sharded search payload on synthetic libraries.
+
+For each library size the same synthetic entries are written as ``data.json``
+(the old ``indent=4`` layout and the current compact one) and as a
+``search_payload`` directory.  The report shows bytes on disk and on the wire
+(gzip, as ``precompress.py`` writes it) and ``json.loads`` time, which tracks
+the browser's ``JSON.parse`` closely enough to compare formats.  For the
+payload, "first paint" is the manifest plus the first shard: everything a
+client needs to show the tag list and a page of results.
+
+Usage::
+
+    python benchmarks/bench_payload.py [--sizes 10000,100000,1000000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+from data_writer import write_data_file
+from precompress import compress_bytes
+from search_payload import MANIFEST_NAME, write_search_payload
+from thumb_utils import thumb_name_in_dir
+
+VOCABULARY = 5000
+FOLDERS = 200
+
+
+def synthetic_entries(count: int, seed: int = 1234):
+    """Yield ``count`` entries shaped like ``offline_tags.build_entry`` output."""
+    rng = random.Random(seed)
+    # Zipf-like tag popularity, as in real caption vocabularies.
+    tags = [f"TAG{i}" for i in range(VOCABULARY)]
+    weights = [1 / (i + 1) for i in range(VOCABULARY)]
+    for i in range(count):
+        folder = i * FOLDERS // count
+        name = f"IMG_{i:07d}.JPG"
+        chosen = sorted(set(rng.choices(tags, weights, k=rng.randint(3, 8))))
+        yield {
+            "img": {"filename": name},
+            "question": {"content": {t: "1.0" for t in chosen}},
+            "thumb": {"filename": thumb_name_in_dir(f"home_user_Pictures_{folder:03d}", f"{folder:08x}", name)},
+        }
+
+
+def _measure(paths):
+    raw = wire = 0
+    started = time.perf_counter()
+    for path in paths:
+        data = path.read_bytes()
+        json.loads(data)
+        raw += len(data)
+    seconds = time.perf_counter() - started
+    for path in paths:
+        wire += len(compress_bytes(path.read_bytes(), "gzip"))
+    return raw, wire, seconds
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma-separated library sizes")
+    args = parser.parse_args()
+
+    print(f"{'images':>9} {'format':<22}{'raw MB':>9}{'gzip MB':>9}{'parse s':>9}")
+    for count in (int(s) for s in args.sizes.split(",")):
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            write_data_file(tmp / "indent.json", synthetic_entries(count), indent=4)
+            write_data_file(tmp / "compact.json", synthetic_entries(count))
+            result = write_search_payload(tmp / "shards", synthetic_entries(count))
+            shards = [tmp / "shards" / name for name in result.shards]
+            manifest = tmp / "shards" / MANIFEST_NAME
+            rows = [
+                ("data.json indent=4", [tmp / "indent.json"]),
+                ("data.json compact", [tmp / "compact.json"]),
+                ("payload first paint", [manifest] + shards[:1]),
+                (f"payload all ({len(shards)} shards)", [manifest] + shards),
+            ]
+            for label, paths in rows:
+                raw, wire, seconds = _measure(paths)
+                print(f"{count:>9} {label:<22}{raw / 1e6:>9.2f}{wire / 1e6:>9.2f}{seconds:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
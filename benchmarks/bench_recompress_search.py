@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Compare quality search strategies used by ``jpeg_recompress``.
+
+For each image the thumbnail-style recompression (smallfry, preset "low",
+quality 40-98, as used by ``make_thumbs -Z``) is run with every strategy in
+``SEARCH_STRATEGIES`` with the ``make_thumbs`` encode budget, cold and seeded
+from a quality model trained on the images before it.  The report shows
+encodes per image, output size, time and how often the chosen quality
+matches plain bisection, so savings can be confirmed on a real corpus.
+
+Usage::
+
+    python benchmarks/bench_recompress_search.py [IMAGE_OR_DIR ...] [--thumb_size 256]
+
+Without arguments the sample images in ``img/test_src`` plus a set of
+synthetic images are used.
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageOps
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+from jpeg_recompress import SEARCH_STRATEGIES, recompress_image
+from make_thumbs import THUMB_LOOPS
+from quality_model import MIN_SAMPLES, QualityModel, image_features
+
+
+def _thumbs(paths, thumb_size: int):
+    for path in paths:
+        with Image.open(path) as im:
+            yield path.name, ImageOps.exif_transpose(im).convert("RGB").resize((thumb_size, thumb_size))
+
+
+def _synthetic(count: int, thumb_size: int):
+    rng = np.random.default_rng(11)
+    for i in range(count):
+        freq = 1 + i % 7
+        y, x = np.mgrid[0:thumb_size, 0:thumb_size] / thumb_size
+        base = 127 + 100 * np.sin(2 * np.pi * freq * x) * np.cos(2 * np.pi * (i % 3 + 1) * y)
+        noise = rng.normal(0, 3 + 4 * (i % 5), (thumb_size, thumb_size, 3))
+        arr = np.clip(base[..., None] + noise, 0, 255).astype(np.uint8)
+        yield f"synthetic_{i}", Image.fromarray(arr, "RGB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("inputs", nargs="*", type=Path)
+    parser.add_argument("--thumb_size", type=int, default=256)
+    parser.add_argument("--synthetic", type=int, default=80, help="synthetic images when no inputs given")
+    args = parser.parse_args()
+
+    if args.inputs:
+        paths = []
+        for p in args.inputs:
+            paths.extend(sorted(q for q in p.iterdir() if q.suffix.lower() in (".jpg", ".jpeg", ".png")) if p.is_dir() else [p])
+        images = list(_thumbs(paths, args.thumb_size))
+    else:
+        src = sorted((REPO_ROOT / "img" / "test_src").glob("*.JPG"))
+        images = list(_thumbs(src, args.thumb_size)) + list(_synthetic(args.synthetic, args.thumb_size))
+
+    # (label, strategy, loops, seeding): seeding is None, or "model" for a
+    # QualityModel that learns from each image in turn (and predicts once it
+    # has MIN_SAMPLES samples), like one kept across make_thumbs runs.
+    configs = [("bisect", "bisect", THUMB_LOOPS, None)]
+    for strategy in SEARCH_STRATEGIES:
+        if strategy != "bisect":
+            configs += [
+                (strategy, strategy, THUMB_LOOPS, None),
+                (f"{strategy} +model", strategy, THUMB_LOOPS, "model"),
+            ]
+
+    results = {}
+    for label, strategy, loops, seeding in configs:
+        rows = results[label] = []
+        model = QualityModel()
+        for _, image in images:
+            started = time.perf_counter()
+            start, window = None, None
+            if seeding == "model":
+                features = image_features(image)
+                prediction = model.predict("bench", features, 40, 98)
+                if prediction is not None:
+                    start, window = prediction
+            r = recompress_image(
+                image, jpeg_min=40, jpeg_max=98, preset="low", loops=loops, method="smallfry",
+                keep_metadata=False, quiet=True, search=strategy, start=start, window=window,
+            )
+            rows.append((r.encodes, r.quality, len(r.data), time.perf_counter() - started))
+            if seeding == "model" and r.quality is not None:
+                model.add("bench", features, r.quality)
+
+    baseline = results["bisect"]
+    print(f"{len(images)} image(s); the model predicts from image {MIN_SAMPLES + 1} on")
+    print(f"{'configuration':<24}{'encodes/img':>12}{'min':>5}{'max':>5}{'ms/img':>9}{'KB total':>10}{'same q':>8}")
+    for label, rows in results.items():
+        encodes = [r[0] for r in rows]
+        same = sum(1 for r, b in zip(rows, baseline) if r[1] == b[1])
+        print(
+            f"{label:<24}{statistics.mean(encodes):>12.2f}{min(encodes):>5}{max(encodes):>5}"
+            f"{1000 * statistics.mean(r[3] for r in rows):>9.1f}{sum(r[2] for r in rows) / 1024:>10.1f}"
+            f"{same:>5}/{len(rows)}"
+        )
+
+if __name__ == "__main__":
+    main()
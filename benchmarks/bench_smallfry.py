@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Micro-benchmark of the smallfry blocking-artifact (AAE) factor.
+
+Times the loop-based reference implementation against the vectorised one for
+several image sizes and checks that both return exactly the same value.
+
+Usage::
+
+    python benchmarks/bench_smallfry.py [--sizes 64 256 1024] [--repeat 3]
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from jpeg_recompress import _smallfry_aae_factor, _smallfry_aae_factor_reference
+
+
+def _best_time(fn, repeat: int):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64, 128, 256, 512, 1024])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    print(f"{'size':>10}{'reference ms':>15}{'vectorised ms':>15}{'speedup':>10}  identical")
+    for size in args.sizes:
+        # Smooth content plus noise, JPEG-compressed, so blocking artefacts
+        # look like they would on a real thumbnail.
+        base = np.add.outer(np.arange(size), np.arange(size)) % 256
+        orig = np.clip(base + rng.normal(0, 20, (size, size)), 0, 255).astype(np.uint8)
+        buf = BytesIO()
+        Image.fromarray(orig).save(buf, format="JPEG", quality=40)
+        comp = np.asarray(Image.open(buf).convert("L"))
+        maxv = int(orig.max())
+
+        ref_t, ref = _best_time(lambda: _smallfry_aae_factor_reference(orig, comp, maxv), args.repeat)
+        vec_t, vec = _best_time(lambda: _smallfry_aae_factor(orig, comp, maxv), args.repeat)
+        print(
+            f"{f'{size}x{size}':>10}{ref_t * 1000:>15.2f}{vec_t * 1000:>15.3f}"
+            f"{ref_t / vec_t:>9.0f}x  {ref == vec}"
+        )
+
+
+if __name__ == "__main__":
+    main()
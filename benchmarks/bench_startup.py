@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Measure CLI start-up cost of the pipeline scripts.
+
+For each module this runs ``python -X importtime -c "import <module>"`` in a
+fresh interpreter and reports the cumulative import time of the module itself
+plus the slowest top-level dependencies it pulled in.  It also times the
+``--help`` invocation of each script end to end.
+
+Heavy dependencies (torch, transformers, spaCy, scikit-image, jpeglib) should
+never appear here; they are imported only on the code paths that use them.
+Pass ``--budget-ms`` to fail (exit 1) when a module's import exceeds it.
+
+Usage::
+
+    python benchmarks/bench_startup.py [--top 5] [--budget-ms 500]
+"""
+
+from __future__ import annotations
+
+import argparse
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+MODULES = ["run_pipeline", "make_thumbs", "offline_tags", "jpeg_recompress"]
+HEAVY = ("torch", "transformers", "spacy", "skimage", "jpeglib")
+
+
+def import_times(module: str):
+    """Return ``({name: cumulative_us}, all_imported_names)`` for ``module``.
+
+    The mapping covers ``module`` itself and its direct imports.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+    )
+    # Children are printed before their parent and indented two spaces
+    # deeper, so collect depth-1 entries until the target module closes them.
+    children = {}
+    imported = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, raw_name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # header line
+        depth = (len(raw_name) - len(raw_name.lstrip()) - 1) // 2
+        name = raw_name.strip()
+        imported.add(name)
+        if depth == 1:
+            children[name] = int(cumulative)
+        elif depth == 0:
+            if name == module:
+                children[module] = int(cumulative)
+                return children, imported
+            children = {}
+    return children, imported
+
+
+def help_wall_time(module: str) -> float:
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable, f"{module}.py", "--help"],
+        cwd=REPO_ROOT, capture_output=True, check=False,
+    )
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=5, help="slowest imports to list per module")
+    parser.add_argument("--budget-ms", type=float, help="fail if any module import exceeds this")
+    args = parser.parse_args()
+
+    over_budget = []
+    for module in MODULES:
+        times, imported = import_times(module)
+        total_ms = times.get(module, 0) / 1000
+        heavy = sorted({name.split(".")[0] for name in imported} & set(HEAVY))
+        print(f"{module}: import {total_ms:.1f} ms, --help {help_wall_time(module) * 1000:.0f} ms")
+        slowest = sorted(
+            ((us, name) for name, us in times.items() if name != module), reverse=True
+        )[: args.top]
+        for us, name in slowest:
+            print(f"    {us / 1000:8.1f} ms  {name}")
+        if heavy:
+            print(f"    WARNING: heavy modules imported at start-up: {', '.join(heavy)}")
+        if args.budget_ms is not None and total_ms > args.budget_ms:
+            over_budget.append(module)
+
+    if over_budget:
+        print(f"Over the {args.budget_ms} ms budget: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
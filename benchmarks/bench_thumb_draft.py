@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""Compare full JPEG decoding against draft-mode decoding for thumbnails.
+
+Each configuration runs in a fresh interpreter so that peak RSS reflects only
+that decoding path.  Two image sets are measured: the sample photos in
+``img/test_src`` and a handful of large synthetic JPEGs generated on the fly.
+The sample photos are only 240x240, so draft mode cannot reduce them and the
+two rows for that set should agree to within noise; the synthetic set shows
+the real effect on camera-sized images.
+
+Usage::
+
+    python benchmarks/bench_thumb_draft.py [--repeat N] [--thumb_size 256]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+SYNTHETIC_SIZES = [(4000, 3000), (6000, 4000), (8000, 6000)]
+
+
+def _peak_rss_kb():
+    # VmHWM belongs to the current address space, so unlike ru_maxrss it is not
+    # inherited from the (much larger) parent across fork/exec.
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes elsewhere.
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def run_child(image_dir: Path, draft: bool, thumb_size: int, repeat: int) -> None:
+    from make_thumbs import Watermark, render_thumbnail
+
+    images = sorted(p for p in image_dir.iterdir() if p.suffix.lower() in (".jpg", ".jpeg"))
+    watermark = Watermark.load(REPO_ROOT / "img" / "overlay" / "watermark.png")
+    with tempfile.TemporaryDirectory() as out_dir:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for img_path in images:
+                created, messages, _ = render_thumbnail(
+                    img_path, Path(out_dir) / (img_path.stem + ".THUMB.JPG"),
+                    watermark, thumb_size, draft=draft,
+                )
+                if not created:
+                    raise RuntimeError("; ".join(messages))
+        elapsed = time.perf_counter() - started
+    print(json.dumps({
+        "images": len(images) * repeat,
+        "seconds": elapsed,
+        "peak_rss_kb": _peak_rss_kb(),
+    }))
+
+
+def make_synthetic(out_dir: Path) -> Path:
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(1234)
+    for width, height in SYNTHETIC_SIZES:
+        # Smooth gradients plus noise compress like a real photo rather than
+        # a flat colour, so the decoder has genuine work to do.
+        x = np.linspace(0, 200, width, dtype=np.float32)[None, :]
+        y = np.linspace(0, 200, height, dtype=np.float32)[:, None]
+        arr = np.empty((height, width, 3), dtype=np.uint8)
+        for channel, plane in enumerate((x + 0 * y, y + 0 * x, (x + y) / 2)):
+            noise = rng.normal(0, 12, size=(height, width)).astype(np.float32)
+            arr[..., channel] = np.clip(plane + noise, 0, 255)
+        image = Image.fromarray(arr, "RGB")
+        exif = image.getexif()
+        exif[0x0112] = 6  # Rotated 90 degrees, exercises exif_transpose.
+        image.save(out_dir / f"synthetic_{width}x{height}.jpg", quality=92, exif=exif)
+    return out_dir
+
+
+def measure(image_dir: Path, draft: bool, thumb_size: int, repeat: int) -> dict:
+    cmd = [
+        sys.executable, __file__, "--child", str(image_dir),
+        "--thumb_size", str(thumb_size), "--repeat", str(repeat),
+    ]
+    if draft:
+        cmd.append("--draft")
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="passes over each image set")
+    parser.add_argument("--thumb_size", type=int, default=256)
+    parser.add_argument("--child", type=Path, help=argparse.SUPPRESS)
+    parser.add_argument("--draft", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.draft, args.thumb_size, args.repeat)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        image_sets = {
+            "img/test_src": REPO_ROOT / "img" / "test_src",
+            "synthetic": make_synthetic(Path(tmp)),
+        }
+        print(f"{'set':<14}{'mode':<8}{'images':>7}{'seconds':>10}{'ms/img':>9}{'peak RSS MB':>13}")
+        for name, image_dir in image_sets.items():
+            for draft in (False, True):
+                r = measure(image_dir, draft, args.thumb_size, args.repeat)
+                rss = f"{r['peak_rss_kb'] / 1024:.1f}" if r["peak_rss_kb"] else "n/a"
+                print(
+                    f"{name:<14}{'draft' if draft else 'full':<8}{r['images']:>7}"
+                    f"{r['seconds']:>10.2f}{1000 * r['seconds'] / r['images']:>9.1f}{rss:>13}"
+                )
+
+
+if __name__ == "__main__":
+    main()
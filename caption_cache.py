@@ -0,0 +1,137 @@
+"""Persistent, content-addressed cache of BLIP-2 captions and tags.
+
+Captions are keyed by a hash of the image bytes, so renaming or moving a file
+never triggers a re-caption and two different files that happen to share a
+name never collide.  Hashing every file on every run would still be slow on
+large libraries, so the last seen ``size``/``mtime``/``inode`` of each path is
+remembered as well and the hash is only recomputed when those change.
+
+The cache is a single SQLite database that normally lives beside
+``data.json``.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+HASH_CHUNK_SIZE = 1 << 20
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS captions (
+    hash TEXT PRIMARY KEY,
+    caption TEXT NOT NULL,
+    tags TEXT NOT NULL
+);
+"""
+
+
+def default_cache_path(data_file: Path) -> Path:
+    """Return the cache location used for ``data_file``."""
+    return data_file.with_name(data_file.stem + ".cache.sqlite")
+
+
+def hash_file(path: Path) -> str:
+    """Return a hex digest of the contents of ``path``."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CaptionCache:
+    """SQLite backed mapping of image content hash to ``(caption, tags)``."""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path))
+        self._conn.executescript(_SCHEMA)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _stat_key(path: Path) -> Tuple[str, os.stat_result]:
+        return str(path.resolve()), path.stat()
+
+    def changed_since_cached(self, path: Path) -> bool:
+        """Return True if ``path`` was seen before and has since been modified.
+
+        Paths that have never been recorded are reported as unchanged so that
+        callers fall back to their own notion of what already exists.
+        """
+        key, st = self._stat_key(path)
+        row = self._conn.execute(
+            "SELECT size, mtime_ns, inode FROM files WHERE path = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return False
+        return row != (st.st_size, st.st_mtime_ns, st.st_ino)
+
+    def file_key(self, path: Path) -> str:
+        """Return the content hash for ``path``, rehashing only if it changed."""
+        key, st = self._stat_key(path)
+        row = self._conn.execute(
+            "SELECT size, mtime_ns, inode, hash FROM files WHERE path = ?", (key,)
+        ).fetchone()
+        if row is not None and row[:3] == (st.st_size, st.st_mtime_ns, st.st_ino):
+            return row[3]
+        content_hash = hash_file(path)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, hash) VALUES (?, ?, ?, ?, ?)",
+            (key, st.st_size, st.st_mtime_ns, st.st_ino, content_hash),
+        )
+        return content_hash
+
+    def get(self, content_hash: str) -> Optional[Tuple[str, List[str]]]:
+        """Return the cached ``(caption, tags)`` for ``content_hash`` if any."""
+        row = self._conn.execute(
+            "SELECT caption, tags FROM captions WHERE hash = ?", (content_hash,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0], json.loads(row[1])
+
+    def put(self, content_hash: str, caption: str, tags: List[str]) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO captions (hash, caption, tags) VALUES (?, ?, ?)",
+            (content_hash, caption, json.dumps(tags)),
+        )
+
+    def iter_captions(self) -> Iterator[Tuple[str, str]]:
+        """Yield ``(hash, caption)`` for every cached caption."""
+        yield from self._conn.execute("SELECT hash, caption FROM captions").fetchall()
+
+    def update_tags(self, items: Iterable[Tuple[str, List[str]]]) -> None:
+        """Replace the stored tags for each ``(hash, tags)`` pair."""
+        self._conn.executemany(
+            "UPDATE captions SET tags = ? WHERE hash = ?",
+            ((json.dumps(tags), content_hash) for content_hash, tags in items),
+        )
+
+    def commit(self) -> None:
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.commit()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
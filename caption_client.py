@@ -0,0 +1,100 @@
+"""Client for ``caption_server.py``, the resident captioning daemon.
+
+Loading BLIP-2 takes far longer than captioning a handful of photos, so a
+daemon can keep the models loaded and caption on behalf of short-lived
+``offline_tags.py``/``run_pipeline.py`` runs.  Both check for one at
+:data:`DEFAULT_URL` and only load the models themselves when none answers.
+
+The API is JSON over HTTP on the loopback interface:
+
+``GET /health``
+    ``{"status": "ok", "models_loaded": bool, "queued": n, "jobs": n}``.
+``POST /caption`` ``{"paths": [...]}``
+    ``{"results": [{"caption", "tags", "error"}, ...]}`` in request order.
+    Paths are read by the daemon, so they must be absolute.
+``POST /tags`` ``{"captions": [...], "batch_size": n}``
+    ``{"tags": [[...], ...]}``, for re-deriving tags from cached captions.
+
+This module only needs the standard library, so importing it is cheap.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional, Sequence
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_URL = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+# Images per /caption request; small enough for steady progress reporting.
+JOB_SIZE = 16
+HEALTH_TIMEOUT = 0.5
+
+
+class CaptionResult(NamedTuple):
+    path: Path
+    caption: Optional[str]
+    tags: Optional[List[str]]
+    error: Optional[str]
+
+
+class CaptionServerError(RuntimeError):
+    """The caption server could not be reached or failed a request."""
+
+
+class CaptionClient:
+    """Submits captioning jobs to a running ``caption_server.py``."""
+
+    def __init__(self, url: str = DEFAULT_URL, timeout: Optional[float] = None):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.caption_seconds = 0.0
+        # Decoding happens in the daemon; kept for parity with LocalCaptioner.
+        self.starved_seconds = 0.0
+
+    @classmethod
+    def connect(cls, url: str = DEFAULT_URL) -> Optional["CaptionClient"]:
+        """Return a client if a server answers at ``url``, otherwise None."""
+        client = cls(url)
+        try:
+            client.health(HEALTH_TIMEOUT)
+        except CaptionServerError:
+            return None
+        return client
+
+    def _request(self, path: str, body: Optional[dict] = None, timeout: Optional[float] = None) -> dict:
+        data = None if body is None else json.dumps(body).encode("utf-8")
+        request = urllib.request.Request(
+            self.url + path, data=data, headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=timeout if timeout is not None else self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise CaptionServerError(f"{self.url}{path}: HTTP {e.code} {e.read().decode('utf-8', 'replace')}") from e
+        except (OSError, ValueError) as e:
+            raise CaptionServerError(f"{self.url}{path}: {e}") from e
+
+    def health(self, timeout: Optional[float] = None) -> dict:
+        return self._request("/health", timeout=timeout)
+
+    def caption(self, paths: Sequence[Path]) -> Iterator[CaptionResult]:
+        """Yield a :class:`CaptionResult` per path, in order, a job at a time."""
+        for start in range(0, len(paths), JOB_SIZE):
+            job = list(paths[start:start + JOB_SIZE])
+            started = time.perf_counter()
+            response = self._request("/caption", {"paths": [str(Path(p).resolve()) for p in job]})
+            self.caption_seconds += time.perf_counter() - started
+            results = response.get("results", [])
+            if len(results) != len(job):
+                raise CaptionServerError(f"{self.url}/caption: expected {len(job)} results, got {len(results)}")
+            for img_path, result in zip(job, results):
+                yield CaptionResult(img_path, result.get("caption"), result.get("tags"), result.get("error"))
+
+    def tags(self, captions: List[str], batch_size: int = 256) -> List[List[str]]:
+        """Return the tag list the server derives from each caption."""
+        return self._request("/tags", {"captions": captions, "batch_size": batch_size})["tags"]
@@ -0,0 +1,190 @@
+"""Resident captioning daemon for the pipeline.
+
+Keeps the BLIP-2 processor and model and the spaCy pipeline loaded and
+captions images for ``offline_tags.py`` and ``run_pipeline.py``, which use it
+automatically while it runs (see :mod:`caption_client` for the API)::
+
+    python caption_server.py [--port 8765] [--batch-size N]
+
+HTTP requests are handled on their own threads, but every job goes through
+one queue and is run by a single worker thread that owns the models, so jobs
+from several clients are captioned one after another, in arrival order.
+The server only listens on the loopback interface.
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.server
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Callable, Optional
+
+from caption_client import DEFAULT_HOST, DEFAULT_PORT
+from offline_tags import CaptioningResources, LocalCaptioner
+
+MAX_REQUEST_BYTES = 64 * 1024 * 1024
+
+
+class CaptionServer(http.server.ThreadingHTTPServer):
+    """HTTP front end plus the job queue and the worker that drains it."""
+
+    daemon_threads = True
+
+    def __init__(self, address, captioner, models_loaded: Callable[[], bool] = lambda: True):
+        super().__init__(address, CaptionRequestHandler)
+        self.captioner = captioner
+        self.models_loaded = models_loaded
+        self.jobs: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self.jobs_done = 0
+        self._worker = threading.Thread(target=self._run_jobs, name="caption-worker", daemon=True)
+        self._worker.start()
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Queue ``fn(*args)`` for the worker thread."""
+        future: Future = Future()
+        self.jobs.put((future, fn, args))
+        return future
+
+    def _run_jobs(self) -> None:
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            future, fn, args = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+            self.jobs_done += 1
+
+    def caption_job(self, paths) -> list:
+        started = time.perf_counter()
+        results = [
+            {"caption": r.caption, "tags": r.tags, "error": r.error}
+            for r in self.captioner.caption([Path(p) for p in paths])
+        ]
+        print(
+            f"Captioned {len(results)} image(s) in {time.perf_counter() - started:.2f}s "
+            f"({self.jobs.qsize()} job(s) queued)"
+        )
+        return results
+
+    def status(self) -> dict:
+        return {
+            "status": "ok",
+            "models_loaded": self.models_loaded(),
+            "queued": self.jobs.qsize(),
+            "jobs": self.jobs_done,
+        }
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.jobs.put(None)
+        self._worker.join()
+
+
+class CaptionRequestHandler(http.server.BaseHTTPRequestHandler):
+    server: CaptionServer
+
+    def _send_json(self, status: int, body) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, self.server.status())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if not 0 < length <= MAX_REQUEST_BYTES:
+                raise ValueError("missing or oversized body")
+            body = json.loads(self.rfile.read(length))
+            if not isinstance(body, dict):
+                raise ValueError("body must be a JSON object")
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        if self.path == "/caption":
+            paths = body.get("paths")
+            if not isinstance(paths, list) or not all(isinstance(p, str) for p in paths):
+                self._send_json(400, {"error": "paths must be a list of strings"})
+                return
+            future = self.server.submit(self.server.caption_job, paths)
+            key = "results"
+        elif self.path == "/tags":
+            captions = body.get("captions")
+            if not isinstance(captions, list) or not all(isinstance(c, str) for c in captions):
+                self._send_json(400, {"error": "captions must be a list of strings"})
+                return
+            batch_size = body.get("batch_size", 256)
+            if not isinstance(batch_size, int) or batch_size < 1:
+                self._send_json(400, {"error": "batch_size must be a positive integer"})
+                return
+            future = self.server.submit(self.server.captioner.tags, captions, batch_size)
+            key = "tags"
+        else:
+            self._send_json(404, {"error": "not found"})
+            return
+
+        try:
+            result = future.result()
+        except Exception as e:
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self._send_json(200, {key: result})
+
+
+def make_caption_server(
+    port: int = DEFAULT_PORT,
+    resources: Optional[CaptioningResources] = None,
+    batch_size: int = 1,
+    loader_workers: int = 2,
+    prefetch: int = 8,
+) -> CaptionServer:
+    """Create (but do not start) a caption server around ``resources``."""
+    if resources is None:
+        resources = CaptioningResources(server_url=None)
+    captioner = LocalCaptioner(resources, batch_size, loader_workers, prefetch)
+    return CaptionServer((DEFAULT_HOST, port), captioner, lambda: resources.loaded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep the captioning models loaded and caption images for the pipeline.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"port to listen on (default {DEFAULT_PORT})")
+    parser.add_argument("--batch-size", type=int, default=1, help="images captioned per model forward pass (default 1)")
+    parser.add_argument("--loader-workers", type=int, default=2, help="threads that decode images ahead of the model (default 2)")
+    parser.add_argument("--prefetch", type=int, default=8, help="maximum images decoded ahead of the model (default 8)")
+    args = parser.parse_args()
+    if args.batch_size < 1 or args.loader_workers < 1 or args.prefetch < 1:
+        parser.error("--batch-size, --loader-workers and --prefetch must be at least 1")
+
+    resources = CaptioningResources(server_url=None)
+    started = time.perf_counter()
+    resources.captioner
+    resources.nlp
+    print(f"Loaded captioning models in {time.perf_counter() - started:.1f}s")
+    with make_caption_server(args.port, resources, args.batch_size, args.loader_workers, args.prefetch) as server:
+        print(f"Caption server listening on http://{DEFAULT_HOST}:{server.server_address[1]}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\nCaption server stopped.")
+
+
+if __name__ == "__main__":
+    main()
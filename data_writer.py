@@ -0,0 +1,198 @@
+"""Write ``data.json`` atomically, one entry at a time.
+
+Entries are serialised as they are produced into a temporary file beside the
+target, which is flushed to disk and then renamed over it, so a reader (the
+browser, ``serve.py``'s reloader) only ever sees a complete file and a crash
+leaves the previous one in place.  Tag counts are accumulated along the way
+and written after the entries, giving the usual
+``{"questions": [...], "tag_counts": {...}}`` layout.
+
+``append_data_file`` adds entries to an existing file without re-serialising
+it: the old bytes up to the end of the ``questions`` array are copied as they
+are, and only the new entries and the updated counts are written after them.
+``write_encoded_data_file`` is the compaction path for ``entry_store``, which
+already holds every entry serialised and the tag counts up to date.
+"""
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, NamedTuple, Optional
+
+COPY_CHUNK = 1024 * 1024
+_WHITESPACE = b" \t\r\n"
+
+
+class WriteResult(NamedTuple):
+    entries: int
+    tag_counts: Dict[str, int]
+
+
+@contextmanager
+def atomic_open(path: Path) -> Iterator[BinaryIO]:
+    """Open a temporary file that replaces ``path`` once the block succeeds."""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    f = open(tmp_path, "wb")
+    try:
+        yield f
+        f.flush()
+        os.fsync(f.fileno())
+    except BaseException:
+        f.close()
+        tmp_path.unlink(missing_ok=True)
+        raise
+    f.close()
+    os.replace(tmp_path, path)
+    _fsync_dir(path.parent)
+
+
+def _fsync_dir(directory: Path) -> None:
+    # Makes the rename itself durable.  Directories cannot be opened on
+    # Windows, where the rename is as durable as it gets anyway.
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _encode(value, indent: Optional[int], depth: int) -> bytes:
+    """Serialise ``value`` as if it sat ``depth`` levels deep in the document."""
+    if indent is None:
+        return json.dumps(value, separators=(",", ":")).encode("utf-8")
+    return json.dumps(value, indent=indent).replace("\n", "\n" + " " * (indent * depth)).encode("utf-8")
+
+
+def _count_tags(entry: dict, tag_counts: Dict[str, int]) -> None:
+    for tag in entry.get("question", {}).get("content", {}):
+        tag_counts[tag] = tag_counts.get(tag, 0) + 1
+
+
+def _write_entries(f: BinaryIO, entries: Iterable[dict], indent: Optional[int], first: bool, tag_counts: Dict[str, int]) -> int:
+    """Write ``entries`` as array items; ``first`` if the array is empty so far."""
+    lead = b"" if indent is None else b"\n" + b" " * (2 * indent)
+    count = 0
+    for entry in entries:
+        if not first:
+            f.write(b",")
+        first = False
+        f.write(lead + _encode(entry, indent, 2))
+        _count_tags(entry, tag_counts)
+        count += 1
+    return count
+
+
+def _write_tail(f: BinaryIO, indent: Optional[int], empty: bool, tag_counts: Dict[str, int]) -> None:
+    if indent is None:
+        f.write(b'],"tag_counts":' + _encode(tag_counts, None, 1) + b"}")
+        return
+    pad = b" " * indent
+    f.write((b"]" if empty else b"\n" + pad + b"]") + b",\n" + pad + b'"tag_counts": ' + _encode(tag_counts, indent, 1) + b"\n}")
+
+
+def write_data_file(path: Path, entries: Iterable[dict], indent: Optional[int] = None) -> WriteResult:
+    """Atomically write ``entries`` (any iterable) and their tag counts to ``path``.
+
+    ``indent`` pretty-prints like ``json.dump(..., indent=indent)``; the
+    default is compact.
+    """
+    tag_counts: Dict[str, int] = {}
+    with atomic_open(path) as f:
+        if indent is None:
+            f.write(b'{"questions":[')
+        else:
+            f.write(b"{\n" + b" " * indent + b'"questions": [')
+        count = _write_entries(f, entries, indent, True, tag_counts)
+        _write_tail(f, indent, count == 0, tag_counts)
+    return WriteResult(count, tag_counts)
+
+
+def write_encoded_data_file(path: Path, encoded: Iterable[bytes], tag_counts: Dict[str, int]) -> WriteResult:
+    """Atomically write compact, already serialised entries and known tag counts.
+
+    Produces the same bytes as :func:`write_data_file` with ``indent=None``
+    when ``encoded`` holds each entry's compact JSON, without decoding it.
+    """
+    count = 0
+    with atomic_open(path) as f:
+        f.write(b'{"questions":[')
+        for item in encoded:
+            if count:
+                f.write(b",")
+            f.write(item)
+            count += 1
+        _write_tail(f, None, count == 0, tag_counts)
+    return WriteResult(count, tag_counts)
+
+
+def _questions_end(mm: mmap.mmap) -> Optional[tuple]:
+    """Locate the end of the ``questions`` array in a file this module wrote.
+
+    Returns ``(end, empty, tag_counts)`` where ``end`` is the offset just past
+    the array's last item (or its ``[``), or None if the layout is unexpected.
+    """
+    key = mm.rfind(b'"tag_counts"')
+    if key < 0:
+        return None
+    try:
+        tail = json.loads(b"{" + mm[key:])
+    except ValueError:
+        return None
+    if set(tail) != {"tag_counts"} or not isinstance(tail["tag_counts"], dict):
+        return None
+    pos = key - 1
+    while pos >= 0 and mm[pos] in _WHITESPACE:
+        pos -= 1
+    if pos < 0 or mm[pos] != ord(","):
+        return None
+    pos -= 1
+    while pos >= 0 and mm[pos] in _WHITESPACE:
+        pos -= 1
+    if pos < 0 or mm[pos] != ord("]"):
+        return None
+    pos -= 1
+    while pos >= 0 and mm[pos] in _WHITESPACE:
+        pos -= 1
+    if pos < 0:
+        return None
+    return pos + 1, mm[pos] == ord("["), tail["tag_counts"]
+
+
+def append_data_file(path: Path, entries: Iterable[dict], indent: Optional[int] = None) -> Optional[WriteResult]:
+    """Atomically append ``entries`` to the ``questions`` of an existing file.
+
+    Returns the number of entries appended and the updated tag counts, or None (leaving the file untouched) if
+    ``path`` is missing or not laid out as :func:`write_data_file` writes it;
+    callers then fall back to a full rewrite.
+    """
+    try:
+        with open(path, "rb") as src, mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            found = _questions_end(mm)
+    except (OSError, ValueError):  # missing or empty
+        return None
+    if found is None:
+        return None
+    end, empty, tag_counts = found
+    # The source is closed again before the rename, which Windows requires.
+    with atomic_open(path) as f:
+        with open(path, "rb") as src:
+            remaining = end
+            while remaining:
+                chunk = src.read(min(COPY_CHUNK, remaining))
+                if not chunk:
+                    raise OSError(f"{path} shrank while being appended to")
+                f.write(chunk)
+                remaining -= len(chunk)
+        count = _write_entries(f, entries, indent, empty, tag_counts)
+        _write_tail(f, indent, empty and count == 0, tag_counts)
+    return WriteResult(count, tag_counts)
@@ -0,0 +1,393 @@
+"""Indexed store of ``data.json`` entries, keyed by a stable image id.
+
+``data.json`` is one big JSON document, so changing a handful of entries used
+to mean parsing the whole file, filtering or extending the list and writing
+it all back.  The pipeline now keeps its entries in a SQLite database beside
+``data.json`` instead: one row per image, keyed by its thumbnail filename
+(which encodes the source folder and name), holding the entry's compact JSON.
+``tag_counts`` lives in its own table and is adjusted as rows come and go.
+
+Adding, replacing or deleting images touches only their rows.  ``data.json``
+and the payloads derived from it are then produced from the store:
+
+* when the only change is new images, they are appended to ``data.json``
+  (see :func:`data_writer.append_data_file`) and to the search payload
+  (which is rewritten instead if it no longer matches the store), and
+  the prebuilt search index, which would need rebuilding in full, is removed
+  until the next compaction (the page builds its own meanwhile);
+* otherwise the file is compacted from the stored rows, which are copied out
+  as they are instead of being decoded and re-encoded, and the search payload
+  and index are rebuilt, streaming the entries from the store.
+
+Writing ``data.json`` can also be deferred (``offline_tags.py --no-compact``)
+and done later, once for many updates, with ``python entry_store.py``, which
+always compacts the file and rebuilds its payloads.
+
+The store remembers the size and mtime of the ``data.json`` it last matched.
+If the file has since been replaced by something else, the store re-imports
+it, unless it holds changes of its own that were never written out.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+from data_writer import WriteResult, append_data_file, write_data_file, write_encoded_data_file
+from lunr_index import default_index_path, write_index
+from precompress import SUFFIXES, precompress_site
+from search_payload import append_search_payload, default_payload_dir, write_search_payload
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    entry TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tag_counts (
+    tag TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def default_store_path(data_file: Path) -> Path:
+    """Return the entry store location used for ``data_file``."""
+    data_file = Path(data_file)
+    return data_file.with_name(data_file.stem + ".entries.sqlite")
+
+
+def entry_id(entry: dict) -> str:
+    """Return the stable id of a ``data.json`` entry: its thumbnail filename."""
+    return entry.get("thumb", {}).get("filename", "")
+
+
+def _encode(entry: dict) -> str:
+    # Must match data_writer's compact encoding, which compaction relies on.
+    return json.dumps(entry, separators=(",", ":"))
+
+
+def _file_key(path: Path) -> Optional[str]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return json.dumps([st.st_size, st.st_mtime_ns])
+
+
+def _tags(entry: dict) -> Iterable[str]:
+    return entry.get("question", {}).get("content", {})
+
+
+class EntryStore:
+    """SQLite backed, ordered mapping of entry id to ``data.json`` entry."""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path))
+        self._conn.executescript(_SCHEMA)
+        self._dirty = self._get_meta("dirty") == "1"
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str) -> None:
+        self._conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value),
+        )
+
+    def _touch(self) -> None:
+        if not self._dirty:
+            self._set_meta("dirty", "1")
+            self._dirty = True
+
+    def _count(self, old: Iterable[str] = (), new: Iterable[str] = ()) -> None:
+        """Adjust ``tag_counts`` for an entry's tags changing from ``old`` to ``new``.
+
+        Only the net change per tag is applied, so a tag an entry keeps keeps
+        its row, and with it its place in ``data.json``'s ``tag_counts``.
+        """
+        deltas: Dict[str, int] = {}
+        for tag in old:
+            deltas[tag] = deltas.get(tag, 0) - 1
+        for tag in new:
+            deltas[tag] = deltas.get(tag, 0) + 1
+        self._conn.executemany(
+            "INSERT INTO tag_counts (tag, count) VALUES (?, ?) "
+            "ON CONFLICT(tag) DO UPDATE SET count = count + excluded.count",
+            ((tag, delta) for tag, delta in deltas.items() if delta),
+        )
+        self._conn.executemany(
+            "DELETE FROM tag_counts WHERE tag = ? AND count <= 0",
+            ((tag,) for tag, delta in deltas.items() if delta < 0),
+        )
+
+    @property
+    def dirty(self) -> bool:
+        """True if the store changed since ``data.json`` was last written from it."""
+        return self._dirty
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def __contains__(self, key: str) -> bool:
+        return self._conn.execute("SELECT 1 FROM entries WHERE id = ?", (key,)).fetchone() is not None
+
+    def ids(self) -> Set[str]:
+        """Return the ids of every stored entry."""
+        return {row[0] for row in self._conn.execute("SELECT id FROM entries")}
+
+    def get(self, key: str) -> Optional[dict]:
+        row = self._conn.execute("SELECT entry FROM entries WHERE id = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, entry: dict) -> bool:
+        """Store ``entry`` last in order, replacing any entry with its id.
+
+        Returns True if an entry was replaced.
+        """
+        key = entry_id(entry)
+        old = self.get(key)
+        if old is not None:
+            self._conn.execute("DELETE FROM entries WHERE id = ?", (key,))
+        self._conn.execute("INSERT INTO entries (id, entry) VALUES (?, ?)", (key, _encode(entry)))
+        self._count(_tags(old) if old is not None else (), _tags(entry))
+        self._touch()
+        return old is not None
+
+    def delete_ids(self, keys: Iterable[str]) -> int:
+        """Remove the entries with the given ids; return how many existed."""
+        removed = 0
+        for key in set(keys):
+            old = self.get(key)
+            if old is None:
+                continue
+            self._count(old=_tags(old))
+            self._conn.execute("DELETE FROM entries WHERE id = ?", (key,))
+            removed += 1
+        if removed:
+            self._touch()
+        return removed
+
+    def clear(self) -> None:
+        self._conn.execute("DELETE FROM entries")
+        self._conn.execute("DELETE FROM tag_counts")
+        self._touch()
+
+    def iter_encoded(self) -> Iterator[bytes]:
+        """Yield each entry's compact JSON, in ``data.json`` order."""
+        for (text,) in self._conn.execute("SELECT entry FROM entries ORDER BY seq"):
+            yield text.encode("utf-8")
+
+    def iter_entries(self) -> Iterator[dict]:
+        """Yield each entry, in ``data.json`` order."""
+        for (text,) in self._conn.execute("SELECT entry FROM entries ORDER BY seq"):
+            yield json.loads(text)
+
+    def tag_counts(self) -> Dict[str, int]:
+        return dict(self._conn.execute("SELECT tag, count FROM tag_counts ORDER BY rowid"))
+
+    def is_synced(self, data_file: Path) -> bool:
+        """True if ``data_file`` is exactly what was last written from the store."""
+        return not self._dirty and _file_key(data_file) == self._get_meta("synced")
+
+    def mark_synced(self, data_file: Path) -> None:
+        """Record that ``data_file`` now matches the store."""
+        self._set_meta("synced", _file_key(data_file) or "")
+        self._set_meta("dirty", "0")
+        self._dirty = False
+
+    @property
+    def payloads_stale(self) -> bool:
+        """True if ``data.json`` was last written without its search payloads."""
+        return self._get_meta("payloads_stale") == "1"
+
+    def mark_payloads_stale(self, stale: bool = True) -> None:
+        """Record whether the search payloads lag behind ``data.json``."""
+        self._set_meta("payloads_stale", "1" if stale else "0")
+
+    def sync_from(self, data_file: Path) -> bool:
+        """Re-import ``data_file`` if it changed since the store last matched it.
+
+        Returns True if the store was reloaded.  A store with changes that
+        were never written out is kept as it is.
+        """
+        key = _file_key(data_file)
+        if key == self._get_meta("synced"):
+            return False
+        if self._dirty:
+            print(
+                f"Warning: {data_file} changed since it was last written, but {self.db_path} "
+                "holds newer changes; keeping the store."
+            )
+            return False
+        entries: List[dict] = []
+        if key is not None:
+            with open(data_file, "r", encoding="utf-8") as f:
+                entries = json.load(f).get("questions", [])
+        # Later duplicates win and take the later position, as with put().
+        by_id: Dict[str, dict] = {}
+        for entry in entries:
+            key_ = entry_id(entry)
+            by_id.pop(key_, None)
+            by_id[key_] = entry
+        counts: Dict[str, int] = {}
+        for entry in by_id.values():
+            for tag in _tags(entry):
+                counts[tag] = counts.get(tag, 0) + 1
+        self._conn.execute("DELETE FROM entries")
+        self._conn.execute("DELETE FROM tag_counts")
+        self._conn.executemany(
+            "INSERT INTO entries (id, entry) VALUES (?, ?)",
+            ((k, _encode(e)) for k, e in by_id.items()),
+        )
+        self._conn.executemany("INSERT INTO tag_counts (tag, count) VALUES (?, ?)", counts.items())
+        self.mark_synced(data_file)
+        self._conn.commit()
+        print(f"Imported {len(by_id)} entr{'y' if len(by_id) == 1 else 'ies'} from {data_file} into {self.db_path}")
+        return True
+
+    def commit(self) -> None:
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.commit()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_payload(store: EntryStore, data_file: Path) -> None:
+    """Write the sharded search payload and prebuilt index for ``store``'s entries."""
+    payload_dir = default_payload_dir(data_file)
+    result = write_search_payload(payload_dir, store.iter_entries())
+    print(
+        f"Wrote search payload for {result.count} image(s) to {payload_dir}: "
+        f"{len(result.shards)} shard(s), {result.bytes_written / 1024:.1f} KB"
+    )
+    index_path = default_index_path(data_file)
+    started = time.perf_counter()
+    size = write_index(index_path, store.iter_entries(), store.tag_counts(), data_file)
+    print(f"Wrote search index {index_path} ({size / 1024:.1f} KB) in {time.perf_counter() - started:.2f}s")
+    store.mark_payloads_stale(False)
+    store.commit()
+
+
+def refresh_payloads(data_file: Path) -> None:
+    """Rebuild the payloads of a ``data_file`` written with ``payloads=False`` and precompress the site."""
+    data_file = Path(data_file)
+    with EntryStore(default_store_path(data_file)) as store:
+        write_payload(store, data_file)
+    precompress_site(data_file.parent, data_file)
+
+
+def _append_payload(store: EntryStore, data_file: Path, appended: List[dict]) -> None:
+    payload_dir = default_payload_dir(data_file)
+    result = append_search_payload(payload_dir, appended, len(store) - len(appended))
+    if result is None:
+        result = write_search_payload(payload_dir, store.iter_entries())
+    print(f"Updated search payload in {payload_dir}: {result.count} image(s), {result.bytes_written / 1024:.1f} KB written")
+    # Every document's tag links quote the tag counts, so the index cannot
+    # simply be extended.  The page indexes data.json itself until the next
+    # compaction writes a new one.
+    index_path = default_index_path(data_file)
+    if index_path.exists():
+        for path in [index_path] + [index_path.with_name(index_path.name + suffix) for suffix in SUFFIXES.values()]:
+            path.unlink(missing_ok=True)
+        print(f"Removed {index_path}, which no longer matches {data_file}")
+
+
+def write_site_data(
+    store: EntryStore,
+    data_file: Path,
+    indent: Optional[int] = None,
+    appended: Optional[List[dict]] = None,
+    payloads: Optional[bool] = None,
+) -> WriteResult:
+    """Bring ``data_file`` and its derived payloads up to date with ``store``.
+
+    ``appended`` names entries just added to a store that matched
+    ``data_file`` beforehand; they are appended to the file when its layout
+    allows, and the whole file is compacted from the store otherwise.
+
+    ``payloads`` controls the search payload and index: by default they are
+    rebuilt when the file is compacted and extended when it is appended to.
+    True rebuilds them regardless; False leaves them alone, for callers that
+    rebuild them later with :func:`write_payload`, and marks them stale in
+    the store so that the next default write rebuilds them if that never
+    happens.
+    """
+    written = None
+    if appended is not None:
+        written = append_data_file(data_file, appended, indent)
+        if written is not None:
+            print(f"Appended {written.entries} entr{'y' if written.entries == 1 else 'ies'} to {data_file}")
+    compacted = written is None
+    if compacted:
+        started = time.perf_counter()
+        if indent is None:
+            written = write_encoded_data_file(data_file, store.iter_encoded(), store.tag_counts())
+        else:
+            written = write_data_file(data_file, store.iter_entries(), indent)
+        print(f"Wrote {written.entries} entr{'y' if written.entries == 1 else 'ies'} to {data_file} in {time.perf_counter() - started:.2f}s")
+    if payloads is False:
+        # Recorded with the sync, so a run that dies before the payloads are
+        # rebuilt leaves the next write to rebuild them instead of appending.
+        store.mark_payloads_stale()
+    store.mark_synced(data_file)
+    store.commit()
+    if payloads or (payloads is None and (compacted or store.payloads_stale)):
+        write_payload(store, data_file)
+    elif payloads is None:
+        _append_payload(store, data_file, appended)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Write data.json and its search payloads from the entry store."
+    )
+    parser.add_argument(
+        "--data_file",
+        type=Path,
+        default=Path(__file__).resolve().parent / "data.json",
+        help="Path to data.json. Defaults to script_dir/data.json.",
+    )
+    parser.add_argument(
+        "--store",
+        type=Path,
+        help="Entry store database. Defaults to data.entries.sqlite beside the data file.",
+    )
+    parser.add_argument(
+        "--indent",
+        type=int,
+        metavar="N",
+        help="Pretty-print data.json with N-space indentation. Defaults to compact output.",
+    )
+    args = parser.parse_args()
+
+    with EntryStore(args.store if args.store else default_store_path(args.data_file)) as store:
+        store.sync_from(args.data_file)
+        write_site_data(store, args.data_file, args.indent, payloads=True)
+    precompress_site(args.data_file.parent, args.data_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,14 +13,20 @@ also provided for ad-hoc use.
 from __future__ import annotations
 
 import argparse
+import glob
+import json
+import math
+import multiprocessing
+import os
 import shutil
 import sys
+import time
 from io import BytesIO
 from pathlib import Path
+from typing import BinaryIO, List, NamedTuple, Optional, Tuple, Union
 
 import numpy as np
 from PIL import Image, ImageFile
-from skimage.metrics import structural_similarity as ssim
 
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
@@ -49,6 +55,17 @@ def load_image_luma(path: Path | BytesIO) -> np.ndarray:
     return arr
 
 
+def ssim(*args, **kwargs) -> float:
+    """Proxy for scikit-image's SSIM, imported on first use.
+
+    scikit-image is slow to import and only the SSIM based metrics need it, so
+    smallfry/MPE runs (as used by ``make_thumbs -Z``) never load it.
+    """
+    from skimage.metrics import structural_similarity
+
+    return structural_similarity(*args, **kwargs)
+
+
 def compute_ssim(orig: np.ndarray, comp: np.ndarray) -> float:
     """Standard single scale SSIM."""
 
@@ -90,7 +107,10 @@ def _smallfry_psnr_factor(orig: np.ndarray, cmp: np.ndarray, maxv: int) -> float
     return max(min(ret, 1.0), 0.0)
 
 
-def _smallfry_aae_factor(orig: np.ndarray, cmp: np.ndarray, maxv: int) -> float:
+def _smallfry_aae_factor_reference(orig: np.ndarray, cmp: np.ndarray, maxv: int) -> float:
+    """Straight port of jpeg-archive's loop, kept as the reference for
+    :func:`_smallfry_aae_factor`.  Raises ``IndexError`` for widths of the form
+    ``8k + 1`` where the last column comparison runs off the row."""
     old = orig.astype(np.int16)
     new = cmp.astype(np.int16)
     height, width = old.shape
@@ -135,6 +155,39 @@ def _smallfry_aae_factor(orig: np.ndarray, cmp: np.ndarray, maxv: int) -> float:
     return ret * cf
 
 
+def _aae_edge_scores(before, at, after, after2) -> np.ndarray:
+    # Inputs are absolute pixel differences on either side of block edges.
+    calc = np.abs(at - after) / ((np.abs(before - at) + np.abs(after - after2) + 0.0001) / 2.0)
+    return np.where(calc > 5.0, 1.0, np.where(calc > 2.0, (calc - 2.0) / (5.0 - 2.0), 0.0))
+
+
+def _smallfry_aae_factor(orig: np.ndarray, cmp: np.ndarray, maxv: int) -> float:
+    """Vectorised blocking-artifact factor.
+
+    Produces bit-identical results to :func:`_smallfry_aae_factor_reference`:
+    the per-edge scores are computed with the same float64 operations and
+    summed sequentially (``cumsum``) in the reference's loop order.
+    """
+    diff = np.abs(orig.astype(np.int16) - cmp.astype(np.int16))
+    height, width = diff.shape
+    cols = np.arange(7, width - 2, 8)
+    rows = np.arange(7, height - 2, 8)
+    scores = np.concatenate([
+        _aae_edge_scores(diff[:, cols - 1], diff[:, cols], diff[:, cols + 1], diff[:, cols + 2]).ravel(),
+        _aae_edge_scores(diff[rows - 1], diff[rows], diff[rows + 1], diff[rows + 2]).ravel(),
+    ])
+    cnt = scores.size
+    sumv = float(np.cumsum(scores)[-1]) if cnt else 0.0
+
+    ret = 1 - (sumv / cnt if cnt else 0)
+    if maxv > 128:
+        cfmax = 0.65
+    else:
+        cfmax = 0.65 + 0.35 * ((128.0 - maxv) / 128.0)
+    cf = max(cfmax, min(1.0, 0.25 + (1000.0 * cnt) / (sumv if sumv != 0 else 1)))
+    return ret * cf
+
+
 def metric_smallfry(a: np.ndarray, b: np.ndarray) -> float:
     a = (a * 255).astype(np.uint8)
     b = (b * 255).astype(np.uint8)
@@ -156,14 +209,133 @@ METRIC_FUNCS = {
     "mpe": compute_mpe,
 }
 
+# ---------------------------------------------------------------------------
+# Quality search
+# ---------------------------------------------------------------------------
+# Each strategy calls ``evaluate(q)`` (memoised by the caller) and returns the
+# lowest quality in ``[jpeg_min, jpeg_max]`` found to reach ``target``, or
+# None if no evaluated quality did.  At most ``max_evals`` qualities are tried.
+# ``start`` is an optional guess at the answer; strategies may ignore it.
+
+
+def _bisect_search(
+    evaluate, jpeg_min: int, jpeg_max: int, target: float, max_evals: int, start: Optional[int] = None
+) -> Optional[int]:
+    """The original bisection, stopping once the range is exhausted."""
+    best_q = None
+    low, high = jpeg_min, jpeg_max
+    for _ in range(max_evals):
+        if low > high:
+            break
+        q = (low + high) // 2
+        if evaluate(q) >= target:
+            best_q = q
+            high = q - 1
+        else:
+            low = q + 1
+    return best_q
+
+
+def _log_quant_scale(q: int) -> float:
+    """Position of ``q`` on libjpeg's quantiser scale (log, increasing with q).
+
+    Metrics rise steeply as quality approaches 100.  They are much closer to
+    linear in the log of the quantisation table scale factor, which makes
+    this the better axis to interpolate on.
+    """
+    scale = 5000 / q if q < 50 else 200 - 2 * q
+    return -math.log(max(scale, 1))
+
+
+def _interpolation_search(
+    evaluate, jpeg_min: int, jpeg_max: int, target: float, max_evals: int, start: Optional[int] = None
+) -> Optional[int]:
+    """Regula falsi (Illinois variant) on the metric curve.
+
+    The answer always lies in ``(lo, hi]``: ``lo`` is the highest quality
+    known to miss the target and ``hi`` the lowest known to reach it (the
+    bounds start one step outside the allowed range).  The answer is
+    bracketed first: the first probe is made at ``start`` (or the middle of
+    the range), then at its neighbour towards the answer when ``start`` was
+    given, which settles a good guess in two encodes, and then at the end of
+    the range on the side the answer lies.  Every later probe is
+    interpolated between the bracketing metrics on the log quantiser scale,
+    and the search stops as soon as the bracket closes.
+
+    Plain regula falsi keeps moving only one bound when the curve bends, so
+    when the same bound moves twice in a row the other one's distance from
+    the target is halved for the next interpolation (the Illinois rule).
+    """
+    lo, hi = jpeg_min - 1, jpeg_max + 1
+    # Signed distances of the bounds' metrics from the target.
+    f_lo = f_hi = 0.0
+    moved = None
+    for i in range(max_evals):
+        if hi - lo <= 1:
+            break
+        if lo >= jpeg_min and hi <= jpeg_max:
+            x_lo, x_hi = _log_quant_scale(lo), _log_quant_scale(hi)
+            x = x_lo - f_lo * (x_hi - x_lo) / (f_hi - f_lo)
+            q = next((k for k in range(lo + 1, hi) if _log_quant_scale(k) >= x), hi - 1)
+        elif i == 0:
+            q = start if start is not None else (lo + hi) // 2
+        elif i == 1 and start is not None:
+            # The hint's neighbour on the side of the answer.
+            q = hi - 1 if hi <= jpeg_max else lo + 1
+        else:
+            q = jpeg_max if hi > jpeg_max else jpeg_min
+        q = min(max(q, lo + 1), hi - 1)
+
+        f = evaluate(q) - target
+        if f >= 0:
+            if moved == "hi":
+                f_lo /= 2
+            hi, f_hi, moved = q, f, "hi"
+        else:
+            if moved == "lo":
+                f_hi /= 2
+            lo, f_lo, moved = q, f, "lo"
+    return hi if hi <= jpeg_max else None
+
+
+SEARCH_STRATEGIES = {
+    "bisect": _bisect_search,
+    "interpolate": _interpolation_search,
+}
+
+
 # ---------------------------------------------------------------------------
 # Recompression logic
 # ---------------------------------------------------------------------------
 
 
-def recompress(
-    infile: Path,
-    outfile: Path,
+class RecompressResult(NamedTuple):
+    """Outcome of :func:`recompress_image`."""
+
+    data: bytes
+    quality: Optional[int]  # None when the original bytes were kept
+    metric: Optional[float]
+    copied: bool  # True if ``data`` is the untouched original
+    encodes: int = 0  # JPEG encodes performed, including the final one
+
+
+def default_target(method: str, preset: str = "medium") -> float:
+    """Return the target metric value used when none is given explicitly."""
+    if method == "smallfry":
+        return PRESETS_SMALLFRY.get(preset, PRESETS_SMALLFRY["medium"])
+    if method == "ssim":
+        return 0.9999
+    if method == "ms-ssim":
+        return 0.94
+    return 0.0  # mpe
+
+
+def _luma(im: Image.Image) -> np.ndarray:
+    return np.asarray(im.convert("L"), dtype=np.float32) / 255.0
+
+
+def recompress_image(
+    source: Union[Image.Image, bytes, BinaryIO],
     *,
     target: float = 0.0,
     jpeg_min: int = 40,
@@ -177,75 +349,169 @@ def recompress(
     keep_metadata: bool = True,
     copy_allowed: bool = True,
     quiet: bool = False,
-) -> int:
-    """Recompress ``infile`` and write the result to ``outfile``.
-
-    Returns ``0`` if the output file is smaller than the input and ``1`` if it is
-    larger (or equal).  This mirrors the behaviour of jpeg-archive.
+    search: str = "interpolate",
+    start: Optional[int] = None,
+    window: Optional[Tuple[int, int]] = None,
+) -> RecompressResult:
+    """Search for the smallest JPEG encoding of ``source`` meeting ``target``.
+
+    ``source`` may be a PIL image or the encoded bytes (or a binary buffer) of
+    an existing file.  It is decoded and converted to luma exactly once;
+    candidate encodes are made in memory.  When encoded input is given it is
+    returned unchanged if no candidate is smaller (and ``copy_allowed``).
+
+    ``search`` picks the quality search strategy (see ``SEARCH_STRATEGIES``);
+    ``loops`` caps the number of candidate encodes it may make and ``start``
+    is an optional guess at the answer to begin from.
+
+    ``window`` is an optional narrower ``(low, high)`` range, usually from
+    :mod:`quality_model`, that is searched first.  If the answer turns out
+    to lie outside it the search continues beyond that edge of the window
+    (each pass capped by ``loops``), so a wrong window costs encodes rather
+    than quality.
+
+    Baseline (non-``progressive``) candidates are encoded without optimised
+    Huffman tables, which only changes their size, not their pixels or
+    metric, and the winner is encoded once more with them.  ``accurate``
+    optimises every candidate instead.  Progressive encodes always use
+    optimised tables, so there the winner is used as it is.
     """
+    original = None
+    if isinstance(source, Image.Image):
+        im = source
+    else:
+        original = source if isinstance(source, (bytes, bytearray)) else source.read()
+        im = Image.open(BytesIO(original))
+        im.load()
 
-    orig_buf = infile.read_bytes()
-    orig_size = len(orig_buf)
-    orig_luma = load_image_luma(infile)
+    exif = im.info.get("exif") if keep_metadata else None
+    rgb = im if im.mode == "RGB" else im.convert("RGB")
+    orig_luma = _luma(im)
 
     if target <= 0:
-        if method == "smallfry":
-            target = PRESETS_SMALLFRY.get(preset, PRESETS_SMALLFRY["medium"])
-        elif method == "ssim":
-            target = 0.9999
-        elif method == "ms-ssim":
-            target = 0.94
-        else:  # mpe
-            target = 0.0
+        target = default_target(method, preset)
 
     subsample_val = 0 if str(subsample) == "disable" or subsample == 0 else 2
 
-    best_q = jpeg_max
-    low, high = jpeg_min, jpeg_max
-    final_buf = None
-
-    for i in range(loops):
-        q = (low + high) // 2
+    def encode(q: int, optimize: bool) -> bytes:
         bufio = BytesIO()
         save_args = dict(
             format="JPEG",
             quality=q,
-            optimize=(accurate or (i == loops - 1)),
+            optimize=optimize,
             progressive=progressive,
             subsampling=subsample_val,
         )
-        if keep_metadata:
-            with Image.open(infile) as im:
-                if "exif" in im.info:
-                    save_args["exif"] = im.info["exif"]
-        Image.open(infile).convert("RGB").save(bufio, **save_args)
-        buf = bufio.getvalue()
-        comp_luma = load_image_luma(BytesIO(buf))
-
-        metric = METRIC_FUNCS[method](orig_luma, comp_luma)
-        if not quiet:
-            print(f"Attempt {i + 1}/{loops}: q={q}, {method}={metric:.5f}", file=sys.stderr)
-
-        if metric >= target:
-            best_q = q
-            final_buf = buf
-            high = q - 1
-        else:
-            low = q + 1
-
-    if final_buf is None:
-        final_buf = orig_buf
+        if exif:
+            save_args["exif"] = exif
+        rgb.save(bufio, **save_args)
+        return bufio.getvalue()
+
+    encodes = 0
+    # Search candidates are memoised by quality so no quality is encoded twice.
+    candidates = {}
+    optimize_candidates = accurate or progressive
+
+    def evaluate(q: int) -> float:
+        nonlocal encodes
+        if q not in candidates:
+            buf = encode(q, optimize_candidates)
+            encodes += 1
+            metric = METRIC_FUNCS[method](orig_luma, load_image_luma(BytesIO(buf)))
+            if not quiet:
+                print(f"Attempt {encodes}/{loops}: q={q}, {method}={metric:.5f}", file=sys.stderr)
+            candidates[q] = (buf, metric)
+        return candidates[q][1]
+
+    search_fn = SEARCH_STRATEGIES[search]
+    if window is None:
+        best_q = search_fn(evaluate, jpeg_min, jpeg_max, target, loops, start)
+    else:
+        w_lo, w_hi = max(window[0], jpeg_min), min(window[1], jpeg_max)
+        best_q = search_fn(evaluate, w_lo, w_hi, target, loops, start)
+        if best_q is None and w_hi < jpeg_max:
+            # Nothing in the window reached the target: the answer is above it.
+            best_q = search_fn(evaluate, w_hi + 1, jpeg_max, target, loops, w_hi + 1)
+        elif best_q == w_lo and w_lo > jpeg_min and evaluate(w_lo - 1) >= target:
+            # The bottom of the window passed and so does the next quality
+            # down: the answer is below the window.
+            best_q = search_fn(evaluate, jpeg_min, w_lo - 1, target, loops, w_lo - 1) or w_lo - 1
+
+    if best_q is None:
+        if original is not None:
+            return RecompressResult(original, None, None, copy_allowed, encodes)
+        # No candidate met the target and there is nothing to fall back to,
+        # so keep as much quality as allowed.
         best_q = jpeg_max
+        final_buf = encode(jpeg_max, True)
+        encodes += 1
+        best_metric = None
+    else:
+        final_buf, best_metric = candidates[best_q]
+        if not optimize_candidates:
+            final_buf = encode(best_q, True)
+            encodes += 1
 
-    if len(final_buf) >= orig_size and copy_allowed:
+    if original is not None and len(final_buf) >= len(original) and copy_allowed:
         if not quiet:
             print("Result is larger than original; copying original.", file=sys.stderr)
+        return RecompressResult(original, None, None, True, encodes)
+
+    return RecompressResult(final_buf, best_q, best_metric, False, encodes)
+
+
+def recompress(
+    infile: Path,
+    outfile: Path,
+    *,
+    target: float = 0.0,
+    jpeg_min: int = 40,
+    jpeg_max: int = 95,
+    preset: str = "medium",
+    loops: int = 6,
+    method: str = "ssim",
+    progressive: bool = True,
+    accurate: bool = False,
+    subsample: str | int = "default",
+    keep_metadata: bool = True,
+    copy_allowed: bool = True,
+    quiet: bool = False,
+    search: str = "interpolate",
+) -> int:
+    """Recompress ``infile`` and write the result to ``outfile``.
+
+    Returns ``0`` if the output file is smaller than the input and ``1`` if it is
+    larger (or equal).  This mirrors the behaviour of jpeg-archive.
+    """
+
+    orig_buf = infile.read_bytes()
+    orig_size = len(orig_buf)
+    result = recompress_image(
+        orig_buf,
+        target=target,
+        jpeg_min=jpeg_min,
+        jpeg_max=jpeg_max,
+        preset=preset,
+        loops=loops,
+        method=method,
+        progressive=progressive,
+        accurate=accurate,
+        subsample=subsample,
+        keep_metadata=keep_metadata,
+        copy_allowed=copy_allowed,
+        quiet=quiet,
+        search=search,
+    )
+    if not quiet:
+        print(f"{result.encodes} JPEG encode(s) using {search} search", file=sys.stderr)
+
+    if result.copied:
         shutil.copy2(infile, outfile)
         return 0
 
-    outfile.write_bytes(final_buf)
+    outfile.write_bytes(result.data)
 
-    new_size = len(final_buf)
+    new_size = len(result.data)
     if not quiet:
         saved_kb = (orig_size - new_size) / 1024
         pct = new_size * 100 // orig_size
@@ -257,6 +523,228 @@ def recompress(
     return 0 if new_size < orig_size else 1
 
 
+# ---------------------------------------------------------------------------
+# Batch mode
+# ---------------------------------------------------------------------------
+# Recompresses many files across a process pool, e.g. to re-optimise an
+# existing thumbnail directory.  One JSON object per file is written to the
+# summary; when files are rewritten in place the summary doubles as the record
+# of what is already up to date, so pass the same ``--summary`` file each run.
+
+JPEG_EXTENSIONS = {".jpg", ".jpeg"}
+
+
+def collect_batch_inputs(inputs: List[str], recurse: bool = False) -> List[Tuple[Path, Path]]:
+    """Expand files, directories and glob patterns into ``(path, relative)`` pairs.
+
+    ``relative`` is the file's location below the directory it was found in
+    (just the file name for files and globs) and decides where it goes under
+    an output directory.  An input of ``-`` reads further inputs from stdin,
+    one per line.  Each file is returned once, in the order first seen.
+    """
+    items = []
+    for item in inputs:
+        if item == "-":
+            items.extend(line.strip() for line in sys.stdin if line.strip())
+        else:
+            items.append(item)
+
+    found = []
+    seen = set()
+
+    def add(path: Path, relative: Path) -> None:
+        key = path.resolve()
+        if key not in seen:
+            seen.add(key)
+            found.append((path, relative))
+
+    for item in items:
+        path = Path(item)
+        if path.is_dir():
+            candidates = path.rglob("*") if recurse else path.iterdir()
+            for p in sorted(candidates):
+                if p.suffix.lower() in JPEG_EXTENSIONS and p.is_file():
+                    add(p, p.relative_to(path))
+        elif path.is_file():
+            add(path, Path(path.name))
+        elif any(c in item for c in "*?["):
+            for match in sorted(glob.glob(item, recursive=True)):
+                p = Path(match)
+                if p.suffix.lower() in JPEG_EXTENSIONS and p.is_file():
+                    add(p, Path(p.name))
+        else:
+            print(f"No such file or directory: {item}", file=sys.stderr)
+    return found
+
+
+def read_batch_summary(summary_path: Optional[Path]) -> dict:
+    """Return the records of a previous batch summary keyed by output path."""
+    records = {}
+    if summary_path is None:
+        return records
+    try:
+        with open(summary_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    records[record["output"]] = record
+                except (ValueError, KeyError, TypeError):
+                    continue
+    except OSError:
+        pass
+    return records
+
+
+def _is_up_to_date(src: Path, dst: Path, previous: Optional[dict]) -> bool:
+    try:
+        dst_stat = dst.stat()
+    except OSError:
+        return False
+    if src == dst:
+        # Rewritten in place: up to date if untouched since the last batch.
+        return (
+            previous is not None
+            and previous.get("status") != "error"
+            and previous.get("size") == dst_stat.st_size
+            and previous.get("mtime_ns") == dst_stat.st_mtime_ns
+        )
+    return dst_stat.st_mtime_ns >= src.stat().st_mtime_ns
+
+
+def _batch_task(task) -> dict:
+    """Recompress one file for :func:`batch_recompress` (runs in pool workers)."""
+    src, dst, options = task
+    record = {"path": str(src), "output": str(dst)}
+    started = time.perf_counter()
+    try:
+        original = src.read_bytes()
+        result = recompress_image(original, quiet=True, **options)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        if result.copied:
+            if dst != src:
+                shutil.copy2(src, dst)
+        else:
+            # Write beside the target and rename so a reader (or an
+            # interrupted run) never sees a half-written file.
+            tmp = dst.with_name(dst.name + ".tmp")
+            tmp.write_bytes(result.data)
+            os.replace(tmp, dst)
+        st = dst.stat()
+        record.update(
+            status="kept" if result.copied else "recompressed",
+            quality=result.quality,
+            metric=result.metric,
+            encodes=result.encodes,
+            bytes_in=len(original),
+            bytes_out=len(result.data),
+            bytes_saved=len(original) - len(result.data),
+            size=st.st_size,
+            mtime_ns=st.st_mtime_ns,
+        )
+    except Exception as e:
+        record.update(status="error", error=str(e))
+    record["seconds"] = round(time.perf_counter() - started, 4)
+    return record
+
+
+def batch_recompress(
+    inputs: List[str],
+    *,
+    out_dir: Optional[Path] = None,
+    recurse: bool = False,
+    workers: int = 1,
+    force: bool = False,
+    summary_path: Optional[Path] = None,
+    summary_file=None,
+    quiet: bool = False,
+    **options,
+) -> List[dict]:
+    """Recompress every JPEG named by ``inputs`` and return one record per file.
+
+    ``inputs`` are handled by :func:`collect_batch_inputs`.  Files are
+    rewritten in place unless ``out_dir`` is given.  Files that are already up
+    to date are skipped unless ``force`` is set: with ``out_dir`` that means
+    the output is newer than the source, in place it means the file still
+    matches its record in the previous summary at ``summary_path``.
+
+    Records are written as JSON lines to ``summary_path`` (replacing it once
+    the batch finishes) or else to ``summary_file`` if given.  ``workers`` > 1
+    uses a process pool (``0`` uses every core).  Remaining keyword arguments
+    are passed to :func:`recompress_image`.
+    """
+    files = collect_batch_inputs(inputs, recurse)
+    previous = read_batch_summary(summary_path)
+
+    records = []
+    tasks = []
+    for src, relative in files:
+        dst = Path(out_dir) / relative if out_dir is not None else src
+        if not force and _is_up_to_date(src, dst, previous.get(str(dst))):
+            st = dst.stat()
+            # Quality and metric from the run that produced the file are kept.
+            record = dict(previous.get(str(dst)) or {})
+            record.update(
+                path=str(src), output=str(dst), status="skipped", encodes=0,
+                bytes_in=st.st_size, bytes_out=st.st_size, bytes_saved=0,
+                size=st.st_size, mtime_ns=st.st_mtime_ns, seconds=0.0,
+            )
+            records.append(record)
+        else:
+            tasks.append((src, dst, options))
+
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(tasks)) if tasks else 1
+
+    if summary_path is not None:
+        summary_path = Path(summary_path)
+        summary_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_summary = summary_path.with_name(summary_path.name + ".tmp")
+        out = open(tmp_summary, "w", encoding="utf-8")
+    else:
+        out = summary_file
+
+    def emit(record: dict) -> None:
+        if out is not None:
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+
+    started = time.perf_counter()
+    pool = None
+    try:
+        for record in records:
+            emit(record)
+        if workers > 1:
+            pool = multiprocessing.get_context("spawn").Pool(processes=workers)
+            chunksize = max(1, min(16, len(tasks) // (workers * 4)))
+            results = pool.imap_unordered(_batch_task, tasks, chunksize)
+        else:
+            results = map(_batch_task, tasks)
+        for record in results:
+            if not quiet and record["status"] == "error":
+                print(f"Error recompressing {record['path']}: {record['error']}", file=sys.stderr)
+            records.append(record)
+            emit(record)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if summary_path is not None:
+            out.close()
+            os.replace(tmp_summary, summary_path)
+
+    if not quiet:
+        counts = {s: sum(1 for r in records if r["status"] == s) for s in ("recompressed", "kept", "skipped", "error")}
+        saved_kb = sum(r.get("bytes_saved", 0) for r in records) / 1024
+        print(
+            f"{len(records)} file(s): {counts['recompressed']} recompressed, {counts['kept']} kept, "
+            f"{counts['skipped']} up to date, {counts['error']} failed; saved {saved_kb:.2f} KB "
+            f"in {time.perf_counter() - started:.2f}s",
+            file=sys.stderr,
+        )
+    return records
+
+
 # ---------------------------------------------------------------------------
 # CLI
 # ---------------------------------------------------------------------------
@@ -266,15 +754,21 @@ def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(
         description="Recompress a JPEG keeping visual quality (SSIM/MS-SSIM/Smallfry/MPE)."
     )
-    p.add_argument("infile", help="input JPEG")
-    p.add_argument("outfile", help="output JPEG")
+    p.add_argument("infile", nargs="?", help="input JPEG")
+    p.add_argument("outfile", nargs="?", help="output JPEG")
     p.add_argument("-m", "--method", choices=METHODS, default="ssim", help="quality metric to use")
     grp = p.add_mutually_exclusive_group()
     grp.add_argument("-q", "--quality", choices=PRESETS_SMALLFRY.keys(), help="smallfry quality preset")
     grp.add_argument("-t", "--target", type=float, help="explicit target metric value")
     p.add_argument("-n", "--min", type=int, default=40, dest="qmin", help="minimum JPEG quality")
     p.add_argument("-x", "--max", type=int, default=95, dest="qmax", help="maximum JPEG quality")
-    p.add_argument("-l", "--loops", type=int, default=6, dest="loops", help="binary search iterations")
+    p.add_argument("-l", "--loops", type=int, default=6, dest="loops", help="maximum encodes during the quality search")
+    p.add_argument(
+        "--search",
+        choices=SEARCH_STRATEGIES.keys(),
+        default="interpolate",
+        help="quality search strategy",
+    )
     p.add_argument(
         "-S",
         "--subsample",
@@ -284,10 +778,38 @@ def parse_args() -> argparse.Namespace:
     )
     p.add_argument("-s", "--strip", action="store_true", help="strip all metadata")
     p.add_argument("-p", "--no-progressive", action="store_true", help="disable progressive encoding")
-    p.add_argument("-a", "--accurate", action="store_true", help="favor accuracy over speed")
+    p.add_argument(
+        "-a", "--accurate", action="store_true",
+        help="optimise Huffman tables for every candidate, not just the final encode (slower, same output)",
+    )
     p.add_argument("-c", "--no-copy", action="store_false", dest="copy", help="do not copy if output is larger")
     p.add_argument("-Q", "--quiet", action="store_true", help="quiet mode (errors only)")
-    return p.parse_args()
+
+    batch = p.add_argument_group("batch mode")
+    batch.add_argument(
+        "-B",
+        "--batch",
+        nargs="*",
+        metavar="INPUT",
+        help="recompress JPEG files, directories or glob patterns instead of infile/outfile; "
+        "with no INPUT (or '-') paths are read from stdin",
+    )
+    batch.add_argument("-O", "--out-dir", type=Path, help="write results here instead of in place")
+    batch.add_argument("--recurse", action="store_true", help="recurse into input directories")
+    batch.add_argument("--workers", type=int, default=1, help="worker processes (0 = all cores)")
+    batch.add_argument("--force", action="store_true", help="recompress files that are already up to date")
+    batch.add_argument(
+        "--summary",
+        type=Path,
+        help="write the JSON lines summary here (default: stdout); also used to skip "
+        "files already recompressed in place",
+    )
+    args = p.parse_args()
+    if args.batch is None and (args.infile is None or args.outfile is None):
+        p.error("infile and outfile are required unless --batch is given")
+    if args.batch is not None and args.infile is not None:
+        p.error("infile/outfile cannot be combined with --batch")
+    return args
 
 
 def main() -> None:
@@ -303,6 +825,31 @@ def main() -> None:
     else:
         target = args.target
 
+    if args.batch is not None:
+        records = batch_recompress(
+            args.batch or ["-"],
+            out_dir=args.out_dir,
+            recurse=args.recurse,
+            workers=args.workers,
+            force=args.force,
+            summary_path=args.summary,
+            summary_file=sys.stdout,
+            quiet=args.quiet,
+            target=target,
+            jpeg_min=args.qmin,
+            jpeg_max=args.qmax,
+            preset=args.quality or "medium",
+            loops=args.loops,
+            method=args.method,
+            progressive=not args.no_progressive,
+            accurate=args.accurate,
+            subsample=args.subsample,
+            keep_metadata=not args.strip,
+            copy_allowed=args.copy,
+            search=args.search,
+        )
+        sys.exit(1 if any(r["status"] == "error" for r in records) else 0)
+
     exit_code = recompress(
         infile=Path(args.infile),
         outfile=Path(args.outfile),
@@ -318,6 +865,7 @@ def main() -> None:
         keep_metadata=not args.strip,
         copy_allowed=args.copy,
         quiet=args.quiet,
+        search=args.search,
     )
     sys.exit(exit_code)
 
@@ -0,0 +1,223 @@
+"""Single-pass image library scanner shared by the pipeline stages.
+
+``make_thumbs.py`` and ``offline_tags.py`` both need the same list of source
+images together with their thumbnail names.  Walking a large tree (especially
+on a network share) and resolving every path is a significant part of a run,
+so the tree is walked once with ``os.scandir`` and the result can be saved to
+a manifest that later stages read back instead of rescanning.
+
+The manifest is a JSON lines file: a header object describing the scan, one
+``{"dir", "mtime_ns"}`` object per directory walked, then one object per
+image with ``path``, ``size``, ``mtime_ns`` and ``thumb``.
+
+Adding, removing or renaming a file changes its directory's mtime, so a
+manifest is brought up to date by stat-ing the recorded directories and
+rescanning only those that changed (plus any new subdirectories), instead of
+walking the whole tree again.  A file rewritten in place under the same name
+does not touch its directory; its recorded size and mtime are only refreshed
+when something else changes the directory.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from thumb_utils import generate_thumb_filename, resolved_path_hash, thumb_name_in_dir, thumb_prefix
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+MANIFEST_VERSION = 2
+# A directory modified this close to the start of the scan that recorded it
+# may have changed again within the same mtime tick, so it is rescanned.
+MTIME_SLACK_NS = 2 * 10**9
+
+
+class ScanEntry(NamedTuple):
+    path: Path
+    size: int
+    mtime_ns: int
+    thumb: str
+
+
+class LibraryScan(NamedTuple):
+    entries: List[ScanEntry]
+    # mtime of each directory walked, taken before it was listed; -1 if it
+    # could not be listed.
+    dirs: Dict[str, int]
+    scanned_ns: int  # wall clock time the scan started
+
+
+def default_manifest_path(data_file: Path) -> Path:
+    """Return the manifest location the pipeline uses for ``data_file``."""
+    data_file = Path(data_file)
+    return data_file.with_name(data_file.stem + ".manifest.jsonl")
+
+
+def is_image_name(name: str) -> bool:
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def _scan_directory(directory: Path, entries: List[ScanEntry], dirs: Dict[str, int]) -> List[Path]:
+    """Add the images directly in ``directory`` to ``entries``; return its subdirectories."""
+    prefix = thumb_prefix(directory)
+    dir_hash = resolved_path_hash(str(directory))
+    subdirs = []
+    dirs[str(directory)] = -1
+    try:
+        mtime_ns = os.stat(directory).st_mtime_ns
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(directory / entry.name)
+                    continue
+                if not is_image_name(entry.name) or not entry.is_file():
+                    continue
+                path = directory / entry.name
+                st = entry.stat()
+                if entry.is_symlink():
+                    thumb = generate_thumb_filename(path)
+                else:
+                    thumb = thumb_name_in_dir(prefix, dir_hash, entry.name)
+                entries.append(ScanEntry(path, st.st_size, st.st_mtime_ns, thumb))
+    except OSError as e:
+        print(f"Could not scan {directory}: {e}")
+        return subdirs
+    dirs[str(directory)] = mtime_ns
+    return subdirs
+
+
+def _walk(stack: List[Path], recurse: bool, entries: List[ScanEntry], dirs: Dict[str, int]) -> None:
+    while stack:
+        subdirs = _scan_directory(stack.pop(), entries, dirs)
+        if recurse:
+            stack.extend(subdirs)
+
+
+def scan_tree(root: Path, recurse: bool = False) -> LibraryScan:
+    """Scan ``root`` like :func:`scan_library`, also recording directory mtimes."""
+    started = time.time_ns()
+    entries: List[ScanEntry] = []
+    dirs: Dict[str, int] = {}
+    _walk([Path(root).resolve()], recurse, entries, dirs)
+    entries.sort(key=lambda e: e.path)
+    return LibraryScan(entries, dirs, started)
+
+
+def scan_library(root: Path, recurse: bool = False) -> List[ScanEntry]:
+    """Return every image under ``root`` sorted by path.
+
+    Symlinked directories are not followed, matching ``Path.rglob``.  Each
+    directory is resolved and hashed once; files inside it reuse that work.
+    """
+    return scan_tree(root, recurse).entries
+
+
+def refresh_scan(previous: LibraryScan, recurse: bool) -> Tuple[LibraryScan, int]:
+    """Bring ``previous`` up to date by rescanning the directories that changed.
+
+    Returns the updated scan and the number of directories rescanned or
+    dropped; when that is 0, ``previous`` is returned as it is.
+    """
+    started = time.time_ns()
+    changed = set()
+    gone = set()
+    for directory, mtime_ns in previous.dirs.items():
+        try:
+            current = os.stat(directory).st_mtime_ns
+        except OSError:
+            gone.add(directory)
+            continue
+        if current != mtime_ns or mtime_ns >= previous.scanned_ns - MTIME_SLACK_NS:
+            changed.add(directory)
+    if not changed and not gone:
+        return previous, 0
+
+    stale = changed | gone
+    entries = [e for e in previous.entries if str(e.path.parent) not in stale]
+    dirs = {d: m for d, m in previous.dirs.items() if d not in stale}
+    new_dirs: List[Path] = []
+    for directory in sorted(changed):
+        for subdir in _scan_directory(Path(directory), entries, dirs):
+            if recurse and str(subdir) not in previous.dirs:
+                new_dirs.append(subdir)
+    _walk(new_dirs, recurse, entries, dirs)
+    entries.sort(key=lambda e: e.path)
+    return LibraryScan(entries, dirs, started), len(stale)
+
+
+def write_manifest(manifest_path: Path, root: Path, recurse: bool, scan: LibraryScan) -> None:
+    """Write ``scan`` to ``manifest_path``."""
+    manifest_path = Path(manifest_path)
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = manifest_path.with_name(manifest_path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        header = {
+            "version": MANIFEST_VERSION, "root": str(Path(root).resolve()), "recurse": recurse,
+            "scanned_ns": scan.scanned_ns,
+        }
+        f.write(json.dumps(header) + "\n")
+        for directory, mtime_ns in scan.dirs.items():
+            f.write(json.dumps({"dir": directory, "mtime_ns": mtime_ns}) + "\n")
+        for e in scan.entries:
+            f.write(json.dumps({
+                "path": str(e.path), "size": e.size, "mtime_ns": e.mtime_ns, "thumb": e.thumb,
+            }) + "\n")
+    os.replace(tmp_path, manifest_path)
+
+
+def read_manifest(manifest_path: Path, root: Path, recurse: bool) -> Optional[LibraryScan]:
+    """Return the scan saved in ``manifest_path`` if it describes ``root``/``recurse``.
+
+    The scan is returned as recorded; see :func:`refresh_scan`.  Returns None
+    when the manifest is missing, unreadable or was produced for a different
+    scan, so callers can fall back to scanning.
+    """
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if (
+                header.get("version") != MANIFEST_VERSION
+                or header.get("root") != str(Path(root).resolve())
+                or header.get("recurse") != recurse
+            ):
+                return None
+            entries = []
+            dirs = {}
+            for line in f:
+                d = json.loads(line)
+                if "dir" in d:
+                    dirs[d["dir"]] = d["mtime_ns"]
+                else:
+                    entries.append(ScanEntry(Path(d["path"]), d["size"], d["mtime_ns"], d["thumb"]))
+            return LibraryScan(entries, dirs, header["scanned_ns"])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def load_or_scan(root: Path, recurse: bool = False, manifest_path: Optional[Path] = None) -> List[ScanEntry]:
+    """Return the images under ``root``, from ``manifest_path`` where it is still current.
+
+    A matching manifest is refreshed by rescanning the directories that
+    changed since it was written; a missing or mismatched one is replaced by
+    a full scan.  Either way the manifest is rewritten if anything changed.
+    """
+    if manifest_path is not None:
+        scan = read_manifest(manifest_path, root, recurse)
+        if scan is not None:
+            scan, rescanned = refresh_scan(scan, recurse)
+            if rescanned:
+                write_manifest(manifest_path, root, recurse, scan)
+                print(
+                    f"Using {len(scan.entries)} image(s) from manifest {manifest_path} "
+                    f"({rescanned} changed director{'y' if rescanned == 1 else 'ies'} rescanned)"
+                )
+            else:
+                print(f"Using {len(scan.entries)} image(s) from manifest {manifest_path}")
+            return scan.entries
+    scan = scan_tree(root, recurse)
+    if manifest_path is not None:
+        write_manifest(manifest_path, root, recurse, scan)
+    return scan.entries
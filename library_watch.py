@@ -0,0 +1,280 @@
+"""Watch an image library and report which images changed, in debounced batches.
+
+On Linux the tree is watched with inotify (through ``ctypes``; nothing extra
+to install).  Events only say which directories to look at again: once they
+have been quiet for ``debounce`` seconds, those directories are rescanned with
+:func:`library_scan.scan_library` and compared with the last known state.
+Elsewhere, or when inotify is unavailable (e.g. its watch limit is reached),
+the whole tree is rescanned every ``poll_interval`` seconds instead.
+
+A file modified within the last ``debounce`` seconds is assumed to be still
+being written and is held back until a later batch.  If events never stop
+(a long copy), a batch is cut after ``MAX_BATCH_DELAY`` seconds anyway.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from library_scan import ScanEntry, is_image_name, scan_library
+
+DEFAULT_DEBOUNCE = 2.0
+DEFAULT_POLL_INTERVAL = 5.0
+MAX_BATCH_DELAY = 30.0
+
+# From <sys/inotify.h>.
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+_WATCH_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    | IN_DELETE_SELF | IN_MOVE_SELF
+)
+_EVENT = struct.Struct("iIII")
+
+
+class Changes(NamedTuple):
+    """Added and modified images as they are now, deleted ones as last seen."""
+
+    added: List[ScanEntry]
+    modified: List[ScanEntry]
+    deleted: List[ScanEntry]
+
+
+class _Inotify:
+    """Minimal inotify binding: directory watches and non-blocking reads."""
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.dirs: Dict[int, Path] = {}
+
+    def add(self, directory: Path) -> None:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(str(directory)), _WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), str(directory))
+        self.dirs[wd] = directory
+
+    def read(self, timeout: float) -> List[Tuple[Optional[Path], str, int]]:
+        """Return ``(directory, name, mask)`` for each event within ``timeout`` seconds."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return []
+        events = []
+        pos = 0
+        while pos + _EVENT.size <= len(data):
+            wd, mask, _cookie, length = _EVENT.unpack_from(data, pos)
+            name = data[pos + _EVENT.size:pos + _EVENT.size + length].rstrip(b"\0")
+            pos += _EVENT.size + length
+            if mask & IN_IGNORED:
+                self.dirs.pop(wd, None)
+                continue
+            events.append((self.dirs.get(wd), os.fsdecode(name), mask))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def _in_scope(path: Path, scope: Dict[Path, bool]) -> bool:
+    parent = path.parent
+    if parent in scope:
+        return True
+    return any(recursive and directory in parent.parents for directory, recursive in scope.items())
+
+
+class LibraryWatcher:
+    """Debounced view of image changes under ``root`` since the previous batch."""
+
+    def __init__(
+        self,
+        root: Path,
+        recurse: bool = False,
+        debounce: float = DEFAULT_DEBOUNCE,
+        poll_interval: Optional[float] = None,
+    ):
+        self.root = Path(root).resolve()
+        self.recurse = recurse
+        self.debounce = debounce
+        self.poll_interval = poll_interval or DEFAULT_POLL_INTERVAL
+        self.state: Dict[Path, ScanEntry] = {e.path: e for e in scan_library(self.root, recurse)}
+        # Directories to rescan, mapped to whether to include subdirectories.
+        self._dirty: Dict[Path, bool] = {}
+        self._first_event: Optional[float] = None
+        self._last_event: Optional[float] = None
+        self._last_scan: Optional[Dict[Path, ScanEntry]] = None
+        self._inotify: Optional[_Inotify] = None
+        if poll_interval is None:
+            try:
+                self._inotify = _Inotify()
+                self._watch_tree(self.root)
+            except (OSError, AttributeError) as e:
+                self._fall_back(e)
+
+    @property
+    def mode(self) -> str:
+        if self._inotify is not None:
+            return "inotify"
+        return f"polling every {self.poll_interval:g}s"
+
+    def _fall_back(self, error: Exception) -> None:
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+        print(f"inotify unavailable ({error}); polling every {self.poll_interval:g}s instead.")
+        self._dirty = {}
+
+    def _watch_tree(self, top: Path) -> None:
+        directories = [top]
+        if self.recurse:
+            for dirpath, dirnames, _ in os.walk(top):
+                directories.extend(
+                    Path(dirpath) / d for d in dirnames if not os.path.islink(os.path.join(dirpath, d))
+                )
+        for directory in directories:
+            try:
+                self._inotify.add(directory)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+
+    def _mark(self, directory: Path, recursive: bool, now: float) -> None:
+        self._dirty[directory] = self._dirty.get(directory, False) or recursive
+        if self._first_event is None:
+            self._first_event = now
+        self._last_event = now
+
+    def _read_events(self, timeout: float) -> None:
+        now = time.monotonic()
+        for directory, name, mask in self._inotify.read(timeout):
+            if directory is None or mask & IN_Q_OVERFLOW:
+                self._mark(self.root, True, now)
+            elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                self._mark(directory, True, now)
+            elif mask & IN_ISDIR:
+                if not self.recurse:
+                    continue
+                sub = directory / name
+                self._mark(sub, True, now)
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    try:
+                        self._watch_tree(sub)
+                    except OSError as e:  # typically the watch limit
+                        self._fall_back(e)
+                        return
+            elif is_image_name(name):
+                self._mark(directory, False, now)
+
+    def _settled(self) -> bool:
+        if self._last_event is None:
+            return False
+        now = time.monotonic()
+        return now - self._last_event >= self.debounce or now - self._first_event >= MAX_BATCH_DELAY
+
+    def _apply(self, scope: Dict[Path, bool], current: Dict[Path, ScanEntry]) -> Changes:
+        """Diff ``current`` against the known state within ``scope`` and adopt it."""
+        now_ns = time.time_ns()
+        window_ns = int(self.debounce * 1e9)
+        added = []
+        modified = []
+        for path, entry in current.items():
+            old = self.state.get(path)
+            if old is not None and (old.size, old.mtime_ns) == (entry.size, entry.mtime_ns):
+                continue
+            if 0 <= now_ns - entry.mtime_ns < window_ns:
+                # Probably still being written; look again after the debounce.
+                self._mark(path.parent, False, time.monotonic())
+                continue
+            self.state[path] = entry
+            (added if old is None else modified).append(entry)
+        gone = [p for p in self.state if p not in current and _in_scope(p, scope)]
+        deleted = [self.state.pop(p) for p in gone]
+        return Changes(sorted(added), sorted(modified), sorted(deleted))
+
+    def _next_inotify(self) -> Optional[Changes]:
+        if self._last_event is None:
+            timeout = 1.0
+        else:
+            timeout = max(0.0, min(1.0, self.debounce - (time.monotonic() - self._last_event)))
+        self._read_events(timeout)
+        if self._inotify is None or not self._settled():
+            return None
+        scope, self._dirty = self._dirty, {}
+        self._first_event = self._last_event = None
+        current: Dict[Path, ScanEntry] = {}
+        for directory, recursive in scope.items():
+            if directory.is_dir():
+                for entry in scan_library(directory, recursive and self.recurse):
+                    current[entry.path] = entry
+        return self._apply(scope, current)
+
+    def _next_poll(self, stop: Optional[threading.Event]) -> Optional[Changes]:
+        if stop is not None:
+            stop.wait(self.poll_interval)
+        else:
+            time.sleep(self.poll_interval)
+        scan = {e.path: e for e in scan_library(self.root, self.recurse)}
+        now = time.monotonic()
+        if scan == self.state:
+            self._last_scan = scan
+            self._first_event = self._last_event = None
+            return None
+        if scan != self._last_scan:
+            # Still moving; wait for a scan that matches the previous one.
+            self._last_scan = scan
+            self._mark(self.root, True, now)
+            if now - self._first_event < MAX_BATCH_DELAY:
+                return None
+        elif not self._settled():
+            return None
+        self._dirty = {}
+        self._first_event = self._last_event = None
+        return self._apply({self.root: True}, scan)
+
+    def next_changes(self, stop: Optional[threading.Event] = None) -> Optional[Changes]:
+        """Block until some images changed and have settled; None once ``stop`` is set."""
+        while stop is None or not stop.is_set():
+            if self._inotify is not None:
+                changes = self._next_inotify()
+            else:
+                changes = self._next_poll(stop)
+            if changes is not None and any(changes):
+                return changes
+        return None
+
+    def close(self) -> None:
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,321 @@
+"""Build the browser's elasticlunr index ahead of time.
+
+``app.js`` turns every ``data.json`` entry into a document (``title``,
+``searchTerms`` and ``tags`` fields, keyed by a murmur hash of the filename)
+and calls ``idx.addDoc`` on each one at page load.  This module does the
+same work in Python -- tokenizer, trimmer, stop words and the Porter stemmer
+of ``elasticlunr.min.js`` 0.9.5 included -- and writes the result in the
+format of ``idx.toJSON()``, so the page only has to ``elasticlunr.Index.load``
+it.  Search-time settings (field boosts, AND) stay in ``app.js``.
+
+The index also records the size and CRC-32 of the ``data.json`` it was built
+for under ``"data"`` (``Index.load`` ignores the extra key).  ``app.js``
+checks both against the ``data.json`` it loaded and indexes that itself if
+they differ, so an index left behind by an older run is never used.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import re
+import zlib
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from data_writer import atomic_open
+
+ELASTICLUNR_VERSION = "0.9.5"
+FIELDS = ["title", "searchTerms", "tags"]
+PIPELINE = ["trimmer", "stopWordFilter", "stemmer"]
+# The seed app.js hashes filenames with to make document ids.
+ID_SEED = 11091974
+
+STOP_WORDS = frozenset("""
+    a able about across after all almost also am among an and any are as at be
+    because been but by can cannot could dear did do does either else ever
+    every for from get got had has have he her hers him his how however i if in
+    into is it its just least let like likely may me might most must my neither
+    no nor not of off often on only or other our own rather said say says she
+    should since so some than that the their them then there these they this
+    tis to too twas us wants was we were what when where which while who whom
+    why will with would yet you your
+""".split()) | {""}
+
+_SEPARATOR = re.compile(r"[\s\-]+")
+# JavaScript's \W is ASCII-only.
+_LEADING = re.compile(r"^\W+", re.ASCII)
+_TRAILING = re.compile(r"\W+$", re.ASCII)
+
+
+def default_index_path(data_file: Path) -> Path:
+    """Return the prebuilt index location ``app.js`` expects for ``data_file``."""
+    data_file = Path(data_file)
+    return data_file.with_name(data_file.stem + ".index.json")
+
+
+def murmurhash3_32(key: str, seed: int) -> int:
+    """``murmurhash3_32_gc`` from ``app.js``: MurmurHash3 over UTF-16 code units' low bytes."""
+    units = key.encode("utf-16-le")
+    data = units[::2]
+    c1, c2 = 0xCC9E2D51, 0x1B873593
+    h1 = seed & 0xFFFFFFFF
+    rounded = len(data) & ~3
+    for i in range(0, rounded, 4):
+        k1 = int.from_bytes(data[i:i + 4], "little")
+        k1 = (k1 * c1) & 0xFFFFFFFF
+        k1 = ((k1 << 15) | (k1 >> 17)) & 0xFFFFFFFF
+        k1 = (k1 * c2) & 0xFFFFFFFF
+        h1 ^= k1
+        h1 = ((h1 << 13) | (h1 >> 19)) & 0xFFFFFFFF
+        h1 = (h1 * 5 + 0xE6546B64) & 0xFFFFFFFF
+    tail = data[rounded:]
+    if tail:
+        k1 = int.from_bytes(tail, "little")
+        k1 = (k1 * c1) & 0xFFFFFFFF
+        k1 = ((k1 << 15) | (k1 >> 17)) & 0xFFFFFFFF
+        k1 = (k1 * c2) & 0xFFFFFFFF
+        h1 ^= k1
+    h1 ^= len(data)
+    h1 ^= h1 >> 16
+    h1 = (h1 * 0x85EBCA6B) & 0xFFFFFFFF
+    h1 ^= h1 >> 13
+    h1 = (h1 * 0xC2B2AE35) & 0xFFFFFFFF
+    h1 ^= h1 >> 16
+    return h1
+
+
+# --- Porter stemmer, as shipped in elasticlunr ------------------------------
+
+_STEP2 = {
+    "ational": "ate", "tional": "tion", "enci": "ence", "anci": "ance", "izer": "ize", "bli": "ble",
+    "alli": "al", "entli": "ent", "eli": "e", "ousli": "ous", "ization": "ize", "ation": "ate",
+    "ator": "ate", "alism": "al", "iveness": "ive", "fulness": "ful", "ousness": "ous", "aliti": "al",
+    "iviti": "ive", "biliti": "ble", "logi": "log",
+}
+_STEP3 = {"icate": "ic", "ative": "", "alize": "al", "iciti": "ic", "ical": "ic", "ful": "", "ness": ""}
+
+_C = "[^aeiou]"
+_V = "[aeiouy]"
+_CS = _C + "[^aeiouy]*"
+_VS = _V + "[aeiou]*"
+_MGR0 = re.compile("^(" + _CS + ")?" + _VS + _CS)
+_MEQ1 = re.compile("^(" + _CS + ")?" + _VS + _CS + "(" + _VS + ")?$")
+_MGR1 = re.compile("^(" + _CS + ")?" + _VS + _CS + _VS + _CS)
+_S_V = re.compile("^(" + _CS + ")?" + _V)
+_STEP1A = re.compile(r"^(.+?)(ss|i)es$")
+_STEP1A_S = re.compile(r"^(.+?)([^s])s$")
+_STEP1B_EED = re.compile(r"^(.+?)eed$")
+_STEP1B = re.compile(r"^(.+?)(ed|ing)$")
+_STEP1B_E = re.compile(r"(at|bl|iz)$")
+_DOUBLE = re.compile(r"([^aeiouylsz])\1$")
+_CVC = re.compile("^" + _CS + _V + "[^aeiouwxy]$")
+_STEP1C = re.compile(r"^(.+?[^aeiou])y$")
+_STEP2_RE = re.compile("^(.+?)(" + "|".join(_STEP2) + ")$")
+_STEP3_RE = re.compile("^(.+?)(" + "|".join(_STEP3) + ")$")
+_STEP4 = re.compile(r"^(.+?)(al|ance|ence|er|ic|able|ible|ant|ement|ment|ent|ou|ism|ate|iti|ous|ive|ize)$")
+_STEP4_ION = re.compile(r"^(.+?)(s|t)(ion)$")
+_STEP5 = re.compile(r"^(.+?)e$")
+_STEP5_LL = re.compile(r"ll$")
+
+
+def stem(w: str) -> str:
+    if len(w) < 3:
+        return w
+    first = w[0]
+    if first == "y":
+        w = "Y" + w[1:]
+
+    if _STEP1A.search(w):
+        w = _STEP1A.sub(r"\1\2", w, 1)
+    elif _STEP1A_S.search(w):
+        w = _STEP1A_S.sub(r"\1\2", w, 1)
+
+    m = _STEP1B_EED.search(w)
+    if m:
+        if _MGR0.search(m.group(1)):
+            w = w[:-1]
+    else:
+        m = _STEP1B.search(w)
+        if m and _S_V.search(m.group(1)):
+            w = m.group(1)
+            if _STEP1B_E.search(w):
+                w += "e"
+            elif _DOUBLE.search(w):
+                w = w[:-1]
+            elif _CVC.search(w):
+                w += "e"
+
+    m = _STEP1C.search(w)
+    if m:
+        w = m.group(1) + "i"
+
+    m = _STEP2_RE.search(w)
+    if m and _MGR0.search(m.group(1)):
+        w = m.group(1) + _STEP2[m.group(2)]
+
+    m = _STEP3_RE.search(w)
+    if m and _MGR0.search(m.group(1)):
+        w = m.group(1) + _STEP3[m.group(2)]
+
+    m = _STEP4.search(w)
+    if m:
+        if _MGR1.search(m.group(1)):
+            w = m.group(1)
+    else:
+        m = _STEP4_ION.search(w)
+        if m and _MGR1.search(m.group(1) + m.group(2)):
+            w = m.group(1) + m.group(2)
+
+    m = _STEP5.search(w)
+    if m:
+        base = m.group(1)
+        if _MGR1.search(base) or (_MEQ1.search(base) and not _CVC.search(base)):
+            w = base
+
+    if _STEP5_LL.search(w) and _MGR1.search(w):
+        w = w[:-1]
+
+    if first == "y":
+        w = "y" + w[1:]
+    return w
+
+
+# --- Documents and index ----------------------------------------------------
+
+def tokenize(value) -> List[str]:
+    """``elasticlunr.tokenizer``: lower-case and split strings or lists of them."""
+    if value is None:
+        return []
+    if isinstance(value, list):
+        tokens = []
+        for item in value:
+            if item is not None:
+                tokens.extend(_SEPARATOR.split(str(item).lower()))
+        return tokens
+    return _SEPARATOR.split(str(value).strip().lower())
+
+
+@lru_cache(maxsize=1 << 18)
+def _analyse_token(token: str) -> Optional[str]:
+    token = _TRAILING.sub("", _LEADING.sub("", token))
+    return None if token in STOP_WORDS else stem(token)
+
+
+def analyse(tokens: Iterable[str]) -> List[str]:
+    """Run the default pipeline: trimmer, stop word filter, stemmer."""
+    out = []
+    for token in tokens:
+        token = _analyse_token(token)
+        if token is not None:
+            out.append(token)
+    return out
+
+
+def _js_keys(obj: dict) -> List[str]:
+    """``Object.keys`` order: array-index keys ascending, then insertion order."""
+    index_keys = [k for k in obj if k.isascii() and k.isdigit() and (k == "0" or k[0] != "0") and int(k) < 2**32 - 1]
+    if not index_keys:
+        return list(obj)
+    index_set = set(index_keys)
+    return sorted(index_keys, key=int) + [k for k in obj if k not in index_set]
+
+
+def app_documents(entries: Iterable[dict], tag_counts: Optional[Dict[str, int]] = None) -> Iterable[dict]:
+    """Yield the documents ``app.js`` adds to its index for ``entries``.
+
+    The tag links quote each tag's image count.  Without ``tag_counts`` the
+    counts are taken from ``entries``, which must then be a list; with them,
+    ``entries`` can be any iterable and is read once.
+    """
+    counts = tag_counts
+    if counts is None:
+        counts = {}
+        for entry in entries:
+            for tag in entry["question"]["content"]:
+                counts[tag] = counts.get(tag, 0) + 1
+    for entry in entries:
+        filename = entry["img"]["filename"]
+        tags = _js_keys(entry["question"]["content"])
+        yield {
+            "id": murmurhash3_32(filename, ID_SEED),
+            "title": filename.replace(".JPG", "", 1),
+            "searchTerms": " ".join(tags),
+            "tags": [
+                f'<a title="{counts[k]} results for {k}" style="cursor:pointer" '
+                f"onclick=\"searchTerm('{k}')\">{k}</a>"
+                for k in tags
+            ],
+        }
+
+
+def build_index(documents: Iterable[dict]) -> dict:
+    """Return what ``idx.toJSON()`` gives after ``idx.addDoc`` on each document."""
+    docs: Dict[int, None] = {}
+    doc_info: Dict[int, Dict[str, int]] = {}
+    roots = {field: {"docs": {}, "df": 0} for field in FIELDS}
+    # Token -> its trie node, per field, so each token's path is walked once.
+    nodes: Dict[str, Dict[str, dict]] = {field: {} for field in FIELDS}
+    for doc in documents:
+        ref = doc["id"]
+        docs[ref] = None
+        info = doc_info.setdefault(ref, {})
+        for field in FIELDS:
+            tokens = analyse(tokenize(doc.get(field)))
+            info[field] = len(tokens)
+            counts: Dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            field_nodes = nodes[field]
+            for token, count in counts.items():
+                node = field_nodes.get(token)
+                if node is None:
+                    node = roots[field]
+                    for char in token:
+                        node = node.setdefault(char, {"docs": {}, "df": 0})
+                    field_nodes[token] = node
+                if ref not in node["docs"]:
+                    node["df"] += 1
+                tf = math.sqrt(count)
+                node["docs"][ref] = {"tf": int(tf) if tf.is_integer() else tf}
+    return {
+        "version": ELASTICLUNR_VERSION,
+        "fields": FIELDS,
+        "ref": "id",
+        "documentStore": {"docs": docs, "docInfo": doc_info, "length": len(docs), "save": False},
+        "index": {field: {"root": roots[field]} for field in FIELDS},
+        "pipeline": PIPELINE,
+    }
+
+
+def data_fingerprint(data_file: Path) -> Dict[str, int]:
+    """Return the size and CRC-32 of ``data_file``'s bytes, as ``app.js`` computes them."""
+    crc = 0
+    size = 0
+    with open(data_file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+    return {"bytes": size, "crc32": crc}
+
+
+def write_index(
+    path: Path,
+    entries: Iterable[dict],
+    tag_counts: Optional[Dict[str, int]] = None,
+    data_file: Optional[Path] = None,
+) -> int:
+    """Atomically write the prebuilt index for ``entries``; return its size.
+
+    See :func:`app_documents` for ``tag_counts``.  ``data_file`` is the
+    ``data.json`` holding ``entries``, already written; ``app.js`` only uses
+    an index that carries its fingerprint.
+    """
+    index = build_index(app_documents(entries, tag_counts))
+    if data_file is not None:
+        index["data"] = data_fingerprint(data_file)
+    data = json.dumps(index, separators=(",", ":")).encode("utf-8")
+    with atomic_open(path) as f:
+        f.write(data)
+    return len(data)
@@ -1,26 +1,282 @@
 import argparse
+import copy
+import multiprocessing
 import os
 import platform
 from pathlib import Path
+from typing import List, NamedTuple, Optional
 from PIL import Image, ImageOps
-import tempfile
-import numpy as np
-import jpeglib
-from thumb_utils import folder_hash
-
-from jpeg_recompress import recompress
+from thumb_utils import generate_thumb_filename
+from library_scan import ScanEntry, load_or_scan
 import shutil
 from tqdm import tqdm
 
 
-def generate_thumb_filename(img_path: Path) -> str:
-    """Generate a thumbnail filename using the full image path with a short hash."""
-    absolute = img_path.resolve()
-    relative = absolute.relative_to(absolute.anchor)
-    sanitized_parts = [part.replace(' ', '_').replace('.', '_') for part in relative.parts]
-    sanitized = '_'.join(sanitized_parts)
-    path_hash = folder_hash(absolute.parent)
-    return f"{sanitized}_{path_hash}.THUMB.JPG"
+def _lanczos():
+    # Use Image.Resampling.LANCZOS for newer Pillow versions
+    # For older versions, Image.LANCZOS is used.
+    if hasattr(Image, "Resampling"):
+        return Image.Resampling.LANCZOS
+    return Image.LANCZOS
+
+
+class Watermark:
+    """A watermark decoded once and pre-scaled per thumbnail size.
+
+    Scaled copies are cached as an RGB logo plus its alpha mask, so applying
+    the watermark to a thumbnail is a single ``paste``.
+    """
+
+    def __init__(self, logo: Image.Image):
+        self.logo = logo.convert("RGBA")
+        self._scaled = {}
+
+    @classmethod
+    def load(cls, overlay_path: Path) -> "Watermark":
+        with Image.open(overlay_path) as im:
+            im.load()
+            return cls(im)
+
+    def scaled(self, size):
+        """Return ``(logo_rgb, mask)`` fitted inside a thumbnail of ``size``."""
+        cached = self._scaled.get(size)
+        if cached is not None:
+            return cached
+        thumb_width, thumb_height = size
+        logo = self.logo
+        logo_width, logo_height = logo.size
+        # Scale the watermark down if it's larger than the thumbnail
+        if logo_width > thumb_width or logo_height > thumb_height:
+            scale_ratio = min(thumb_width / logo_width, thumb_height / logo_height)
+            logo = logo.resize(
+                (int(logo_width * scale_ratio), int(logo_height * scale_ratio)), _lanczos()
+            )
+        cached = (logo.convert("RGB"), logo.getchannel("A"))
+        self._scaled[size] = cached
+        return cached
+
+    def apply(self, thumb: Image.Image) -> Image.Image:
+        """Paste the watermark at the bottom-right of ``thumb``."""
+        logo, mask = self.scaled(thumb.size)
+        if thumb.mode != "RGB":
+            thumb = thumb.convert("RGB")
+        thumb_width, thumb_height = thumb.size
+        thumb.paste(logo, (thumb_width - logo.width, thumb_height - logo.height), mask)
+        return thumb
+
+
+def load_watermark(overlay_path: Path) -> Optional[Watermark]:
+    """Load the watermark once for a run, or return None if unusable."""
+    print(f"Looking for watermark at: {overlay_path}")
+    if not overlay_path.exists():
+        print("Watermark not found, proceeding without it.")
+        return None
+    try:
+        watermark = Watermark.load(overlay_path)
+    except Exception as e:
+        print(f"Failed to load watermark {overlay_path}: {e}. Proceeding without it.")
+        return None
+    print("Watermark found.")
+    return watermark
+
+
+# Set in each pool worker (and in-process for serial runs) so the watermark
+# is transferred once per worker rather than once per task.
+_worker_watermark: Optional[Watermark] = None
+# This worker's copy of the quality model as it was when the worker started.
+# It is not updated from the worker's own results, so a thumbnail's search
+# does not depend on which images the worker happened to compress before it.
+_worker_quality_model = None
+
+
+def _init_worker(watermark: Optional[Watermark], quality_model=None) -> None:
+    global _worker_watermark, _worker_quality_model
+    _worker_watermark = watermark
+    _worker_quality_model = quality_model
+
+
+# Draft decoding never goes below this multiple of the thumbnail size so the
+# final LANCZOS pass still has real detail to filter down from.
+DRAFT_MARGIN = 2
+
+# Encode budget for the -Z quality search: what bisection needs for the 40-98
+# range.  Interpolation usually needs fewer, and fewer still from a quality
+# model prediction.
+THUMB_LOOPS = 6
+
+
+class ThumbRecompression(NamedTuple):
+    """How the -Z search went for one thumbnail."""
+
+    quality: Optional[int]  # None if the search found nothing
+    encodes: int
+    features: Optional[List[float]]  # set when a quality model is in use
+    predicted: bool  # True if the model's prediction seeded the search
+
+
+def _thumb_model_key() -> str:
+    from jpeg_recompress import default_target
+    from quality_model import setting_key
+
+    return setting_key("smallfry", default_target("smallfry", "low"))
+
+
+def render_thumbnail(
+    img_path: Path,
+    thumb_save_path: Path,
+    watermark: Optional[Watermark],
+    thumb_size: int,
+    compress: bool = False,
+    jpegli: bool = False,
+    draft: bool = False,
+    quality_model=None,
+):
+    """Create a single thumbnail for ``img_path`` at ``thumb_save_path``.
+
+    Runs in worker processes when ``process_images`` uses a pool, so it never
+    prints; instead it returns ``(created, messages, recompressed)`` where
+    ``messages`` are lines for the caller to report and ``recompressed`` is
+    a :class:`ThumbRecompression` for ``compress`` runs (else None).
+    Failures are reported, not raised.
+
+    The ``compress`` search starts from the prediction and window of
+    ``quality_model`` (a :class:`quality_model.QualityModel`) when it can
+    make one, and covers the whole quality range otherwise.
+
+    With ``draft`` set, JPEG sources are decoded by libjpeg at a reduced DCT
+    scale (1/2, 1/4 or 1/8) that still leaves at least ``DRAFT_MARGIN`` times
+    the thumbnail size on each axis, before the usual LANCZOS resize.
+    """
+    messages = []
+    try:
+        image = Image.open(img_path)
+        if image is None:
+            messages.append(f"Failed to open image {img_path.name}, skipping.")
+            return False, messages, None
+
+        current_image_format = image.format  # Store format before exif_transpose
+        if draft and current_image_format == "JPEG":
+            # Must happen before the pixel data is loaded. The EXIF block is
+            # untouched, so exif_transpose below still sees the orientation.
+            min_side = thumb_size * DRAFT_MARGIN
+            image.draft(image.mode, (min_side, min_side))
+        image = ImageOps.exif_transpose(image)
+        if image is None:
+            image = Image.open(img_path)
+            if image is None:
+                messages.append(
+                    f"Failed to process EXIF data for {img_path.name} and could not re-open, skipping."
+                )
+                return False, messages, None
+
+        thumb = image.resize((thumb_size, thumb_size), _lanczos())
+
+        if watermark is not None:
+            try:
+                thumb = watermark.apply(thumb)
+            except Exception as e_overlay:
+                messages.append(f"Failed to apply overlay to {img_path.name}: {e_overlay}")
+
+        # Save the thumbnail
+        # Ensure the image is in RGB format before saving as JPEG
+        if (
+            thumb.mode == "RGBA" or thumb.mode == "P"
+        ):  # P is for paletted images like some GIFs/PNGs
+            thumb = thumb.convert("RGB")
+
+        if compress:
+            # Imported lazily: jpeg_recompress pulls in NumPy and its metrics.
+            from jpeg_recompress import recompress_image
+
+            start, window, features = None, None, None
+            if quality_model is not None:
+                from quality_model import image_features
+
+                features = image_features(thumb)
+                prediction = quality_model.predict(_thumb_model_key(), features, 40, 98)
+                if prediction is not None:
+                    start, window = prediction
+            result = recompress_image(
+                thumb,
+                target=0.0,
+                jpeg_min=40,
+                jpeg_max=98,
+                preset="low",
+                loops=THUMB_LOOPS,
+                method="smallfry",
+                progressive=True,
+                accurate=False,
+                keep_metadata=False,
+                quiet=True,
+                start=start,
+                window=window,
+            )
+            thumb_save_path.write_bytes(result.data)
+            return True, messages, ThumbRecompression(result.quality, result.encodes, features, window is not None)
+        elif jpegli:
+            import jpeglib
+            import numpy as np
+
+            arr = np.array(thumb.convert("RGB"))
+            jpeg_img = jpeglib.from_spatial(arr)
+            jpeg_img.write_spatial(str(thumb_save_path), qt=90)
+        else:
+            thumb.save(thumb_save_path, "JPEG", quality=98)
+        return True, messages, None
+
+    except FileNotFoundError:
+        messages.append(
+            f"Source image {img_path.name} not found during processing, skipping."
+        )
+    except Exception as e:
+        messages.append(f"Error processing {img_path.name}: {e}")
+    return False, messages, None
+
+
+def _spawn_pool(workers: int, watermark: Optional[Watermark], quality_model):
+    # Spawned (not forked) workers are safe even when the caller has other
+    # threads running, e.g. captioning alongside in run_pipeline.
+    return multiprocessing.get_context("spawn").Pool(
+        processes=workers, initializer=_init_worker, initargs=(watermark, quality_model)
+    )
+
+
+def start_thumb_pool(
+    workers: int,
+    overlay_path: Path,
+    thumb_size: int,
+    quality_model_path: Optional[Path] = None,
+):
+    """Start a process pool for several :func:`process_images` calls to share.
+
+    Spawning the workers and sending each the watermark costs more than
+    rendering a handful of thumbnails, so long-running callers such as
+    ``run_pipeline.py --watch`` keep one pool.  Workers predict from the
+    quality model as it is now.  Returns None if ``workers`` comes to a single
+    process; the caller closes the pool.
+    """
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        return None
+    watermark = load_watermark(overlay_path)
+    if watermark is not None:
+        watermark.scaled((thumb_size, thumb_size))
+    quality_model = None
+    if quality_model_path is not None:
+        from quality_model import QualityModel
+
+        quality_model = QualityModel.load(quality_model_path)
+    return _spawn_pool(workers, watermark, quality_model)
+
+
+def _render_thumbnail_task(task):
+    """Pool-friendly wrapper around :func:`render_thumbnail`."""
+    img_path, thumb_save_path, *options = task
+    created, messages, recompressed = render_thumbnail(
+        img_path, thumb_save_path, _worker_watermark, *options, quality_model=_worker_quality_model,
+    )
+    return thumb_save_path, created, messages, recompressed
 
 
 def process_images(
@@ -33,7 +289,32 @@ def process_images(
     verbose: bool = False,
     compress: bool = False,
     jpegli: bool = False,
+    workers: int = 1,
+    ordered: bool = False,
+    draft: bool = False,
+    manifest_path: Optional[Path] = None,
+    scanned: Optional[List[ScanEntry]] = None,
+    quality_model_path: Optional[Path] = None,
+    pool=None,
 ) -> None:
+    """Create thumbnails for every image under ``source_dir``.
+
+    ``workers`` > 1 renders thumbnails in a process pool (``0`` uses every
+    core).  Results are collected as they finish unless ``ordered`` is set, in
+    which case they are reported in sorted source order.  ``draft`` enables
+    reduced-scale JPEG decoding (see :func:`render_thumbnail`).  When
+    ``manifest_path`` names a manifest from a matching scan it is used instead
+    of walking ``source_dir`` again, rescanning only the directories that
+    changed since; otherwise the scan result is saved there.
+    A ready-made ``scanned`` list skips scanning altogether.
+
+    With ``compress``, ``quality_model_path`` names a
+    :class:`quality_model.QualityModel` file that seeds each quality search
+    and is updated with this run's results.
+
+    A ``pool`` from :func:`start_thumb_pool` is used instead of starting one
+    for this call, and is left open.
+    """
     script_dir = (
         Path(__file__).resolve().parent
     )  # Get the directory of the currently running script
@@ -66,35 +347,34 @@ def process_images(
     # This will be empty if thumbs were just cleared.
     existing_thumb_names = {p.name for p in thumb_dir.glob("*.THUMB.JPG")}
 
-    source_image_paths = []
-    img_glob_patterns = ["*.[jJ][pP][gG]", "*.[jJ][pP][eE][gG]", "*.[pP][nN][gG]"]
-    for pattern in img_glob_patterns:
-        if recurse:
-            source_image_paths.extend(source_dir.rglob(pattern))
-        else:
-            source_image_paths.extend(source_dir.glob(pattern))
+    source_images = scanned if scanned is not None else load_or_scan(source_dir, recurse, manifest_path)
 
-    total_source_images = len(source_image_paths)
+    total_source_images = len(source_images)
     thumbnails_created_this_run = 0
     images_skipped_this_run = 0
 
     print(f"Processing images from: {source_dir}")
     print(f"Saving thumbnails to: {thumb_dir}")
-    print(f"Looking for watermark at: {overlay_path}")
-    if overlay_path.exists():
-        print("Watermark found.")
-    else:
-        print("Watermark not found, proceeding without it.")
+    watermark = load_watermark(overlay_path)
+    if watermark is not None:
+        watermark.scaled((thumb_size, thumb_size))
     print(f"Found {total_source_images} source image(s) to consider.")
 
-    iterator = sorted(source_image_paths)
+    quality_model = None
+    if compress and quality_model_path is not None:
+        from quality_model import QualityModel
+
+        quality_model = QualityModel.load(quality_model_path)
+        print(f"Quality model {quality_model_path}: {len(quality_model)} sample(s)")
+
+    tasks = []
     pbar = None
     if not verbose:
         pbar = tqdm(total=total_source_images, desc="Creating Thumbnails", unit="image")
 
-    for img_path in iterator:
-        thumb_filename = generate_thumb_filename(img_path)
-        thumb_save_path = thumb_dir / thumb_filename
+    for source in source_images:
+        img_path = source.path
+        thumb_filename = source.thumb
 
         # Skip processing if this thumbnail already exists
         if thumb_filename in existing_thumb_names:
@@ -104,138 +384,53 @@ def process_images(
             if pbar:
                 pbar.update(1)
             continue
-
-        try:
-            image = Image.open(img_path)
-            if image is None:
-                print(f"Failed to open image {img_path.name}, skipping.")
-                images_skipped_this_run += 1  # Count as skipped if cannot be opened
-                if pbar:
-                    pbar.update(1)
-                continue
-
-            current_image_format = image.format  # Store format before exif_transpose
-            image = ImageOps.exif_transpose(image)
-            if image is None:
-                image = Image.open(img_path)
-                if image is None:
-                    print(
-                        f"Failed to process EXIF data for {img_path.name} and could not re-open, skipping."
-                    )
-                    images_skipped_this_run += 1
-                    if pbar:
-                        pbar.update(1)
-                    continue
-
-            # Use Image.Resampling.LANCZOS for newer Pillow versions
-            # For older versions, Image.LANCZOS is used.
-            if hasattr(Image, "Resampling"):
-                resample_filter = Image.Resampling.LANCZOS
-            else:
-                resample_filter = Image.LANCZOS
-            thumb = image.resize((thumb_size, thumb_size), resample_filter)
-
-            # Apply overlay if watermark.png exists
-            if overlay_path.exists():
-                try:
-                    logo_original = Image.open(overlay_path).convert("RGBA")
-                    logo = (
-                        logo_original.copy()
-                    )  # Work with a copy to avoid modifying the original if opened multiple times
-
-                    thumb_width, thumb_height = thumb.size
-                    logo_width, logo_height = logo.size
-
-                    # 1. Scale the watermark if it's larger than the thumbnail
-                    if logo_width > thumb_width or logo_height > thumb_height:
-                        scale_ratio = min(
-                            thumb_width / logo_width, thumb_height / logo_height
-                        )
-                        new_logo_width = int(logo_width * scale_ratio)
-                        new_logo_height = int(logo_height * scale_ratio)
-
-                        # Use Image.Resampling.LANCZOS for newer Pillow versions for logo resizing
-                        if hasattr(Image, "Resampling"):
-                            resample_filter_logo = Image.Resampling.LANCZOS
-                        else:
-                            resample_filter_logo = Image.LANCZOS
-                        logo = logo.resize(
-                            (new_logo_width, new_logo_height), resample_filter_logo
-                        )
-                        logo_width, logo_height = (
-                            logo.size
-                        )  # Update dimensions after resize
-
-                    # 2. Calculate position for bottom-right placement
-                    x_pos = thumb_width - logo_width
-                    y_pos = thumb_height - logo_height
-
-                    # Ensure thumb is RGBA to handle logo transparency correctly
-                    if thumb.mode != "RGBA":
-                        thumb = thumb.convert("RGBA")
-
-                    # Paste the (potentially resized) logo at the bottom-right
-                    # The third argument 'logo' uses the alpha channel of the logo as the mask
-                    thumb.paste(logo, (x_pos, y_pos), logo)
-
-                except Exception as e_overlay:
-                    print(f"Failed to apply overlay to {img_path.name}: {e_overlay}")
-
-            # Save the thumbnail
-            # Ensure the image is in RGB format before saving as JPEG
-            if (
-                thumb.mode == "RGBA" or thumb.mode == "P"
-            ):  # P is for paletted images like some GIFs/PNGs
-                thumb = thumb.convert("RGB")
-
-            if compress:
-                with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as tmp:
-                    thumb.save(tmp.name, "JPEG", quality=98)
-                    tmp_path = Path(tmp.name)
-
-                try:
-                    recompress(
-                        tmp_path,
-                        thumb_save_path,
-                        target=0.0,
-                        jpeg_min=40,
-                        jpeg_max=98,
-                        preset="low",
-                        loops=6,
-                        method="smallfry",
-                        progressive=True,
-                        accurate=False,
-                    )
-                finally:
-                    try:
-                        tmp_path.unlink()
-                    except FileNotFoundError:
-                        pass
-            elif jpegli:
-                arr = np.array(thumb.convert("RGB"))
-                jpeg_img = jpeglib.from_spatial(arr)
-                jpeg_img.write_spatial(str(thumb_save_path), qt=90)
+        existing_thumb_names.add(thumb_filename)
+        tasks.append(
+            (img_path, thumb_dir / thumb_filename, thumb_size, compress, jpegli, draft)
+        )
+
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(tasks)) if tasks else 1
+
+    owned_pool = None
+    if pool is None and workers > 1:
+        owned_pool = pool = _spawn_pool(workers, watermark, quality_model)
+    if pool is not None and tasks:
+        # A few chunks per worker keeps IPC overhead low while still balancing
+        # slow images across the pool.
+        chunksize = max(1, min(32, len(tasks) // (workers * 4)))
+        mapper = pool.imap if ordered else pool.imap_unordered
+        results = mapper(_render_thumbnail_task, tasks, chunksize)
+    else:
+        # Predict from the model as loaded, as pool workers do, not from the
+        # one collecting this run's samples.
+        _init_worker(watermark, copy.deepcopy(quality_model))
+        results = map(_render_thumbnail_task, tasks)
+
+    encode_counts = []
+    predicted = 0
+    try:
+        for thumb_save_path, created, messages, recompressed in results:
+            if recompressed is not None:
+                encode_counts.append(recompressed.encodes)
+                predicted += recompressed.predicted
+                if quality_model is not None and recompressed.quality is not None:
+                    quality_model.add(_thumb_model_key(), recompressed.features, recompressed.quality)
+            for message in messages:
+                print(message)
+            if created:
+                thumbnails_created_this_run += 1
+                if verbose:
+                    print(f"Created thumbnail: {thumb_save_path}")
             else:
-                thumb.save(thumb_save_path, "JPEG", quality=98)
-            thumbnails_created_this_run += 1
-            existing_thumb_names.add(thumb_filename)
-            if verbose:
-                print(f"Created thumbnail: {thumb_save_path}")
-            if pbar:
-                pbar.update(1)
-
-        except FileNotFoundError:
-            print(
-                f"Source image {img_path.name} not found during processing, skipping."
-            )
-            images_skipped_this_run += 1
-            if pbar:
-                pbar.update(1)
-        except Exception as e:
-            print(f"Error processing {img_path.name}: {e}")
-            images_skipped_this_run += 1
+                images_skipped_this_run += 1
             if pbar:
                 pbar.update(1)
+    finally:
+        if owned_pool is not None:
+            owned_pool.close()
+            owned_pool.join()
 
     if pbar:
         pbar.close()
@@ -244,6 +439,17 @@ def process_images(
     print(f"Total source images found: {total_source_images}")
     print(f"Thumbnails created in this run: {thumbnails_created_this_run}")
     print(f"Images skipped (already had thumbnail or error): {images_skipped_this_run}")
+    if encode_counts:
+        print(
+            f"JPEG encodes per recompressed thumbnail: {sum(encode_counts) / len(encode_counts):.2f} "
+            f"average (min {min(encode_counts)}, max {max(encode_counts)})"
+        )
+    if quality_model is not None:
+        quality_model.save()
+        print(
+            f"Quality model predicted {predicted} of {len(encode_counts)} search(es); "
+            f"saved {len(quality_model)} sample(s) to {quality_model_path}"
+        )
 
     # Verification: Count .THUMB.JPG files in thumbs_dir
     final_thumb_count = len(list(thumb_dir.glob("*.THUMB.JPG")))
@@ -354,7 +560,35 @@ if __name__ == "__main__":
         action="store_true",
         help="Use jpeglib for thumbnail compression. Disabled by default.",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes used to render thumbnails. 0 uses every core. Defaults to 1.",
+    )
+    parser.add_argument(
+        "--ordered",
+        action="store_true",
+        help="With --workers, report results in source order instead of as they finish.",
+    )
+    parser.add_argument(
+        "--draft",
+        action="store_true",
+        help="Decode JPEGs at a reduced scale before resizing. Faster and lighter on memory for large photos.",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=Path,
+        help="Library scan manifest to reuse (or create) instead of rescanning source_dir; only directories changed since it was written are rescanned.",
+    )
+    parser.add_argument(
+        "--quality-model",
+        type=Path,
+        help="With -Z, predict each thumbnail's quality from past runs recorded in this file (created if missing).",
+    )
     args = parser.parse_args()
+    if args.workers < 0:
+        parser.error("--workers must be 0 or a positive number")
 
     process_images(
         args.source_dir,
@@ -366,4 +600,9 @@ if __name__ == "__main__":
         args.verbose,
         args.compress,
         args.jpegli,
+        workers=args.workers,
+        ordered=args.ordered,
+        draft=args.draft,
+        manifest_path=args.manifest,
+        quality_model_path=args.quality_model,
     )
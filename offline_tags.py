@@ -1,42 +1,318 @@
 import argparse
 from pathlib import Path
-from transformers.models.blip_2 import Blip2Processor, Blip2ForConditionalGeneration
-from PIL import Image
-import spacy
-import torch
+from PIL import Image, ImageOps
 import os
 import platform
-import json  # Added import
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
-from typing import Optional
-from thumb_utils import folder_hash
+from typing import Iterator, List, Optional, Sequence
+from thumb_utils import generate_thumb_filename
+from library_scan import ScanEntry, load_or_scan
+from caption_cache import CaptionCache, default_cache_path
+from caption_client import DEFAULT_URL, CaptionClient, CaptionResult, CaptionServerError
+from precompress import precompress_site
+from entry_store import EntryStore, default_store_path, write_site_data
 
 
-def generate_thumb_filename(img_path: Path) -> str:
-    """Create thumbnail filename matching make_thumbs.py with hash."""
-    absolute = img_path.resolve()
-    relative = absolute.relative_to(absolute.anchor)
-    sanitized_parts = [part.replace(' ', '_').replace('.', '_') for part in relative.parts]
-    sanitized = '_'.join(sanitized_parts)
-    path_hash = folder_hash(absolute.parent)
-    return f"{sanitized}_{path_hash}.THUMB.JPG"
+def load_image(image_path) -> Image.Image:
+    """Read, decode and EXIF-normalise an image for captioning."""
+    with Image.open(image_path) as im:
+        return ImageOps.exif_transpose(im).convert("RGB")
+
+
+def preprocess_image(image_path, processor):
+    """Return the processor's ``pixel_values`` tensor for a single image."""
+    image = load_image(image_path)
+    return processor(images=image, return_tensors="pt")["pixel_values"]
+
+
+def generate_captions(pixel_values, processor, model):
+    """Run ``model.generate`` on a stacked ``pixel_values`` tensor."""
+    out = model.generate(pixel_values=pixel_values.to(model.device))
+    return processor.batch_decode(out, skip_special_tokens=True)
 
 
 def caption_image(image_path, processor, model, device):  # device parameter might become redundant
-    image = Image.open(image_path).convert("RGB")
-    inputs = processor(images=image, return_tensors="pt")
-    # Inputs should be moved to the model's device
-    inputs = {k: v.to(model.device) for k, v in inputs.items()}
-    out = model.generate(**inputs)
-    return processor.decode(out[0], skip_special_tokens=True)
+    pixel_values = preprocess_image(image_path, processor)
+    return generate_captions(pixel_values, processor, model)[0]
 
 
-def extract_tags(caption, nlp):
-    doc = nlp(caption)
+def caption_batch(items, processor, model):
+    """Caption several preprocessed images with a single ``model.generate`` call.
+
+    ``items`` is a list of ``(path, pixel_values, error)`` tuples as produced by
+    :class:`ImagePrefetcher`. Returns ``(path, caption, error)`` tuples in input
+    order. Images that failed to load keep their error; if the batched forward
+    pass itself fails the batch is retried one image at a time so that a single
+    bad file cannot take down its neighbours.
+    """
+    results = {}
+    loaded = []
+    for img_path, pixel_values, error in items:
+        if error is not None:
+            results[img_path] = (None, error)
+        else:
+            loaded.append((img_path, pixel_values))
+
+    if loaded:
+        try:
+            import torch
+
+            stacked = torch.cat([pv for _, pv in loaded])
+            captions = generate_captions(stacked, processor, model)
+            for (img_path, _), caption in zip(loaded, captions):
+                results[img_path] = (caption, None)
+        except Exception as batch_error:
+            if len(loaded) == 1:
+                results[loaded[0][0]] = (None, batch_error)
+            else:
+                for img_path, pixel_values in loaded:
+                    try:
+                        caption = generate_captions(pixel_values, processor, model)[0]
+                        results[img_path] = (caption, None)
+                    except Exception as e:
+                        results[img_path] = (None, e)
+
+    return [(item[0],) + results[item[0]] for item in items]
+
+
+class ImagePrefetcher:
+    """Decode and preprocess upcoming images on a background thread pool.
+
+    Paths are submitted in order and at most ``depth`` of them are in flight at
+    once, so memory stays bounded while the model works on the current batch.
+    ``starved_seconds`` accumulates the time the consumer spent blocked waiting
+    for an image that was not ready yet.
+    """
+
+    def __init__(self, image_paths, load_fn, workers: int = 2, depth: int = 8):
+        self._paths = iter(image_paths)
+        self._load_fn = load_fn
+        self._depth = max(1, depth)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self._pending = deque()
+        self.starved_seconds = 0.0
+        self._fill()
+
+    def _fill(self):
+        while len(self._pending) < self._depth:
+            try:
+                img_path = next(self._paths)
+            except StopIteration:
+                return
+            self._pending.append((img_path, self._executor.submit(self._load_fn, img_path)))
+
+    def next_batch(self, size: int):
+        """Return up to ``size`` ``(path, pixel_values, error)`` tuples."""
+        batch = []
+        while self._pending and len(batch) < size:
+            img_path, future = self._pending.popleft()
+            started = time.perf_counter()
+            try:
+                batch.append((img_path, future.result(), None))
+            except Exception as e:
+                batch.append((img_path, None, e))
+            self.starved_seconds += time.perf_counter() - started
+            self._fill()
+        return batch
+
+    def close(self):
+        for _, future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_captioning_models():
+    """Load the BLIP-2 processor and model used for captioning."""
+    # torch/transformers take seconds to import, so they are only pulled in
+    # once a run actually has images to caption.
+    import torch
+    from transformers.models.blip_2 import Blip2Processor, Blip2ForConditionalGeneration
+
+    # device variable might not be strictly needed if device_map works
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    # Try to use the fast image processor to avoid warning about slow processors
+    try:
+        processor = Blip2Processor.from_pretrained(
+            "Salesforce/blip2-opt-2.7b", use_fast=True
+        )
+    except TypeError:
+        # Older versions of transformers may not support the use_fast argument
+        processor = Blip2Processor.from_pretrained("Salesforce/blip2-opt-2.7b")
+    model = Blip2ForConditionalGeneration.from_pretrained(
+        "Salesforce/blip2-opt-2.7b",
+        device_map="auto",
+    )
+    # model.to(device) # This line should no longer be needed
+    return processor, model
+
+
+class CaptioningResources:
+    """BLIP-2 processor/model and spaCy pipeline, each loaded on first use.
+
+    Share one instance across :func:`process_folder` calls (e.g. from
+    ``run_pipeline``) so the model is loaded at most once per process.  While
+    nothing is loaded here, a caption server answering at ``server_url`` (see
+    ``caption_server.py``) is used instead; pass None to always caption
+    in-process.
+    """
+
+    def __init__(self, server_url: Optional[str] = DEFAULT_URL):
+        self.server_url = server_url
+        self._captioner = None
+        self._nlp = None
+        self._using_server = False
+
+    @property
+    def captioner(self):
+        """``(processor, model)`` tuple."""
+        if self._captioner is None:
+            self._captioner = load_captioning_models()
+        return self._captioner
+
+    @property
+    def nlp(self):
+        if self._nlp is None:
+            self._nlp = load_nlp()
+        return self._nlp
+
+    @property
+    def loaded(self) -> bool:
+        """True once the captioning model has been loaded in this process."""
+        return self._captioner is not None
+
+    def make_captioner(self, batch_size: int = 1, loader_workers: int = 2, prefetch: int = 8):
+        """Return a :class:`caption_client.CaptionClient` or a :class:`LocalCaptioner`.
+
+        Both offer ``caption(paths)``, ``tags(captions)``, ``caption_seconds``
+        and ``starved_seconds``.
+        """
+        client = None
+        if self.server_url and not self.loaded:
+            client = CaptionClient.connect(self.server_url)
+        if (client is not None) != self._using_server:
+            self._using_server = client is not None
+            if client is not None:
+                print(f"Using the caption server at {client.url}.")
+        if client is not None:
+            return client
+        return LocalCaptioner(self, batch_size, loader_workers, prefetch)
+
+
+class LocalCaptioner:
+    """Captions and tags images with the models of a :class:`CaptioningResources`."""
+
+    def __init__(self, resources: CaptioningResources, batch_size: int = 1, loader_workers: int = 2, prefetch: int = 8):
+        self.resources = resources
+        self.batch_size = batch_size
+        self.loader_workers = loader_workers
+        self.prefetch = prefetch
+        self.caption_seconds = 0.0
+        self.starved_seconds = 0.0
+
+    def caption(self, paths: Sequence[Path]) -> Iterator[CaptionResult]:
+        """Yield a :class:`CaptionResult` per path, in order, a batch at a time."""
+        if not paths:
+            return
+        processor, model = self.resources.captioner
+        nlp = self.resources.nlp
+        with ImagePrefetcher(
+            paths,
+            lambda p: preprocess_image(p, processor),
+            workers=self.loader_workers,
+            depth=self.prefetch,
+        ) as prefetcher:
+            try:
+                while True:
+                    batch = prefetcher.next_batch(self.batch_size)
+                    if not batch:
+                        break
+                    started = time.perf_counter()
+                    captioned = caption_batch(batch, processor, model)
+                    self.caption_seconds += time.perf_counter() - started
+                    ok_captions = [caption for _, caption, error in captioned if error is None]
+                    try:
+                        batch_tags = iter(extract_tags_batch(ok_captions, nlp))
+                    except Exception:
+                        # Fall back to tagging one caption at a time below.
+                        batch_tags = None
+                    for img_path, caption, error in captioned:
+                        tags_list = None
+                        if error is None:
+                            try:
+                                if batch_tags is not None:
+                                    tags_list = next(batch_tags)
+                                else:
+                                    tags_list = extract_tags(caption, nlp)
+                            except Exception as e:
+                                error = e
+                        yield CaptionResult(img_path, caption, tags_list, None if error is None else str(error))
+            finally:
+                self.starved_seconds += prefetcher.starved_seconds
+
+    def tags(self, captions: List[str], batch_size: int = 256) -> List[List[str]]:
+        return extract_tags_batch(captions, self.resources.nlp, batch_size=batch_size)
+
+
+def build_entry(img_path: Path, tags_list, thumb_filename: Optional[str] = None) -> dict:
+    """Return a ``data.json`` question entry for ``img_path``."""
+    content_dict = {tag: "1.0" for tag in tags_list}
+    return {
+        "img": {"filename": img_path.name},
+        "question": {"content": content_dict},
+        "thumb": {"filename": thumb_filename or generate_thumb_filename(img_path)},
+    }
+
+
+# Tagging only needs part-of-speech and lemma, so the dependency parser and
+# entity recogniser are never loaded.
+NLP_EXCLUDE = ["parser", "ner", "senter"]
+
+
+def load_nlp():
+    """Load the spaCy pipeline with only the components tagging relies on."""
+    import spacy
+
+    return spacy.load("en_core_web_sm", exclude=NLP_EXCLUDE)
+
+
+def _tags_from_doc(doc):
     nouns = {token.lemma_.lower() for token in doc if token.pos_ == "NOUN"}
     return sorted(tag.upper() for tag in nouns)
 
 
+def extract_tags(caption, nlp):
+    return _tags_from_doc(nlp(caption))
+
+
+def extract_tags_batch(captions, nlp, batch_size: int = 256):
+    """Return a tag list for each caption, streaming them through ``nlp.pipe``."""
+    return [_tags_from_doc(doc) for doc in nlp.pipe(captions, batch_size=batch_size)]
+
+
+def retag_cache(cache: CaptionCache, captioner, batch_size: int = 1024) -> int:
+    """Re-derive tags for every cached caption using the current tagging rules.
+
+    Returns the number of captions updated.
+    """
+    rows = list(cache.iter_captions())
+    hashes = [content_hash for content_hash, _ in rows]
+    captions = [caption for _, caption in rows]
+    tags = captioner.tags(captions, batch_size=batch_size)
+    cache.update_tags(zip(hashes, tags))
+    cache.commit()
+    return len(rows)
+
+
 def process_folder(
     folder_path_str: str,
     recurse: bool = False,
@@ -45,6 +321,18 @@ def process_folder(
     delete: bool = False,
     thumb_dir: Optional[Path] = None,
     data_file: Optional[Path] = None,
+    batch_size: int = 1,
+    loader_workers: int = 2,
+    prefetch: int = 8,
+    use_cache: bool = True,
+    cache_path: Optional[Path] = None,
+    retag: bool = False,
+    manifest_path: Optional[Path] = None,
+    scanned: Optional[List[ScanEntry]] = None,
+    resources: Optional[CaptioningResources] = None,
+    json_indent: Optional[int] = None,
+    compact: bool = True,
+    payloads: Optional[bool] = None,
 ):
     """Process a folder of images and update data.json.
 
@@ -55,7 +343,35 @@ def process_folder(
         delete: Remove records (and thumbnails) for images in the folder.
         thumb_dir: Location of thumbnails. Defaults to script_dir/img/thumbs.
         data_file: Path to data.json. Defaults to script_dir/data.json.
+        batch_size: Number of images captioned per ``model.generate`` call.
+        loader_workers: Threads that read, decode and preprocess images ahead
+            of the model.
+        prefetch: Maximum number of images decoded ahead of the model.
+        use_cache: Reuse captions for images whose content was captioned
+            before and record new ones.
+        cache_path: Location of the caption cache. Defaults to a
+            ``.cache.sqlite`` file beside ``data_file``.
+        retag: Re-derive tags for every cached caption before processing,
+            e.g. after changing the tagging rules.
+        manifest_path: Library scan manifest to reuse instead of rescanning
+            the whole folder. Directories changed since it was written are
+            rescanned and the manifest updated; a missing or mismatched one
+            is replaced by a full scan.
+        scanned: Pre-computed scan of the folder; skips scanning entirely.
+        resources: Loaded models to reuse. A private instance is created
+            (and models loaded only if needed and no caption server is
+            running) when omitted.
+        json_indent: Pretty-print ``data.json`` with this indent instead of
+            writing it compactly.
+        compact: Rewrite ``data.json`` and its payloads from the entry store
+            afterwards. When False only the store is updated, and
+            ``entry_store.py`` writes ``data.json`` later.
+        payloads: Passed to :func:`entry_store.write_site_data`. False also
+            skips precompression, leaving both to the caller.
     """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+
     # Determine the output path for data.json (in the script's directory)
     # Assuming the script is run from its location, __file__ should give its path.
     try:
@@ -66,126 +382,169 @@ def process_folder(
     output_json_path = data_file if data_file else script_dir / "data.json"
     thumb_directory = thumb_dir if thumb_dir else script_dir / "img" / "thumbs"
 
-    # device variable might not be strictly needed if device_map works
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    # Try to use the fast image processor to avoid warning about slow processors
-    try:
-        processor = Blip2Processor.from_pretrained(
-            "Salesforce/blip2-opt-2.7b", use_fast=True
-        )
-    except TypeError:
-        # Older versions of transformers may not support the use_fast argument
-        processor = Blip2Processor.from_pretrained("Salesforce/blip2-opt-2.7b")
-    model = Blip2ForConditionalGeneration.from_pretrained(
-        "Salesforce/blip2-opt-2.7b",
-        device_map="auto",
-    )
-    # model.to(device) # This line should no longer be needed
-    nlp = spacy.load("en_core_web_sm")
-    img_extensions = {".jpg", ".jpeg", ".png", ".JPG", ".JPEG", ".PNG"}
-
-    existing_data = []
+    store = EntryStore(default_store_path(output_json_path))
     if add or delete:
-        if output_json_path.exists():
-            with open(output_json_path, "r", encoding="utf-8") as f_existing:
-                existing_data = json.load(f_existing).get("questions", [])
-
-    all_questions_data = []  # Initialize list to hold all image data
-    image_folder_path = Path(folder_path_str)
-    if recurse:
-        iter_paths = image_folder_path.rglob('*')
-    else:
-        iter_paths = image_folder_path.iterdir()
-    image_paths = [p for p in sorted(iter_paths) if p.is_file() and p.suffix in img_extensions]
+        store.sync_from(output_json_path)
+
+    if scanned is None:
+        scanned = load_or_scan(Path(folder_path_str), recurse, manifest_path)
+    if resources is None:
+        resources = CaptioningResources()
+    image_paths = [e.path for e in scanned]
+    thumb_names = {e.path: e.thumb for e in scanned}
 
     # Handle deletion before any captioning work
     if delete:
-        names_to_delete = {p.name for p in image_paths}
-        remaining = [
-            e
-            for e in existing_data
-            if e.get("img", {}).get("filename") not in names_to_delete
-        ]
+        # By thumbnail name, which is unique per source path: a file deleted
+        # from one folder leaves same-named images elsewhere alone.
+        removed = store.delete_ids(thumb_names.values())
         for img_path in image_paths:
-            thumb_name = generate_thumb_filename(img_path)
-            thumb_path = thumb_directory / thumb_name
+            thumb_path = thumb_directory / thumb_names[img_path]
             if thumb_path.exists():
                 thumb_path.unlink()
-
-        tag_counts = {}
-        for entry in remaining:
-            for tag in entry.get("question", {}).get("content", {}):
-                tag_counts[tag] = tag_counts.get(tag, 0) + 1
-
-        with open(output_json_path, "w", encoding="utf-8") as f_json:
-            json.dump({"questions": remaining, "tag_counts": tag_counts}, f_json, indent=4)
-        print(f"Updated {output_json_path}")
+        store.commit()
+        print(f"Removed {removed} entr{'y' if removed == 1 else 'ies'} from {store.db_path}")
+        _finish_data(store, output_json_path, json_indent, compact, payloads=payloads)
         return
 
-    existing_names = {e.get("img", {}).get("filename") for e in existing_data}
-
-    if verbose:
-        for img_path in image_paths:
-            if add and img_path.name in existing_names:
-                if verbose:
-                    print(f"Skipping {img_path.name} as it already exists in the dataset.")
-                continue
-            try:
-                caption = caption_image(img_path, processor, model, device)
-                tags_list = extract_tags(caption, nlp)
-
-                content_dict = {tag: "1.0" for tag in tags_list}
-                thumb_filename = generate_thumb_filename(img_path)
-                image_data_entry = {
-                    "img": {"filename": img_path.name},
-                    "question": {"content": content_dict},
-                    "thumb": {"filename": thumb_filename},
-                }
-                all_questions_data.append(image_data_entry)
-
-                print(f"Tags for {img_path.name}: {', '.join(tags_list)}")
-            except Exception as e:
-                print(f"Error processing {img_path.name}: {e}")
-    else:
-        with tqdm(total=len(image_paths), desc="Captioning Images", unit="image") as pbar:
-            for img_path in image_paths:
-                if add and img_path.name in existing_names:
-                    pbar.update(1)
+    existing_thumbs = store.ids() if add else set()
+    # New images can simply be appended to data.json if it is exactly what
+    # the store last wrote.
+    appendable = add and store.is_synced(output_json_path)
+    captioner = resources.make_captioner(batch_size, loader_workers, prefetch)
+    cache = None
+    if use_cache:
+        cache = CaptionCache(cache_path if cache_path else default_cache_path(output_json_path))
+        if retag:
+            started = time.perf_counter()
+            retagged = retag_cache(cache, captioner)
+            print(f"Re-derived tags for {retagged} cached caption(s) in {time.perf_counter() - started:.2f}s.")
+
+    pbar = None
+    if not verbose:
+        pbar = tqdm(total=len(image_paths), desc="Captioning Images", unit="image")
+
+    entries = {}
+    replaced_thumbs = set()
+    to_caption = []
+    for img_path in image_paths:
+        thumb_filename = thumb_names[img_path]
+        try:
+            if add and thumb_filename in existing_thumbs:
+                # Only a stat and a lookup: images the cache has no record of
+                # count as unchanged and are not hashed just to record them.
+                changed = cache is not None and cache.changed_since_cached(img_path)
+                if not changed:
+                    if verbose:
+                        print(f"Skipping {img_path.name} as it already exists in the dataset.")
+                    if pbar:
+                        pbar.update(1)
                     continue
-                try:
-                    caption = caption_image(img_path, processor, model, device)
-                    tags_list = extract_tags(caption, nlp)
-
-                    content_dict = {tag: "1.0" for tag in tags_list}
-
-                    thumb_filename = generate_thumb_filename(img_path)
-                    image_data_entry = {
-                        "img": {"filename": img_path.name},
-                        "question": {"content": content_dict},
-                        "thumb": {"filename": thumb_filename},
-                    }
-                    all_questions_data.append(image_data_entry)
-                    pbar.update(1)
-                except Exception as e:
-                    print(f"Error processing {img_path.name}: {e}")
+                replaced_thumbs.add(thumb_filename)
+            content_key = cache.file_key(img_path) if cache is not None else None
+        except OSError as e:
+            print(f"Error processing {img_path.name}: {e}")
+            if pbar:
+                pbar.update(1)
+            continue
+
+        cached = cache.get(content_key) if cache is not None else None
+        if cached is not None:
+            entries[img_path] = build_entry(img_path, cached[1], thumb_filename)
+            if verbose:
+                print(f"Tags for {img_path.name} (cached): {', '.join(cached[1])}")
+            if pbar:
+                pbar.update(1)
+        else:
+            to_caption.append((img_path, content_key))
+
+    content_keys = dict(to_caption)
+    pending_paths = [img_path for img_path, _ in to_caption]
+    caption_seconds = 0.0
+    starved_seconds = 0.0
+    done = set()
+    remaining = pending_paths
+    while remaining:
+        current = captioner
+        try:
+            for result in current.caption(remaining):
+                img_path = result.path
+                done.add(img_path)
+                error = result.error
+                if error is None:
+                    try:
+                        entries[img_path] = build_entry(img_path, result.tags, thumb_names[img_path])
+                        if cache is not None:
+                            cache.put(content_keys[img_path], result.caption, result.tags)
+                            cache.commit()
+                        if verbose:
+                            print(f"Tags for {img_path.name}: {', '.join(result.tags)}")
+                    except Exception as e:
+                        error = e
+                if error is not None:
+                    print(f"Error processing {img_path.name}: {error}")
+                if pbar:
                     pbar.update(1)
+        except CaptionServerError as e:
+            print(f"Caption server failed ({e}); captioning the remaining images in-process.")
+            resources.server_url = None
+            captioner = LocalCaptioner(resources, batch_size, loader_workers, prefetch)
+        finally:
+            caption_seconds += current.caption_seconds
+            starved_seconds += current.starved_seconds
+        # Only a server failure leaves images to retry, with the new captioner.
+        remaining = [p for p in remaining if p not in done] if captioner is not current else []
+
+    if pbar:
+        pbar.close()
+
+    if cache is not None:
+        print(f"Caption cache {cache.db_path}: {cache.hits} hit(s), {cache.misses} miss(es).")
+        cache.close()
+
+    if pending_paths:
+        busy_total = caption_seconds + starved_seconds
+        starved_pct = 100.0 * starved_seconds / busy_total if busy_total else 0.0
+        print(
+            f"Captioned {len(pending_paths)} image(s) in {caption_seconds:.2f}s; "
+            f"model waited {starved_seconds:.2f}s for input ({starved_pct:.1f}% starved)."
+        )
 
-    if add:
-        combined = existing_data + all_questions_data
-    else:
-        combined = all_questions_data
-
-    tag_counts = {}
-    for entry in combined:
-        for tag in entry.get("question", {}).get("content", {}):
-            tag_counts[tag] = tag_counts.get(tag, 0) + 1
-
-    final_output_data = {"questions": combined, "tag_counts": tag_counts}
+    new_entries = [entries[p] for p in image_paths if p in entries]
+    if not add:
+        store.clear()
+    # Replaced entries move to the end, as they would in a rewritten file.
+    for entry in new_entries:
+        store.put(entry)
+    store.commit()
+    _finish_data(
+        store,
+        output_json_path,
+        json_indent,
+        compact,
+        appended=new_entries if appendable and not replaced_thumbs else None,
+        payloads=payloads,
+    )
 
-    with open(output_json_path, "w", encoding="utf-8") as f_json:
-        json.dump(final_output_data, f_json, indent=4)
 
-    print(f"Successfully generated {output_json_path}")
+def _finish_data(
+    store: EntryStore,
+    data_file: Path,
+    json_indent: Optional[int],
+    compact: bool,
+    appended: Optional[List[dict]] = None,
+    payloads: Optional[bool] = None,
+) -> None:
+    """Write ``data.json`` and its payloads from ``store`` (unless deferred) and close it."""
+    with store:
+        if not compact:
+            print(f"Updated {store.db_path} ({len(store)} entries); {data_file} not rewritten yet.")
+            return
+        write_site_data(store, data_file, json_indent, appended, payloads)
+    if payloads is False:
+        return
+    # The web root normally holds data.json, so its JS/CSS are refreshed too.
+    precompress_site(data_file.parent, data_file)
 
 
 def main():
@@ -247,10 +606,79 @@ def main():
         type=Path,
         help="Path to data.json. Defaults to script_dir/data.json.",
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="Number of images to caption per model forward pass. Defaults to 1.",
+    )
+    parser.add_argument(
+        "--loader-workers",
+        type=int,
+        default=2,
+        help="Threads used to decode and preprocess images ahead of the model. Defaults to 2.",
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=8,
+        help="Maximum number of images decoded ahead of the model. Defaults to 8.",
+    )
+    parser.add_argument(
+        "--cache",
+        type=Path,
+        dest="cache_path",
+        help="Caption cache database. Defaults to data.cache.sqlite beside the data file.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Caption every image from scratch without reading or updating the cache.",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=Path,
+        help="Library scan manifest to reuse (or create) instead of rescanning the folder; only directories changed since it was written are rescanned.",
+    )
+    parser.add_argument(
+        "--retag",
+        action="store_true",
+        help="Re-derive tags for all cached captions with the current tagging rules before processing.",
+    )
+    parser.add_argument(
+        "--indent",
+        type=int,
+        metavar="N",
+        help="Pretty-print data.json with N-space indentation. Defaults to compact output.",
+    )
+    parser.add_argument(
+        "--caption-server",
+        default=DEFAULT_URL,
+        metavar="URL",
+        help=f"Caption with the caption_server.py daemon at URL when it is running. Defaults to {DEFAULT_URL}.",
+    )
+    parser.add_argument(
+        "--no-caption-server",
+        action="store_true",
+        help="Always load the captioning model in this process, even if a caption server is running.",
+    )
+    parser.add_argument(
+        "--no-compact",
+        action="store_true",
+        help="Only update the entry store; write data.json later with entry_store.py.",
+    )
     args = parser.parse_args()
 
     if args.add and args.delete:
         parser.error("-A/--add and -D/--delete cannot be used together")
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    if args.loader_workers < 1:
+        parser.error("--loader-workers must be at least 1")
+    if args.prefetch < 1:
+        parser.error("--prefetch must be at least 1")
+    if args.retag and args.no_cache:
+        parser.error("--retag needs the caption cache and cannot be used with --no-cache")
 
     if not Path(args.folder).is_dir():
         print(f"Error: Folder does not exist: {args.folder}")
@@ -268,6 +696,16 @@ def main():
         delete=args.delete,
         thumb_dir=args.thumb_dir,
         data_file=args.data_file,
+        batch_size=args.batch_size,
+        loader_workers=args.loader_workers,
+        prefetch=args.prefetch,
+        use_cache=not args.no_cache,
+        cache_path=args.cache_path,
+        retag=args.retag,
+        manifest_path=args.manifest,
+        json_indent=args.indent,
+        compact=not args.no_compact,
+        resources=CaptioningResources(None if args.no_caption_server else args.caption_server),
     )
 
 
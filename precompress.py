@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Write gzip (and brotli, if installed) siblings of the site's large files.
+
+``data.json`` grows to tens of megabytes on big libraries and the browser
+fetches it on every load, as it does the bundled JavaScript and CSS (and the
+search payload shards, where used).  Writing ``data.json.gz``/``data.json.br``
+beside each file once lets ``serve.py`` send the compressed bytes directly to
+clients that accept them.  A sibling is only
+used while it is at least as new as its source, so a stale one left behind by
+a tool that rewrote the source is ignored rather than served.
+
+Brotli support needs the optional ``brotli`` (or ``brotlicffi``) package.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+# Files smaller than this gain too little to be worth a sibling.
+PRECOMPRESS_MIN_SIZE = 10 * 1024
+ASSET_PATTERNS = ("*.js", "*.css", "css/*.css", "*.index.json", "*.shards/*.json")
+
+# Content-Encoding name -> file suffix, in order of preference.
+SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+_brotli = None
+
+
+def brotli_module():
+    """Return the brotli module, or None if neither binding is installed."""
+    global _brotli
+    if _brotli is None:
+        try:
+            import brotli as module
+        except ImportError:
+            try:
+                import brotlicffi as module
+            except ImportError:
+                module = False
+        _brotli = module
+    return _brotli or None
+
+
+def available_encodings() -> List[str]:
+    """Return the encodings this process can produce, most preferred first."""
+    return [e for e in SUFFIXES if e != "br" or brotli_module() is not None]
+
+
+def compress_bytes(data: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        # mtime=0 keeps the output identical for identical input.
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    if encoding == "br":
+        return brotli_module().compress(data, quality=BROTLI_QUALITY)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def sibling_path(path: Path, encoding: str) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + SUFFIXES[encoding])
+
+
+def fresh_sibling(path: str, encoding: str, source_mtime_ns: int) -> Optional[os.stat_result]:
+    """Return the stat of ``path``'s ``encoding`` sibling if it is up to date."""
+    try:
+        st = os.stat(path + SUFFIXES[encoding])
+    except OSError:
+        return None
+    return st if st.st_mtime_ns >= source_mtime_ns else None
+
+
+def precompress_file(path: Path, encodings: Optional[List[str]] = None) -> Dict[str, int]:
+    """Write compressed siblings of ``path``; return ``{encoding: size}``."""
+    path = Path(path)
+    data = path.read_bytes()
+    sizes = {}
+    for encoding in encodings or available_encodings():
+        target = sibling_path(path, encoding)
+        tmp_path = target.with_name(target.name + ".tmp")
+        compressed = compress_bytes(data, encoding)
+        tmp_path.write_bytes(compressed)
+        os.replace(tmp_path, target)
+        sizes[encoding] = len(compressed)
+    return sizes
+
+
+def precompress_site(root: Path, data_file: Optional[Path] = None, min_size: int = PRECOMPRESS_MIN_SIZE) -> None:
+    """Precompress ``data_file`` and the JS/CSS assets under ``root``.
+
+    Assets whose siblings are already up to date are left alone, so this is
+    cheap to run after every pipeline run.
+    """
+    root = Path(root)
+    paths = sorted({p for pattern in ASSET_PATTERNS for p in root.glob(pattern)})
+    if data_file is not None:
+        paths.append(Path(data_file))
+    for path in paths:
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        if st.st_size < min_size:
+            continue
+        stale = [e for e in available_encodings() if fresh_sibling(str(path), e, st.st_mtime_ns) is None]
+        if not stale:
+            continue
+        sizes = precompress_file(path, stale)
+        summary = ", ".join(f"{e} {size / 1024:.1f} KB" for e, size in sizes.items())
+        print(f"Precompressed {path} ({st.st_size / 1024:.1f} KB): {summary}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("root", nargs="?", type=Path, default=Path(__file__).resolve().parent, help="site directory")
+    parser.add_argument("--data_file", type=Path, help="data.json to compress (default: ROOT/data.json)")
+    args = parser.parse_args()
+    if brotli_module() is None:
+        print("brotli is not installed; writing gzip siblings only.")
+    precompress_site(args.root, args.data_file or args.root / "data.json")
+
+
+if __name__ == "__main__":
+    main()
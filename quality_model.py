@@ -0,0 +1,146 @@
+"""Predict the JPEG quality ``jpeg_recompress`` will settle on for an image.
+
+Within one photo library the quality chosen for a given metric and target is
+largely a function of a few cheap image statistics (contrast, edge density,
+how much of the image is flat).  ``QualityModel`` records ``(features,
+quality)`` pairs from past searches in a small JSON file, per metric/target
+setting, and predicts by nearest neighbours: the median quality of the most
+similar past images seeds the search and their spread sets the window it
+starts in.  Nearest neighbours cope with libraries where qualities cluster
+(e.g. flat graphics that pass at the minimum next to photos that need 90+),
+which a linear fit smears across the whole range.
+
+``recompress_image`` widens the search again whenever the answer turns out to
+lie outside the window, so a poor prediction costs encodes but never changes
+the result's validity.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+MODEL_VERSION = 1
+# Oldest samples are dropped beyond this many per setting.
+MAX_SAMPLES = 2000
+# Predictions are only made once this many samples have been seen.
+MIN_SAMPLES = 20
+# Predictions use the qualities of this many most similar past images; the
+# search window spans them plus WINDOW_MARGIN either side.
+NEIGHBOURS = 5
+WINDOW_MARGIN = 1
+
+
+def default_model_path(data_file: Path) -> Path:
+    """Return the model location the pipeline uses for ``data_file``."""
+    data_file = Path(data_file)
+    return data_file.with_name(data_file.stem + ".quality.json")
+
+
+def setting_key(method: str, target: float, subsample: str | int = "default") -> str:
+    """Return the key under which samples for one search setting are kept."""
+    return f"{method}:{target:g}:{subsample}"
+
+
+def image_features(image: Image.Image) -> List[float]:
+    """Return the cheap luma statistics the model is fitted on."""
+    luma = np.asarray(image.convert("L"), dtype=np.float32) / 255.0
+    dx = np.abs(np.diff(luma, axis=1))
+    dy = np.abs(np.diff(luma, axis=0))
+    lap = np.abs(4 * luma[1:-1, 1:-1] - luma[:-2, 1:-1] - luma[2:, 1:-1] - luma[1:-1, :-2] - luma[1:-1, 2:])
+    h, w = (luma.shape[0] // 8) * 8, (luma.shape[1] // 8) * 8
+    if h and w:
+        blocks = luma[:h, :w].reshape(h // 8, 8, w // 8, 8).std(axis=(1, 3))
+        flat = float((blocks < 2 / 255).mean())
+    else:
+        flat = 0.0
+    return [
+        float(luma.mean()),
+        float(luma.std()),
+        float(dx.mean() + dy.mean()) if dx.size and dy.size else 0.0,
+        float(lap.mean()) if lap.size else 0.0,
+        flat,
+        math.log(luma.size),
+    ]
+
+
+class QualityModel:
+    """Per-setting nearest-neighbour predictor from :func:`image_features` to quality."""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path is not None else None
+        self._samples: Dict[str, List[List[float]]] = {}
+        # Standardised samples per key, dropped by ``add`` and rebuilt on demand.
+        self._fits: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = {}
+
+    @classmethod
+    def load(cls, path: Path) -> "QualityModel":
+        """Load the model at ``path``; a missing or unreadable file starts empty."""
+        model = cls(path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MODEL_VERSION:
+                model._samples = {k: list(v) for k, v in data.get("samples", {}).items()}
+        except (OSError, ValueError, AttributeError):
+            pass
+        return model
+
+    def save(self, path: Optional[Path] = None) -> None:
+        path = Path(path) if path is not None else self.path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MODEL_VERSION, "samples": self._samples}, f)
+        os.replace(tmp_path, path)
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._samples.values())
+
+    def add(self, key: str, features: List[float], quality: int) -> None:
+        """Record that an image with ``features`` settled on ``quality``.
+
+        Exact repeats (the same image processed again) are ignored.
+        """
+        samples = self._samples.setdefault(key, [])
+        row = list(features) + [quality]
+        if row in samples:
+            return
+        samples.append(row)
+        del samples[:-MAX_SAMPLES]
+        self._fits.pop(key, None)
+
+    def _standardised(self, key: str):
+        samples = self._samples.get(key, [])
+        fit = self._fits.get(key)
+        if fit is not None:
+            return fit
+        if len(samples) < MIN_SAMPLES:
+            return None
+        data = np.asarray(samples, dtype=np.float64)
+        x, y = data[:, :-1], data[:, -1]
+        mean, scale = x.mean(axis=0), x.std(axis=0)
+        scale[scale == 0] = 1.0
+        fit = (mean, scale, (x - mean) / scale, y)
+        self._fits[key] = fit
+        return fit
+
+    def predict(self, key: str, features: List[float], jpeg_min: int, jpeg_max: int) -> Optional[Tuple[int, Tuple[int, int]]]:
+        """Return ``(start, (low, high))`` for the search, or None if untrained."""
+        fit = self._standardised(key)
+        if fit is None:
+            return None
+        mean, scale, xs, y = fit
+        x = (np.asarray(features, dtype=np.float64) - mean) / scale
+        dist = ((xs - x) ** 2).sum(axis=1)
+        nearest = y[np.argsort(dist)[:NEIGHBOURS]]
+        start = int(np.median(nearest))
+        low, high = int(nearest.min()) - WINDOW_MARGIN, int(nearest.max()) + WINDOW_MARGIN
+        start = min(max(start, jpeg_min), jpeg_max)
+        return start, (max(jpeg_min, low), min(jpeg_max, high))
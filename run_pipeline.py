@@ -1,9 +1,17 @@
-import subprocess
 import argparse
 import os
-import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path  # Added import
 import platform  # Added import
+import threading
+from typing import List, Optional
+from library_scan import ScanEntry, default_manifest_path, scan_tree, write_manifest
+from library_watch import DEFAULT_DEBOUNCE, LibraryWatcher
+from caption_client import DEFAULT_URL
+from entry_store import refresh_payloads
+from make_thumbs import process_images, start_thumb_pool
+from offline_tags import CaptioningResources, process_folder
+from serve import DEFAULT_PORT, serve
 
 
 # Added helper function
@@ -27,25 +35,262 @@ def get_default_pictures_folder() -> Path:
         return Path.cwd()
 
 
-def run_script(script_path, args):
-    """Helper function to run a Python script with arguments."""
-    cmd = [sys.executable, script_path] + [str(arg) for arg in args]
-    print(f"Running command: {' '.join(cmd)}")
+def _run_stage(name, fn, *args, **kwargs) -> bool:
+    """Run a pipeline stage in-process, reporting (not raising) failures."""
     try:
-        completed = subprocess.run(cmd)
-        if completed.returncode != 0:
-            print(f"Error running {script_path}. Return code: {completed.returncode}")
-            return False
-        print(f"Successfully ran {script_path}.")
+        fn(*args, **kwargs)
         return True
     except Exception as e:
-        print(f"Failed to run {script_path}: {e}")
+        print(f"{name} failed: {e}")
         import traceback
 
         traceback.print_exc()
         return False
 
 
+# Seconds without a new watch batch before the search payloads are rebuilt.
+PAYLOAD_DELAY = 15.0
+
+
+def _quality_model_path(output_json: Path, compress: bool, quality_model: bool) -> Optional[Path]:
+    if not (compress and quality_model):
+        return None
+    # Imported lazily: quality_model pulls in NumPy.
+    from quality_model import default_model_path
+
+    return default_model_path(Path(output_json))
+
+
+def run_pipeline(
+    input_dir: Path,
+    output_dir: Path,
+    output_json: Path,
+    watermark_path: Path,
+    *,
+    thumb_size: int = 256,
+    clear: bool = False,
+    compress: bool = False,
+    quality_model: bool = False,
+    jpegli: bool = False,
+    recurse: bool = False,
+    verbose: bool = False,
+    add: bool = False,
+    delete: bool = False,
+    workers: int = 1,
+    draft: bool = False,
+    batch_size: int = 1,
+    loader_workers: int = 2,
+    prefetch: int = 8,
+    use_cache: bool = True,
+    concurrent: bool = False,
+    resources: Optional[CaptioningResources] = None,
+    scanned: Optional[List[ScanEntry]] = None,
+    compact: bool = True,
+    payloads: Optional[bool] = None,
+    thumb_pool=None,
+) -> bool:
+    """Generate thumbnails and captions for ``input_dir`` in this process.
+
+    The source tree is scanned once and the result handed to both stages.
+    Pass a :class:`offline_tags.CaptioningResources` as ``resources`` to reuse
+    an already loaded model across calls.  With ``concurrent`` the CPU-bound
+    thumbnail stage runs on a background thread while the model captions.
+    With ``compress`` and ``quality_model`` the thumbnail quality search is
+    seeded from a model kept beside ``output_json`` (see :mod:`quality_model`).
+    A ``scanned`` list restricts the run to those images (no scan, and the
+    manifest is left alone); ``compact`` and ``payloads`` are passed to
+    :func:`offline_tags.process_folder`, and ``thumb_pool`` (see
+    :func:`make_thumbs.start_thumb_pool`) to :func:`make_thumbs.process_images`.
+    Returns True if every stage succeeded.
+    """
+    input_dir = Path(input_dir)
+    if not input_dir.is_dir():
+        print(f"Error: Folder does not exist: {input_dir}")
+        return False
+
+    if scanned is None:
+        # Walk the source tree once; both stages use this result and later
+        # standalone runs can reuse the manifest.
+        scan = scan_tree(input_dir, recurse)
+        scanned = scan.entries
+        manifest_path = default_manifest_path(Path(output_json))
+        write_manifest(manifest_path, input_dir, recurse, scan)
+        print(f"Scanned {len(scanned)} image(s) into {manifest_path}")
+
+    quality_model_path = _quality_model_path(output_json, compress, quality_model)
+
+    thumbs_kwargs = dict(
+        recurse=recurse,
+        verbose=verbose,
+        compress=compress,
+        jpegli=jpegli,
+        workers=workers,
+        draft=draft,
+        scanned=scanned,
+        quality_model_path=quality_model_path,
+        pool=thumb_pool,
+    )
+    tags_kwargs = dict(
+        recurse=recurse,
+        verbose=verbose,
+        add=add,
+        delete=delete,
+        thumb_dir=Path(output_dir),
+        data_file=Path(output_json),
+        batch_size=batch_size,
+        loader_workers=loader_workers,
+        prefetch=prefetch,
+        use_cache=use_cache,
+        scanned=scanned,
+        resources=resources,
+        compact=compact,
+        payloads=payloads,
+    )
+    thumb_args = (input_dir, Path(output_dir), Path(watermark_path), thumb_size, clear)
+
+    if delete:
+        print("\nGenerating tags and data.json...")
+        return _run_stage("Tag and data.json generation", process_folder, str(input_dir), **tags_kwargs)
+
+    if concurrent:
+        print("\nGenerating thumbnails and tags concurrently...")
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            thumbs_future = executor.submit(
+                _run_stage, "Thumbnail generation", process_images, *thumb_args, **thumbs_kwargs
+            )
+            tags_ok = _run_stage(
+                "Tag and data.json generation", process_folder, str(input_dir), **tags_kwargs
+            )
+            return thumbs_future.result() and tags_ok
+
+    print("\nStep 1: Generating thumbnails...")
+    if not _run_stage("Thumbnail generation", process_images, *thumb_args, **thumbs_kwargs):
+        print("Thumbnail generation failed. Aborting pipeline.")
+        return False
+
+    print("\nStep 2: Generating tags and data.json...")
+    if not _run_stage("Tag and data.json generation", process_folder, str(input_dir), **tags_kwargs):
+        print("Tag and data.json generation failed. Aborting pipeline.")
+        return False
+    return True
+
+
+class _PayloadRefresher:
+    """Rebuilds the search payloads once watch batches have stopped for a while.
+
+    Batches only update ``data.json``; rebuilding the shards and index and
+    recompressing the site happen on a timer thread ``delay`` seconds after
+    the last batch.  ``lock`` is held by batches and rebuilds alike, so the
+    two never write the site at the same time.  The entry store marks the
+    payloads stale meanwhile, so if the session dies before a rebuild the
+    next run rebuilds them.
+    """
+
+    def __init__(self, data_file: Path, delay: float):
+        self.data_file = Path(data_file)
+        self.delay = delay
+        self.lock = threading.Lock()
+        self._pending = False
+        self._timer: Optional[threading.Timer] = None
+
+    def schedule(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._pending = True
+        self._timer = threading.Timer(self.delay, self._run)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _run(self) -> None:
+        with self.lock:
+            if not self._pending:
+                return
+            self._pending = False
+            _run_stage("Search payload rebuild", refresh_payloads, self.data_file)
+
+    def flush(self) -> None:
+        """Run a pending rebuild now (or wait for the one under way)."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._run()
+
+
+def watch_pipeline(
+    input_dir: Path,
+    output_dir: Path,
+    output_json: Path,
+    watermark_path: Path,
+    *,
+    debounce: float = DEFAULT_DEBOUNCE,
+    poll_interval: Optional[float] = None,
+    stop: Optional[threading.Event] = None,
+    payload_delay: float = PAYLOAD_DELAY,
+    **options,
+) -> None:
+    """Bring ``input_dir`` up to date, then keep processing images as they change.
+
+    The watch starts before the initial ``-A`` run so nothing added meanwhile
+    is missed.  Each debounced batch of changes (see :mod:`library_watch`) goes
+    through :func:`run_pipeline` restricted to those images: deleted and
+    modified ones are removed first, then new and modified ones get
+    thumbnails, captions and their ``data.json`` entries.  The captioning
+    model and the thumbnail process pool stay resident.  The search payloads
+    are rebuilt in the background once no batch has arrived for
+    ``payload_delay`` seconds, and before returning.  Runs until interrupted
+    or until ``stop`` is set; ``options`` are passed to :func:`run_pipeline`.
+    """
+    input_dir = Path(input_dir)
+    if not input_dir.is_dir():
+        print(f"Error: Folder does not exist: {input_dir}")
+        return
+    options["resources"] = options.get("resources") or CaptioningResources()
+    options["add"] = True
+    paths = (input_dir, output_dir, output_json, watermark_path)
+    refresher = _PayloadRefresher(Path(output_json), payload_delay)
+    thumb_pool = start_thumb_pool(
+        options.get("workers", 1),
+        Path(watermark_path),
+        options.get("thumb_size", 256),
+        _quality_model_path(output_json, options.get("compress", False), options.get("quality_model", False)),
+    )
+    options["thumb_pool"] = thumb_pool
+    try:
+        with LibraryWatcher(input_dir, options.get("recurse", False), debounce, poll_interval) as watcher:
+            print(f"Watching {watcher.root} ({watcher.mode}); press Ctrl+C to stop.")
+            run_pipeline(*paths, **options)
+            try:
+                while True:
+                    changes = watcher.next_changes(stop)
+                    if changes is None:
+                        break
+                    print(
+                        f"\nDetected {len(changes.added)} new, {len(changes.modified)} modified "
+                        f"and {len(changes.deleted)} deleted image(s)."
+                    )
+                    updated = changes.added + changes.modified
+                    # Modified images lose their entry and thumbnail first, so
+                    # both are rebuilt from the new file.
+                    removed = changes.deleted + changes.modified
+                    with refresher.lock:
+                        if removed:
+                            run_pipeline(
+                                *paths, **dict(options, add=False, delete=True),
+                                scanned=removed, compact=not updated, payloads=False,
+                            )
+                        if updated:
+                            run_pipeline(*paths, **options, scanned=updated, payloads=False)
+                    refresher.schedule()
+                    print(f"Watching {watcher.root}...")
+            except KeyboardInterrupt:
+                print("\nStopped watching.")
+            refresher.flush()
+    finally:
+        if thumb_pool is not None:
+            thumb_pool.close()
+            thumb_pool.join()
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Run the full image processing pipeline: thumbnails, tags, and JSON generation."
@@ -122,6 +367,61 @@ def main():
         action="store_true",
         help="Use jpeglib for thumbnail compression.",
     )
+    parser.add_argument(
+        "--quality-model",
+        action="store_true",
+        help="With -Z, seed each thumbnail's quality search from past runs (kept beside the output JSON).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes used for thumbnail generation (0 uses every core).",
+    )
+    parser.add_argument(
+        "--draft",
+        action="store_true",
+        help="Decode JPEGs at reduced scale when generating thumbnails.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="Number of images captioned per model forward pass.",
+    )
+    parser.add_argument(
+        "--loader-workers",
+        type=int,
+        default=2,
+        help="Threads that decode images ahead of the captioning model.",
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=8,
+        help="Maximum number of images decoded ahead of the captioning model.",
+    )
+    parser.add_argument(
+        "--concurrent",
+        action="store_true",
+        help="Run thumbnail generation alongside captioning instead of before it.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Ignore the caption cache and caption every image from scratch.",
+    )
+    parser.add_argument(
+        "--caption-server",
+        default=DEFAULT_URL,
+        metavar="URL",
+        help=f"Caption with the caption_server.py daemon at URL when it is running (default {DEFAULT_URL}).",
+    )
+    parser.add_argument(
+        "--no-caption-server",
+        action="store_true",
+        help="Always load the captioning model in this process.",
+    )
     parser.add_argument(
         "-R",
         "--recurse",
@@ -154,15 +454,43 @@ def main():
         const="",
         metavar="PORT",
         help=(
-            "Start serve.py after the pipeline finishes. Optionally provide a PORT; "
+            "Start the local server after the pipeline finishes. Optionally provide a PORT; "
             "if omitted, serve.py's default port is used."
         ),
     )
+    parser.add_argument(
+        "-W",
+        "--watch",
+        action="store_true",
+        help=(
+            "After processing, keep watching the input folder and process new, modified "
+            "and deleted images as they appear. Implies -A/--add."
+        ),
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=DEFAULT_DEBOUNCE,
+        metavar="SECONDS",
+        help=f"With --watch, wait until files have been quiet this long (default {DEFAULT_DEBOUNCE:g}).",
+    )
+    parser.add_argument(
+        "--poll",
+        type=float,
+        metavar="SECONDS",
+        help="With --watch, rescan the folder this often instead of using inotify.",
+    )
 
     args = parser.parse_args()
 
     if args.clear and (args.add or args.delete):
         parser.error("-C/--clear cannot be used with -A/--add or -D/--delete.")
+    if args.workers < 0:
+        parser.error("--workers must be 0 or a positive number.")
+    if args.watch and (args.clear or args.delete):
+        parser.error("--watch cannot be used with -C/--clear or -D/--delete.")
+    if args.poll is not None and args.poll <= 0:
+        parser.error("--poll must be a positive number of seconds.")
 
     # Determine the raw input argument (from -I/--input or positional PATH)
     raw_input_arg = args.input if args.input else (args.input_path or str(default_originals_path))
@@ -203,13 +531,6 @@ def main():
     watermark_path = args.watermark_path
     recurse = args.recurse
 
-    # Construct script paths relative to this script's location (project root)
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    make_thumbs_script = os.path.join(script_dir, "make_thumbs.py")
-    offline_tags_script = os.path.join(script_dir, "offline_tags.py")
-    serve_script = os.path.join(script_dir, "serve.py")
-    # build_data_json_script = os.path.join(script_dir, 'build_data_json.py') # Removed
-
     print(f"Pipeline Configuration:")
     print(f"  Input Directory: {input_dir}")
     print(f"  Output Directory: {output_dir}")
@@ -220,73 +541,58 @@ def main():
     print(f"  Jpeglib Compression: {args.jpegli}")
     print(f"  Thumbnail Size: {args.thumb_size}")
     print(f"  Recurse into subfolders: {recurse}")
+    print(f"  Thumbnail workers: {args.workers}")
+    print(f"  Caption batch size: {args.batch_size}")
+    print(f"  Concurrent stages: {args.concurrent}")
     print(f"  Verbose output: {args.verbose}")
     print("-" * 30)
 
-    # Prepare arguments for the individual steps
-    make_thumbs_args = [
-        "--source_dir",
-        input_dir,
-        "--thumb_dir",
-        output_dir,
-        "--overlay_path",
-        watermark_path,  # Corrected: was --watermark
-        # '--clear', str(args.clear), # Corrected logic below
-        "--thumb_size",
-        str(args.thumb_size),
-    ]
-    if args.clear:  # Correctly append --clear only if True
-        make_thumbs_args.append("--clear")
-    if args.compress:
-        make_thumbs_args.append("--compress")
-    if args.jpegli:
-        make_thumbs_args.append("--jpegli")
-    if recurse:
-        make_thumbs_args.append("--recurse")
-
-    offline_tags_args = [input_dir]
-    if recurse:
-        offline_tags_args.append("--recurse")
-    if args.verbose:
-        make_thumbs_args.append("--verbose")
-        offline_tags_args.append("--verbose")
-    if args.add:
-        offline_tags_args.append("--add")
-    if args.delete:
-        offline_tags_args.append("--delete")
-    offline_tags_args.extend(["--thumb_dir", output_dir, "--data_file", output_json])
-
-    if not args.delete:
-        print("\nStep 1: Generating thumbnails...")
-        if not run_script(make_thumbs_script, make_thumbs_args):
-            print("Thumbnail generation failed. Aborting pipeline.")
-            return
+    options = dict(
+        thumb_size=args.thumb_size,
+        clear=args.clear,
+        compress=args.compress,
+        quality_model=args.quality_model,
+        jpegli=args.jpegli,
+        recurse=recurse,
+        verbose=args.verbose,
+        add=args.add,
+        delete=args.delete,
+        workers=args.workers,
+        draft=args.draft,
+        batch_size=args.batch_size,
+        loader_workers=args.loader_workers,
+        prefetch=args.prefetch,
+        use_cache=not args.no_cache,
+        concurrent=args.concurrent,
+        resources=CaptioningResources(None if args.no_caption_server else args.caption_server),
+    )
+    port = int(args.serve) if args.serve else DEFAULT_PORT
 
-    print("\nStep 2: Generating tags and data.json...")
-    if not run_script(offline_tags_script, offline_tags_args):
-        print("Tag and data.json generation failed. Aborting pipeline.")
+    if args.watch:
+        if args.serve is not None:
+            print("\nLaunching local server in the background...")
+            threading.Thread(target=serve, args=(port,), daemon=True).start()
+        watch_pipeline(
+            input_dir,
+            output_dir,
+            output_json,
+            watermark_path,
+            debounce=args.debounce,
+            poll_interval=args.poll,
+            **options,
+        )
         return
 
-    # Step 3: Build data.json (This step is now handled by offline_tags.py)
-    # print("\\nStep 3: Building data.json...")
-    # build_data_json_args = [
-    #     '--tags_dir', output_dir,
-    #     '--output_file', output_json
-    # ]
-    # if not run_script(build_data_json_script, build_data_json_args):
-    #     print("JSON generation failed. Aborting pipeline.")
-    #     return
+    ok = run_pipeline(input_dir, output_dir, output_json, watermark_path, **options)
+    if not ok:
+        print("Pipeline failed.")
+        return
 
     print("\nPipeline completed successfully!")
 
     if args.serve is not None:
         print("\nLaunching local server...")
-        serve_args = []
-        if args.serve:
-            serve_args.append(args.serve)
-        if not run_script(serve_script, serve_args):
-            print("Failed to start server.")
-
+        serve(port)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,111 @@
+"""In-memory inverted tag index over ``data.json`` for ``serve.py``'s search API.
+
+Every entry in ``data.json`` gets an integer id (its position in the file) and
+every tag a postings array: the sorted ids of the entries carrying it.  A
+query is the intersection of its terms' postings, smallest first, so its cost
+follows the rarest term rather than the size of the library.  Entries are
+serialised once at load time and responses are assembled from those bytes.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 1000
+
+_TERM_SPLIT = re.compile(r"[\s,+]+")
+
+
+class SearchResult(NamedTuple):
+    terms: List[str]
+    total: int
+    ids: np.ndarray
+
+
+def query_terms(query: str) -> List[str]:
+    """Split a query into the distinct upper-case tags it names."""
+    terms = []
+    for term in _TERM_SPLIT.split(query.strip().upper()):
+        if term and term not in terms:
+            terms.append(term)
+    return terms
+
+
+class TagIndex:
+    """Tag -> sorted entry ids, plus each entry's pre-encoded JSON."""
+
+    def __init__(self, entries: List[dict]):
+        ids_by_tag: Dict[str, List[int]] = {}
+        self._encoded: List[bytes] = []
+        for doc_id, entry in enumerate(entries):
+            self._encoded.append(json.dumps(entry, separators=(",", ":")).encode("utf-8"))
+            for tag in (entry.get("question") or {}).get("content") or {}:
+                ids_by_tag.setdefault(tag.upper(), []).append(doc_id)
+        # Ids are appended in increasing order, so each list is already sorted.
+        self.postings: Dict[str, np.ndarray] = {
+            tag: np.asarray(ids, dtype=np.uint32) for tag, ids in ids_by_tag.items()
+        }
+        self.tag_counts: Dict[str, int] = dict(
+            sorted(((t, len(p)) for t, p in self.postings.items()), key=lambda kv: (-kv[1], kv[0]))
+        )
+
+    @classmethod
+    def load(cls, data_file: Path) -> "TagIndex":
+        with open(data_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data.get("questions", []))
+
+    def __len__(self) -> int:
+        return len(self._encoded)
+
+    @property
+    def postings_size(self) -> int:
+        """Total number of (tag, entry) pairs in the index."""
+        return sum(len(p) for p in self.postings.values())
+
+    def search(self, query: str) -> SearchResult:
+        """Return the ids of the entries carrying every tag in ``query``."""
+        terms = query_terms(query)
+        if not terms:
+            return SearchResult(terms, 0, np.empty(0, dtype=np.uint32))
+        lists = []
+        for term in terms:
+            postings = self.postings.get(term)
+            if postings is None:
+                return SearchResult(terms, 0, np.empty(0, dtype=np.uint32))
+            lists.append(postings)
+        lists.sort(key=len)
+        ids = lists[0]
+        for postings in lists[1:]:
+            if not len(ids):
+                break
+            # Look each surviving id up in the longer list: O(n log m) rather
+            # than a merge over both.
+            pos = np.searchsorted(postings, ids)
+            pos[pos == len(postings)] = 0
+            ids = ids[postings[pos] == ids]
+        return SearchResult(terms, len(ids), ids)
+
+    def search_json(self, query: str, offset: int = 0, limit: int = DEFAULT_LIMIT) -> bytes:
+        """Return one page of ``search(query)`` as a JSON response body."""
+        result = self.search(query)
+        page = result.ids[offset:offset + limit]
+        head = json.dumps({
+            "query": result.terms, "total": result.total, "offset": offset, "limit": limit,
+        })[:-1].encode("utf-8")
+        return head + b',"results":[' + b",".join(self._encoded[i] for i in page) + b"]}"
+
+    def tags_json(self, prefix: str = "", limit: Optional[int] = None) -> bytes:
+        """Return ``{"tags": [{"name", "count"}, ...]}``, most used first."""
+        prefix = prefix.upper()
+        tags = [{"name": t, "count": c} for t, c in self.tag_counts.items() if t.startswith(prefix)]
+        total = len(tags)
+        if limit is not None:
+            tags = tags[:limit]
+        return json.dumps({"total": total, "tags": tags}).encode("utf-8")
@@ -0,0 +1,229 @@
+"""Compact, sharded form of ``data.json`` for clients that load lazily.
+
+``data.json`` spells out ``"img"``, ``"question"``, ``"content"``, ``"thumb"``
+and ``"1.0"`` for every image, and a client has to parse all of it before it
+can show anything.  The payload written here stores the same data by column:
+
+``manifest.json``
+    ``{"version", "count", "shard_size", "tags": [name, ...],
+    "tag_counts": [n, ...], "shards": [file, ...]}``.  A tag's id is its
+    position in ``tags``.  This is all a client needs for the tag list.
+
+``shard-NNNNN-<hash>.json``
+    ``{"start", "img": [filename, ...], "thumb": [filename, ...],
+    "ntags": [n, ...], "tags": [id, ...]}`` for ``shard_size`` consecutive
+    images.  Image ``i`` of a shard carries the ``ntags[i]`` ids that follow
+    those of the images before it in ``tags``.
+
+Tag values in ``data.json`` are always ``"1.0"`` and are not stored.
+
+Shard names include a hash of their contents, so they can be cached forever;
+the manifest is replaced last (atomically).  Shards named by neither the new
+manifest nor the one it replaced are then removed; the previous generation is
+kept until the next write, so a client that loaded the old manifest just
+before the swap can still fetch its shards.  Entries are consumed one at a
+time, so writing a payload never holds more than one shard in memory.
+
+:func:`append_search_payload` extends an existing payload with new images:
+only the last, partly filled shard is rewritten and the others keep their
+names.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from data_writer import atomic_open
+from precompress import SUFFIXES
+
+PAYLOAD_VERSION = 1
+SHARD_SIZE = 5000
+MANIFEST_NAME = "manifest.json"
+SHARD_PATTERN = re.compile(r"shard-\d{5}-[0-9a-f]{16}\.json$")
+
+
+class PayloadResult(NamedTuple):
+    count: int
+    shards: List[str]
+    bytes_written: int
+
+
+def default_payload_dir(data_file: Path) -> Path:
+    """Return the payload directory the pipeline uses for ``data_file``."""
+    data_file = Path(data_file)
+    return data_file.with_name(data_file.stem + ".shards")
+
+
+def _dumps(value) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+class _ShardWriter:
+    def __init__(self, out_dir: Path, shard_size: int):
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self.tag_ids: Dict[str, int] = {}
+        self.tag_counts: List[int] = []
+        self.shards: List[str] = []
+        self.count = 0
+        self.bytes_written = 0
+        self._reset()
+
+    def resume(self, manifest: dict, last_shard: Optional[dict]) -> None:
+        """Continue the payload described by ``manifest``.
+
+        ``last_shard`` is its final shard if that is not yet full; it is
+        reopened and written again under a new name by the next flush.
+        """
+        self.tag_ids = {tag: i for i, tag in enumerate(manifest["tags"])}
+        self.tag_counts = list(manifest["tag_counts"])
+        self.shards = list(manifest["shards"])
+        self.count = manifest["count"]
+        if last_shard is not None:
+            self.shards.pop()
+            self.img = last_shard["img"]
+            self.thumb = last_shard["thumb"]
+            self.ntags = last_shard["ntags"]
+            self.tags = last_shard["tags"]
+
+    def _reset(self) -> None:
+        self.img: List[str] = []
+        self.thumb: List[str] = []
+        self.ntags: List[int] = []
+        self.tags: List[int] = []
+
+    def add(self, entry: dict) -> None:
+        content = entry.get("question", {}).get("content", {})
+        for tag in content:
+            tag_id = self.tag_ids.setdefault(tag, len(self.tag_ids))
+            if tag_id == len(self.tag_counts):
+                self.tag_counts.append(0)
+            self.tag_counts[tag_id] += 1
+            self.tags.append(tag_id)
+        self.ntags.append(len(content))
+        self.img.append(entry.get("img", {}).get("filename", ""))
+        self.thumb.append(entry.get("thumb", {}).get("filename", ""))
+        self.count += 1
+        if len(self.img) == self.shard_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.img:
+            return
+        data = _dumps({
+            "start": self.count - len(self.img),
+            "img": self.img, "thumb": self.thumb, "ntags": self.ntags, "tags": self.tags,
+        })
+        digest = hashlib.blake2s(data, digest_size=8).hexdigest()
+        name = f"shard-{len(self.shards):05d}-{digest}.json"
+        path = self.out_dir / name
+        if not path.exists():
+            with atomic_open(path) as f:
+                f.write(data)
+        self.shards.append(name)
+        self.bytes_written += len(data)
+        self._reset()
+
+
+def _manifest_shards(out_dir: Path) -> List[str]:
+    try:
+        with open(out_dir / MANIFEST_NAME, "r", encoding="utf-8") as f:
+            return list(json.load(f)["shards"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return []
+
+
+def _finish_payload(out_dir: Path, writer: _ShardWriter, shard_size: int) -> PayloadResult:
+    writer.flush()
+    previous = _manifest_shards(out_dir)
+    manifest = _dumps({
+        "version": PAYLOAD_VERSION,
+        "count": writer.count,
+        "shard_size": shard_size,
+        "tags": list(writer.tag_ids),
+        "tag_counts": writer.tag_counts,
+        "shards": writer.shards,
+    })
+    with atomic_open(out_dir / MANIFEST_NAME) as f:
+        f.write(manifest)
+
+    keep = set(writer.shards) | set(previous)
+    for path in out_dir.iterdir():
+        name = path.name
+        for suffix in SUFFIXES.values():
+            if name.endswith(suffix):
+                name = name[: -len(suffix)]
+                break
+        if SHARD_PATTERN.match(name) and name not in keep:
+            path.unlink(missing_ok=True)
+    return PayloadResult(writer.count, writer.shards, writer.bytes_written + len(manifest))
+
+
+def write_search_payload(out_dir: Path, entries: Iterable[dict], shard_size: int = SHARD_SIZE) -> PayloadResult:
+    """Write the manifest and shards for ``entries`` (any iterable) to ``out_dir``."""
+    if shard_size < 1:
+        raise ValueError("shard_size must be at least 1")
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    writer = _ShardWriter(out_dir, shard_size)
+    for entry in entries:
+        writer.add(entry)
+    return _finish_payload(out_dir, writer, shard_size)
+
+
+def append_search_payload(
+    out_dir: Path, entries: Iterable[dict], count: Optional[int] = None
+) -> Optional[PayloadResult]:
+    """Add ``entries`` to the end of the payload in ``out_dir``.
+
+    ``count`` is the number of entries the payload should already hold; one
+    holding any other number is out of date and is not extended.
+    ``bytes_written`` counts only what was written this time.  Returns None,
+    leaving the payload untouched, if there is no readable, up-to-date
+    payload of this version to extend; callers then write it in full.
+    """
+    out_dir = Path(out_dir)
+    try:
+        with open(out_dir / MANIFEST_NAME, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != PAYLOAD_VERSION:
+            return None
+        if count is not None and manifest["count"] != count:
+            return None
+        shard_size = manifest["shard_size"]
+        last_shard = None
+        if manifest["count"] % shard_size:
+            with open(out_dir / manifest["shards"][-1], "r", encoding="utf-8") as f:
+                last_shard = json.load(f)
+    except (OSError, ValueError, KeyError, IndexError):
+        return None
+    writer = _ShardWriter(out_dir, shard_size)
+    writer.resume(manifest, last_shard)
+    for entry in entries:
+        writer.add(entry)
+    return _finish_payload(out_dir, writer, shard_size)
+
+
+def read_search_payload(out_dir: Path) -> List[dict]:
+    """Rebuild ``data.json``-style entries from a payload directory."""
+    out_dir = Path(out_dir)
+    with open(out_dir / MANIFEST_NAME, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    tags = manifest["tags"]
+    entries = []
+    for name in manifest["shards"]:
+        with open(out_dir / name, "r", encoding="utf-8") as f:
+            shard = json.load(f)
+        pos = 0
+        for img, thumb, n in zip(shard["img"], shard["thumb"], shard["ntags"]):
+            entries.append({
+                "img": {"filename": img},
+                "question": {"content": {tags[t]: "1.0" for t in shard["tags"][pos:pos + n]}},
+                "thumb": {"filename": thumb},
+            })
+            pos += n
+    return entries
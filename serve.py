@@ -1,22 +1,445 @@
 #!/usr/bin/env python3
-"""Simple HTTP server for previewing the static site."""
+"""HTTP server for previewing the static site.
 
+Requests are handled on a thread each, over keep-alive (HTTP/1.1)
+connections.  Files are served with strong ``ETag`` and ``Last-Modified``
+validators, so revisits are answered with ``304 Not Modified``.  Search
+payload shards, whose names carry a hash of their contents, are marked
+immutable so browsers do not even revalidate them; everything else, including
+thumbnails (which keep their name when regenerated), must be revalidated on
+each use.
+
+Text responses (``data.json``, JS, CSS, templates) are compressed according
+to the client's ``Accept-Encoding``: an up-to-date ``.br``/``.gz`` sibling
+written by ``precompress.py`` is sent as is, anything else is compressed on
+the fly and kept in a small in-memory LRU.
+
+With ``--api`` the server also loads ``data.json`` into an inverted tag index
+(see ``search_index.py``) and answers ``/api/search?q=TAG+TAG&offset=&limit=``
+(entries carrying every tag, one page at a time) and ``/api/tags?prefix=&limit=``
+(tags with their image counts, most used first).  The index and ``data.json``
+itself, with every encoding precompressed, are then held in memory as one
+snapshot.  A background thread polls the file and, when it changes, builds a
+new snapshot and swaps it in; requests already running finish on the old one.
+"""
+
+import argparse
+import email.utils
 import http.server
-import socketserver
-import sys
+import io
+import json
 import os
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from functools import partial
+from http import HTTPStatus
 from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, List, NamedTuple, Optional
+
+from precompress import available_encodings, compress_bytes, fresh_sibling, sibling_path
+from search_payload import SHARD_PATTERN
+
+if TYPE_CHECKING:
+    from search_index import TagIndex
+
+DEFAULT_PORT = 8000
+
+# Search payload shard names carry a hash of their contents, so browsers keep
+# them without revalidating, while every other file (thumbnails, index.html,
+# data.json, ...) can change under the same name and is revalidated, costing
+# a 304 at most.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_CACHE_CONTROL = "no-cache"
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/xml", "image/svg+xml")
+# Files outside this range are sent uncompressed unless a sibling exists:
+# tiny ones gain nothing and huge ones should be precompressed instead.
+ON_THE_FLY_MIN_SIZE = 1024
+ON_THE_FLY_MAX_SIZE = 32 * 1024 * 1024
+COMPRESSION_CACHE_BYTES = 64 * 1024 * 1024
+API_PREFIX = "/api/"
+DEFAULT_POLL_INTERVAL = 2.0
+
+
+def file_etag(st: os.stat_result, encoding: Optional[str] = None) -> str:
+    """Return a strong ETag for a file with stat result ``st``.
+
+    Each content encoding is a different representation, so it gets its own
+    tag; all are derived from the source file so they change together.
+    """
+    suffix = f"-{encoding}" if encoding else ""
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}{suffix}"'
+
+
+def is_compressible(content_type: str) -> bool:
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def acceptable_encodings(accept_encoding: Optional[str], offered: List[str]) -> List[str]:
+    """Return the ``offered`` encodings the client accepts, best first.
+
+    Follows the ``Accept-Encoding`` q-values; ties keep the order of
+    ``offered`` (the server's preference).
+    """
+    if not accept_encoding:
+        return []
+    prefs = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        prefs[name.strip().lower()] = q
+    ranked = [(prefs.get(e, prefs.get("*", 0.0)), -i, e) for i, e in enumerate(offered)]
+    return [e for q, _, e in sorted(ranked, reverse=True) if q > 0]
+
+
+class CompressionCache:
+    """Thread-safe LRU of compressed response bodies, bounded by total size."""
+
+    def __init__(self, max_bytes: int = COMPRESSION_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, produce: Callable[[], bytes]) -> bytes:
+        """Return the cached bytes for ``key``, calling ``produce`` on a miss."""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                return data
+        # Compress outside the lock; two threads may race on the same key,
+        # which only wastes a little work.
+        data = produce()
+        if len(data) > self.max_bytes:
+            return data
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = data
+                self._size += len(data)
+                while self._size > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._size -= len(evicted)
+        return data
+
+
+def cache_control_for(path: str) -> str:
+    if SHARD_PATTERN.search(path):
+        return IMMUTABLE_CACHE_CONTROL
+    return DEFAULT_CACHE_CONTROL
+
+
+class DataSnapshot(NamedTuple):
+    path: str
+    stat: os.stat_result
+    index: "TagIndex"
+    # Response bodies by Content-Encoding; None is the file as is.
+    payload: Dict[Optional[str], bytes]
+
+
+def load_snapshot(data_file: Path) -> DataSnapshot:
+    """Read ``data_file`` once, index it and precompress it."""
+    # Imported here: search_index needs NumPy, which plain file serving (and
+    # run_pipeline, which imports this module) should not pay for.
+    from search_index import TagIndex
+
+    path = os.path.realpath(data_file)
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        raw = f.read()
+    index = TagIndex(json.loads(raw).get("questions", []))
+    payload = {None: raw}
+    for encoding in available_encodings():
+        payload[encoding] = compress_bytes(raw, encoding)
+    return DataSnapshot(path, st, index, payload)
+
+
+def _stat_key(st: os.stat_result) -> tuple:
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+class DataWatcher:
+    """Keeps a :class:`DataSnapshot` of ``data_file`` current.
+
+    Handlers read ``snapshot`` once per request and use that object
+    throughout, so a reload is a single attribute assignment and never mixes
+    old and new data within a response.
+    """
+
+    def __init__(self, data_file: Path, poll_interval: float = DEFAULT_POLL_INTERVAL):
+        self.data_file = Path(data_file)
+        self.poll_interval = poll_interval
+        self.snapshot: Optional[DataSnapshot] = None
+        self._seen: Optional[tuple] = None
+        self._stop = threading.Event()
+
+    def check(self) -> bool:
+        """Reload if the file changed since the last look; return True if it did."""
+        try:
+            key = _stat_key(os.stat(self.data_file))
+        except OSError:
+            return False
+        if key == self._seen:
+            return False
+        started = time.perf_counter()
+        try:
+            snapshot = load_snapshot(self.data_file)
+        except (OSError, ValueError, AttributeError) as e:
+            # Most likely caught mid-write: the write finishing changes the
+            # key again and triggers another attempt.
+            self._seen = key
+            print(f"Could not load {self.data_file}: {e}; keeping the previous snapshot")
+            return False
+        # The key of what was actually read, so a write racing the read is
+        # picked up on the next poll.
+        self._seen = _stat_key(snapshot.stat)
+        self.snapshot = snapshot
+        index = snapshot.index
+        sizes = ", ".join(f"{e or 'identity'} {len(b) / 1024:.0f} KB" for e, b in snapshot.payload.items())
+        print(
+            f"Loaded {self.data_file} in {time.perf_counter() - started:.2f}s: {len(index)} entries, "
+            f"{len(index.tag_counts)} tags, {index.postings_size} postings; {sizes}"
+        )
+        return True
+
+    def start(self) -> None:
+        """Poll the file every ``poll_interval`` seconds on a daemon thread."""
+        threading.Thread(target=self._run, name="data-watcher", daemon=True).start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            self.check()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+class CachingRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """``SimpleHTTPRequestHandler`` with cache validators, keep-alive and compression."""
+
+    protocol_version = "HTTP/1.1"
+
+    def __init__(
+        self, *args, compression_cache: Optional[CompressionCache] = None,
+        data_watcher: Optional[DataWatcher] = None, **kwargs,
+    ):
+        self.compression_cache = compression_cache if compression_cache is not None else CompressionCache()
+        self.data_watcher = data_watcher
+        super().__init__(*args, **kwargs)
+
+    def _not_modified(self, etag: str, st: os.stat_result) -> bool:
+        """Return True if the request's conditional headers match the file."""
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            # If-None-Match takes precedence over If-Modified-Since.
+            tags = [t.strip() for t in if_none_match.split(",")]
+            return "*" in tags or etag in tags or f"W/{etag}" in tags
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since is not None:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since)
+            except (TypeError, IndexError, OverflowError, ValueError):
+                return False
+            return int(st.st_mtime) <= since.timestamp()
+        return False
+
+    def send_head(self):
+        snapshot = self.data_watcher.snapshot if self.data_watcher is not None else None
+        if self.data_watcher is not None and self.path.startswith(API_PREFIX):
+            return self._send_api(snapshot)
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            index = os.path.join(path, "index.html")
+            if not path.endswith("/") or not os.path.isfile(index):
+                # Trailing-slash redirects and directory listings.
+                return super().send_head()
+            path = index
+        elif path.endswith("/"):
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return None
+        if snapshot is not None and os.path.realpath(path) == snapshot.path:
+            st = snapshot.stat
+        else:
+            snapshot = None
+            try:
+                st = os.stat(path)
+            except OSError:
+                self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+                return None
+
+        ctype = self.guess_type(path)
+        headers = {
+            "Content-Type": ctype,
+            "Last-Modified": self.date_time_string(st.st_mtime),
+            "Cache-Control": cache_control_for(path),
+        }
+        encoding, sibling = None, None
+        if is_compressible(ctype):
+            headers["Vary"] = "Accept-Encoding"
+            accepted = acceptable_encodings(self.headers.get("Accept-Encoding"), available_encodings())
+            if snapshot is not None:
+                encoding = next((e for e in accepted if e in snapshot.payload), None)
+                accepted = []
+            for candidate in accepted:
+                sibling = fresh_sibling(path, candidate, st.st_mtime_ns)
+                if sibling is not None:
+                    encoding = candidate
+                    break
+            else:
+                if snapshot is None and accepted and ON_THE_FLY_MIN_SIZE <= st.st_size <= ON_THE_FLY_MAX_SIZE:
+                    encoding = accepted[0]
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        headers["ETag"] = file_etag(st, encoding)
+
+        if self._not_modified(headers["ETag"], st):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            for name, value in headers.items():
+                if name != "Content-Type":
+                    self.send_header(name, value)
+            self.end_headers()
+            return None
+
+        try:
+            if snapshot is not None:
+                data = snapshot.payload[encoding]
+                body, length = io.BytesIO(data), len(data)
+            elif encoding is None:
+                body = open(path, "rb")
+                length = os.fstat(body.fileno()).st_size
+            elif sibling is not None:
+                body = open(sibling_path(path, encoding), "rb")
+                length = os.fstat(body.fileno()).st_size
+            else:
+                data = self.compression_cache.get(
+                    (path, st.st_size, st.st_mtime_ns, encoding),
+                    lambda: compress_bytes(self._read(path), encoding),
+                )
+                body, length = io.BytesIO(data), len(data)
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return None
+
+        self.send_response(HTTPStatus.OK)
+        headers["Content-Length"] = str(length)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        return body
+
+    @staticmethod
+    def _read(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    def _send_api(self, snapshot: Optional[DataSnapshot]):
+        if snapshot is None:
+            self.send_error(HTTPStatus.SERVICE_UNAVAILABLE, "The data file has not been loaded")
+            return None
+        # Loaded by load_snapshot() already; see there.
+        from search_index import DEFAULT_LIMIT, MAX_LIMIT
+
+        url = urllib.parse.urlsplit(self.path)
+        params = {k: v[-1] for k, v in urllib.parse.parse_qs(url.query).items()}
+        try:
+            offset = max(0, int(params.get("offset", 0)))
+            limit = min(max(0, int(params.get("limit", DEFAULT_LIMIT))), MAX_LIMIT)
+        except ValueError:
+            self.send_error(HTTPStatus.BAD_REQUEST, "offset and limit must be integers")
+            return None
+        if url.path == API_PREFIX + "search":
+            data = snapshot.index.search_json(params.get("q", ""), offset, limit)
+        elif url.path == API_PREFIX + "tags":
+            data = snapshot.index.tags_json(params.get("prefix", ""), limit if "limit" in params else None)
+        else:
+            self.send_error(HTTPStatus.NOT_FOUND, "Unknown API endpoint")
+            return None
+
+        headers = {
+            "Content-Type": "application/json",
+            "Cache-Control": DEFAULT_CACHE_CONTROL,
+            "Vary": "Accept-Encoding",
+        }
+        if len(data) >= ON_THE_FLY_MIN_SIZE:
+            accepted = acceptable_encodings(self.headers.get("Accept-Encoding"), available_encodings())
+            if accepted:
+                data = compress_bytes(data, accepted[0])
+                headers["Content-Encoding"] = accepted[0]
+        headers["Content-Length"] = str(len(data))
+        self.send_response(HTTPStatus.OK)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        return io.BytesIO(data)
+
+
+def make_server(
+    port: int = DEFAULT_PORT, directory: Path = Path("."), data_file: Optional[Path] = None,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+) -> http.server.ThreadingHTTPServer:
+    """Return a threaded server for ``directory`` bound to ``port`` (not started).
+
+    If ``data_file`` is given it is loaded into a snapshot and the ``/api/``
+    endpoints are enabled.  The server's ``data_watcher`` reloads it; with a
+    positive ``poll_interval`` it is already polling on a background thread.
+    """
+    data_watcher = None
+    if data_file is not None:
+        data_watcher = DataWatcher(data_file, poll_interval)
+        data_watcher.check()
+        if poll_interval > 0:
+            data_watcher.start()
+    handler = partial(
+        CachingRequestHandler, directory=str(directory),
+        compression_cache=CompressionCache(), data_watcher=data_watcher,
+    )
+    server = http.server.ThreadingHTTPServer(("", port), handler)
+    # Keep-alive connections hold a thread each; don't let them block exit.
+    server.daemon_threads = True
+    server.data_watcher = data_watcher
+    return server
+
+
+def serve(
+    port: int = DEFAULT_PORT, directory: Path = Path("."), data_file: Optional[Path] = None,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+):
+    """Serve ``directory`` on ``port`` until interrupted."""
+    with make_server(port, directory, data_file, poll_interval) as httpd:
+        print(f"Serving {Path(directory).resolve()} on http://localhost:{httpd.server_address[1]}")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            print("\nServer stopped.")
+        finally:
+            if httpd.data_watcher is not None:
+                httpd.data_watcher.stop()
 
 
 def main():
-    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
-    directory = Path(sys.argv[2]) if len(sys.argv) > 2 else Path('.')
-    os.chdir(directory)
-
-    handler = http.server.SimpleHTTPRequestHandler
-    with socketserver.TCPServer(('', port), handler) as httpd:
-        print(f"Serving {directory.resolve()} on http://localhost:{port}")
-        httpd.serve_forever()
+    parser = argparse.ArgumentParser(description="Serve the image search site locally.")
+    parser.add_argument("port", nargs="?", type=int, default=DEFAULT_PORT, help=f"port to listen on (default {DEFAULT_PORT})")
+    parser.add_argument("directory", nargs="?", type=Path, default=Path("."), help="directory to serve (default: current)")
+    parser.add_argument("--api", action="store_true", help="serve /api/search and /api/tags from an in-memory index of the data file")
+    parser.add_argument("--data_file", type=Path, help="data file for --api (default: DIRECTORY/data.json)")
+    parser.add_argument(
+        "--poll", type=float, default=DEFAULT_POLL_INTERVAL, metavar="SECONDS",
+        help=f"with --api, check the data file for changes this often; 0 disables reloading (default {DEFAULT_POLL_INTERVAL:g})",
+    )
+    args = parser.parse_args()
+    data_file = None
+    if args.api:
+        data_file = args.data_file or args.directory / "data.json"
+    serve(args.port, args.directory, data_file, args.poll)
 
 
 if __name__ == '__main__':
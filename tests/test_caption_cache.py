@@ -0,0 +1,38 @@
+from pathlib import Path
+import os
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from caption_cache import CaptionCache, default_cache_path
+
+
+def test_cache_roundtrip_and_content_keying(tmp_path: Path):
+    a = tmp_path / "one" / "IMG_1.JPG"
+    b = tmp_path / "two" / "IMG_1.JPG"
+    a.parent.mkdir()
+    b.parent.mkdir()
+    a.write_bytes(b"first image")
+    b.write_bytes(b"second image")
+
+    db = default_cache_path(tmp_path / "data.json")
+    assert db.name == "data.cache.sqlite"
+
+    with CaptionCache(db) as cache:
+        key_a = cache.file_key(a)
+        key_b = cache.file_key(b)
+        assert key_a != key_b
+        assert cache.get(key_a) is None
+        cache.put(key_a, "a dog on a beach", ["BEACH", "DOG"])
+
+    with CaptionCache(db) as cache:
+        assert cache.get(cache.file_key(a)) == ("a dog on a beach", ["BEACH", "DOG"])
+        assert cache.get(cache.file_key(b)) is None
+        assert not cache.changed_since_cached(a)
+
+        a.write_bytes(b"edited image")
+        st = a.stat()
+        os.utime(a, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+        assert cache.changed_since_cached(a)
+        assert cache.file_key(a) != key_a
+        assert cache.hits == 1
+        assert cache.misses == 1
@@ -0,0 +1,87 @@
+from pathlib import Path
+import json
+import sys
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from caption_client import CaptionClient, CaptionResult
+from caption_server import CaptionServer
+from offline_tags import CaptioningResources, process_folder
+
+
+class _StemCaptioner:
+    """Captions each image with its file name, so no model is needed."""
+
+    def caption(self, paths):
+        for path in paths:
+            if path.exists():
+                yield CaptionResult(path, f"a photo of {path.stem}", [path.stem.upper()], None)
+            else:
+                yield CaptionResult(path, None, None, f"{path} not found")
+
+    def tags(self, captions, batch_size=256):
+        return [[caption.split()[-1].upper()] for caption in captions]
+
+
+@pytest.fixture
+def server():
+    server = CaptionServer(("127.0.0.1", 0), _StemCaptioner())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_client_round_trips_jobs_through_the_queue(server, tmp_path: Path):
+    (tmp_path / "cat.jpg").write_bytes(b"")
+    client = CaptionClient.connect(server)
+    assert client is not None and client.health()["status"] == "ok"
+    results = list(client.caption([tmp_path / "cat.jpg", tmp_path / "gone.jpg"]))
+    assert results[0] == CaptionResult(tmp_path / "cat.jpg", "a photo of cat", ["CAT"], None)
+    assert results[1].caption is None and "not found" in results[1].error
+    assert client.tags(["a photo of a dog"]) == [["DOG"]]
+    assert client.health()["jobs"] == 2
+
+    request = urllib.request.Request(server + "/caption", data=b'{"paths": "x"}')
+    with pytest.raises(urllib.error.HTTPError) as e:
+        urllib.request.urlopen(request, timeout=5)
+    assert e.value.code == 400 and "paths" in json.loads(e.value.read())["error"]
+
+
+def test_process_folder_captions_through_a_running_server(server, tmp_path: Path):
+    folder = tmp_path / "photos"
+    folder.mkdir()
+    for name in ("apple.jpg", "tree.jpg"):
+        (folder / name).write_bytes(b"")
+    data_file = tmp_path / "data.json"
+    resources = CaptioningResources(server)
+    process_folder(str(folder), data_file=data_file, thumb_dir=tmp_path / "thumbs", resources=resources)
+    assert not resources.loaded
+    data = json.loads(data_file.read_text())
+    assert data["tag_counts"] == {"APPLE": 1, "TREE": 1}
+
+    assert CaptionClient.connect("http://127.0.0.1:9") is None
+
+
+def test_add_run_only_hashes_images_it_captions(server, tmp_path: Path, monkeypatch):
+    import caption_cache
+
+    folder = tmp_path / "photos"
+    folder.mkdir()
+    for name in ("apple.jpg", "tree.jpg"):
+        (folder / name).write_bytes(name.encode())
+    options = dict(data_file=tmp_path / "data.json", thumb_dir=tmp_path / "thumbs", resources=CaptioningResources(server))
+    process_folder(str(folder), use_cache=False, **options)
+
+    hashed = []
+    hash_file = caption_cache.hash_file
+    monkeypatch.setattr(caption_cache, "hash_file", lambda path: hashed.append(path.name) or hash_file(path))
+    (folder / "dog.jpg").write_bytes(b"dog")
+    process_folder(str(folder), add=True, **options)
+    assert hashed == ["dog.jpg"]
+    assert json.loads((tmp_path / "data.json").read_text())["tag_counts"] == {"APPLE": 1, "TREE": 1, "DOG": 1}
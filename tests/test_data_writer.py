@@ -0,0 +1,54 @@
+from pathlib import Path
+import json
+import sys
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from data_writer import append_data_file, write_data_file
+
+
+def _entry(name, tags):
+    return {
+        "img": {"filename": f"{name}.JPG"},
+        "question": {"content": {t: "1.0" for t in tags}},
+        "thumb": {"filename": f"{name}.THUMB.JPG"},
+    }
+
+
+@pytest.mark.parametrize("indent", [None, 4])
+def test_streamed_output_matches_json_dump_and_appends_in_place(tmp_path: Path, indent):
+    path = tmp_path / "data.json"
+    entries = [_entry("A", ["CAT", "TREE"]), _entry("B", ["TREE"])]
+    result = write_data_file(path, iter(entries), indent)
+    expected = {"questions": entries, "tag_counts": {"CAT": 1, "TREE": 2}}
+    separators = (",", ":") if indent is None else None
+    assert path.read_text() == json.dumps(expected, indent=indent, separators=separators)
+    assert result.entries == 2 and not (tmp_path / "data.json.tmp").exists()
+
+    result = append_data_file(path, [_entry("C", ["DOG"])], indent)
+    assert result.entries == 1 and result.tag_counts == {"CAT": 1, "TREE": 2, "DOG": 1}
+    expected = {"questions": entries + [_entry("C", ["DOG"])], "tag_counts": result.tag_counts}
+    assert path.read_text() == json.dumps(expected, indent=indent, separators=separators)
+
+    write_data_file(path, [], indent)
+    append_data_file(path, [_entry("D", ["OWL"])], indent)
+    assert json.loads(path.read_text()) == {"questions": [_entry("D", ["OWL"])], "tag_counts": {"OWL": 1}}
+
+
+def test_failed_write_leaves_previous_file(tmp_path: Path):
+    path = tmp_path / "data.json"
+    write_data_file(path, [_entry("A", ["CAT"])])
+    before = path.read_bytes()
+
+    def entries():
+        yield _entry("B", ["DOG"])
+        raise RuntimeError("interrupted")
+
+    with pytest.raises(RuntimeError):
+        write_data_file(path, entries())
+    assert path.read_bytes() == before and not (tmp_path / "data.json.tmp").exists()
+
+    assert append_data_file(tmp_path / "missing.json", [_entry("B", ["DOG"])]) is None
+    (tmp_path / "old.json").write_text('{"questions": []}')
+    assert append_data_file(tmp_path / "old.json", [_entry("B", ["DOG"])]) is None
@@ -0,0 +1,99 @@
+from pathlib import Path
+import json
+import os
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from data_writer import write_data_file
+from entry_store import EntryStore, refresh_payloads, write_site_data
+from search_payload import read_search_payload
+
+
+def _entry(name, tags, folder="F"):
+    return {
+        "img": {"filename": f"{name}.JPG"},
+        "question": {"content": {t: "1.0" for t in tags}},
+        "thumb": {"filename": f"{folder}_{name}.THUMB.JPG"},
+    }
+
+
+def test_updates_keep_tag_counts_and_compact_like_a_full_rewrite(tmp_path: Path):
+    data_file = tmp_path / "data.json"
+    with EntryStore(tmp_path / "data.entries.sqlite") as store:
+        for entry in [_entry("A", ["CAT", "TREE"]), _entry("B", ["TREE"]), _entry("B", ["DOG"], "G")]:
+            store.put(entry)
+        # Re-tagging keeps the rows of tags that stay, and so their order.
+        store.put(_entry("A", ["TREE", "CAT"]))
+        assert list(store.tag_counts()) == ["CAT", "TREE", "DOG"]
+        assert store.put(_entry("A", ["OWL"])) is True
+        assert store.delete_ids(["F_B.THUMB.JPG", "G_B.THUMB.JPG", "missing"]) == 2
+        assert store.tag_counts() == {"OWL": 1}
+        store.put(_entry("C", ["OWL", "DOG"]))
+
+        expected = tmp_path / "expected.json"
+        write_data_file(expected, [_entry("A", ["OWL"]), _entry("C", ["OWL", "DOG"])])
+        write_site_data(store, data_file)
+        assert data_file.read_bytes() == expected.read_bytes()
+        assert store.is_synced(data_file) and not store.dirty
+        assert (tmp_path / "data.index.json").exists()
+
+        # Pure additions go on the end of the existing file and payload; the
+        # index is dropped until the next compaction.
+        new = [_entry("D", ["CAT"])]
+        store.put(new[0])
+        assert write_site_data(store, data_file, appended=new).tag_counts == {"OWL": 2, "DOG": 1, "CAT": 1}
+        assert [e["img"]["filename"] for e in json.loads(data_file.read_text())["questions"]] == ["A.JPG", "C.JPG", "D.JPG"]
+        assert read_search_payload(tmp_path / "data.shards") == list(store.iter_entries())
+        assert not (tmp_path / "data.index.json").exists()
+        write_site_data(store, data_file, payloads=True)
+        assert (tmp_path / "data.index.json").exists()
+
+
+def test_payloads_deferred_and_never_rebuilt_are_rebuilt_by_the_next_write(tmp_path: Path):
+    data_file = tmp_path / "data.json"
+    with EntryStore(tmp_path / "data.entries.sqlite") as store:
+        store.put(_entry("A", ["CAT"]))
+        store.put(_entry("B", ["DOG"]))
+        write_site_data(store, data_file)
+        assert not store.payloads_stale
+
+        # A watch batch that swaps one image for another and dies before its
+        # payload rebuild: the payload still holds the right number of images.
+        store.delete_ids(["F_A.THUMB.JPG"])
+        store.put(_entry("C", ["OWL"]))
+        write_site_data(store, data_file, payloads=False)
+        assert store.payloads_stale
+
+    with EntryStore(tmp_path / "data.entries.sqlite") as store:
+        assert store.is_synced(data_file) and store.payloads_stale
+        new = [_entry("D", ["CAT"])]
+        store.put(new[0])
+        write_site_data(store, data_file, appended=new)
+        assert read_search_payload(tmp_path / "data.shards") == list(store.iter_entries())
+        assert not store.payloads_stale
+
+        write_site_data(store, data_file, payloads=False)
+    refresh_payloads(data_file)
+    with EntryStore(tmp_path / "data.entries.sqlite") as store:
+        assert not store.payloads_stale
+
+
+def test_sync_from_reimports_a_data_file_replaced_elsewhere(tmp_path: Path):
+    data_file = tmp_path / "data.json"
+    write_data_file(data_file, [_entry("A", ["CAT"]), _entry("B", ["CAT"])])
+    with EntryStore(tmp_path / "store.sqlite") as store:
+        assert store.sync_from(data_file) is True
+        assert store.sync_from(data_file) is False
+        assert len(store) == 2 and store.tag_counts() == {"CAT": 2}
+
+        write_data_file(data_file, [_entry("Z", ["DOG"])])
+        os.utime(data_file, ns=(1, 1))
+        assert store.sync_from(data_file) is True
+        assert store.ids() == {"F_Z.THUMB.JPG"}
+
+        # Changes that were never written out win over an outside edit.
+        store.put(_entry("Y", ["OWL"]))
+        write_data_file(data_file, [])
+        os.utime(data_file, ns=(2, 2))
+        assert store.sync_from(data_file) is False
+        assert store.ids() == {"F_Z.THUMB.JPG", "F_Y.THUMB.JPG"}
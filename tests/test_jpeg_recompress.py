@@ -1,10 +1,21 @@
+from io import BytesIO
+import json
+import math
 from pathlib import Path
 import sys
 
+import numpy as np
 from PIL import Image
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
-from jpeg_recompress import recompress
+from jpeg_recompress import (
+    SEARCH_STRATEGIES,
+    _smallfry_aae_factor,
+    _smallfry_aae_factor_reference,
+    batch_recompress,
+    recompress,
+    recompress_image,
+)
 
 def test_recompress_basic(tmp_path: Path):
     # Create a simple test image
@@ -30,3 +41,145 @@ def test_recompress_basic(tmp_path: Path):
     assert rc in (0, 1)
     # Ensure file contains JPEG data
     assert outfile.read_bytes().startswith(b"\xFF\xD8")
+
+
+def _jpeg_roundtrip(arr: np.ndarray, quality: int) -> np.ndarray:
+    buf = BytesIO()
+    Image.fromarray(arr).save(buf, format="JPEG", quality=quality)
+    return np.asarray(Image.open(buf).convert("L"))
+
+
+def test_smallfry_aae_vectorized_matches_reference():
+    rng = np.random.default_rng(42)
+    # Widths of the form 8k + 1 are skipped: the reference loop indexes past
+    # the end of the row there.
+    for height, width in [(3, 5), (8, 8), (16, 24), (31, 62), (64, 48), (256, 256), (301, 203)]:
+        orig = rng.integers(0, 256, size=(height, width), dtype=np.uint8)
+        for quality in (20, 75):
+            comp = _jpeg_roundtrip(orig, quality)
+            for maxv in (int(orig.max()), 100):
+                expected = _smallfry_aae_factor_reference(orig, comp, maxv)
+                assert _smallfry_aae_factor(orig, comp, maxv) == expected
+
+
+def test_smallfry_aae_vectorized_handles_8k_plus_1_width():
+    orig = np.full((16, 17), 128, dtype=np.uint8)
+    comp = orig.copy()
+    comp[:, 8] = 120
+    assert 0.0 <= _smallfry_aae_factor(orig, comp, 128) <= 1.0
+
+
+def test_recompress_image_accepts_pil_image_and_bytes():
+    rng = np.random.default_rng(3)
+    arr = np.clip(np.add.outer(np.arange(64), np.arange(64)) * 2 + rng.normal(0, 8, (64, 64)), 0, 255)
+    img = Image.fromarray(arr.astype(np.uint8)).convert("RGB")
+
+    result = recompress_image(img, method="smallfry", preset="low", jpeg_max=98, quiet=True)
+    assert result.data.startswith(b"\xFF\xD8")
+    assert not result.copied
+    assert 40 <= result.quality <= 98
+
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=98)
+    from_bytes = recompress_image(buf.getvalue(), method="smallfry", preset="low", quiet=True)
+    assert from_bytes.copied or len(from_bytes.data) < len(buf.getvalue())
+
+
+def test_baseline_candidates_skip_huffman_optimisation_until_the_final_encode():
+    rng = np.random.default_rng(5)
+    arr = np.clip(np.add.outer(np.arange(64), np.arange(64)) * 2 + rng.normal(0, 8, (64, 64)), 0, 255)
+    img = Image.fromarray(arr.astype(np.uint8)).convert("RGB")
+    options = dict(method="smallfry", preset="low", jpeg_max=98, progressive=False, quiet=True)
+
+    fast = recompress_image(img, **options)
+    slow = recompress_image(img, accurate=True, **options)
+    assert fast.data == slow.data and fast.quality == slow.quality
+    assert fast.encodes == slow.encodes + 1
+    unoptimised = BytesIO()
+    img.save(unoptimised, format="JPEG", quality=fast.quality, progressive=False)
+    assert len(fast.data) < len(unoptimised.getvalue())
+
+
+def _counting(metric):
+    calls = []
+
+    def evaluate(q):
+        calls.append(q)
+        return metric(q)
+
+    return evaluate, calls
+
+
+def test_search_strategies_find_lowest_passing_quality():
+    # A convex, increasing curve like the real metrics, crossing 100 at q=87.
+    def metric(q):
+        return 90 + 10 * ((q - 40) / 47) ** 3
+
+    for strategy, search in SEARCH_STRATEGIES.items():
+        evaluate, calls = _counting(metric)
+        assert search(evaluate, 40, 98, 100.0, 8) == 87, strategy
+        assert len(calls) == len(set(calls)) <= 8
+        evaluate, calls = _counting(metric)
+        assert search(evaluate, 40, 98, 200.0, 8) is None, strategy
+
+
+def test_interpolation_search_beats_bisection_without_a_hint():
+    # Real metrics are close to linear in the log of the quantiser scale.
+    def metric(q):
+        return 80 - 4 * math.log(5000 / q if q < 50 else 200 - 2 * q)
+
+    bisected, bisect_calls = _counting(metric)
+    assert SEARCH_STRATEGIES["bisect"](bisected, 40, 98, 69.0, 8) == 93
+    evaluate, calls = _counting(metric)
+    assert SEARCH_STRATEGIES["interpolate"](evaluate, 40, 98, 69.0, 8) == 93
+    assert calls == [69, 98, 93, 92] and len(bisect_calls) == 6
+
+
+def test_interpolation_search_uses_start_hint():
+    def metric(q):
+        return 90 + 10 * ((q - 40) / 47) ** 3
+
+    evaluate, calls = _counting(metric)
+    assert SEARCH_STRATEGIES["interpolate"](evaluate, 40, 98, 100.0, 8, start=87) == 87
+    assert calls == [87, 86]
+    # A poor hint still resolves the answer within the budget.
+    evaluate, calls = _counting(metric)
+    assert SEARCH_STRATEGIES["interpolate"](evaluate, 40, 98, 100.0, 8, start=45) == 87
+
+
+def test_batch_recompress_skips_up_to_date_files(tmp_path: Path):
+    rng = np.random.default_rng(5)
+    src_dir = tmp_path / "thumbs"
+    src_dir.mkdir()
+    for i in range(3):
+        arr = np.clip(rng.normal(128, 30 + 10 * i, (48, 48, 3)), 0, 255).astype(np.uint8)
+        Image.fromarray(arr).save(src_dir / f"img{i}.THUMB.JPG", quality=98)
+    (src_dir / "notes.txt").write_text("not an image")
+    summary = tmp_path / "summary.jsonl"
+    options = dict(method="smallfry", preset="low", jpeg_max=98, quiet=True)
+
+    first = batch_recompress([str(src_dir)], summary_path=summary, **options)
+    assert sorted(Path(r["path"]).name for r in first) == [f"img{i}.THUMB.JPG" for i in range(3)]
+    assert {r["status"] for r in first} <= {"recompressed", "kept"}
+    lines = [json.loads(line) for line in summary.read_text().splitlines()]
+    assert len(lines) == 3 and all("bytes_saved" in r and "seconds" in r for r in lines)
+
+    second = batch_recompress([str(src_dir / "*.JPG")], summary_path=summary, **options)
+    assert [r["status"] for r in second] == ["skipped"] * 3
+
+    out_dir = tmp_path / "out"
+    third = batch_recompress([str(src_dir)], out_dir=out_dir, force=True, **options)
+    assert all((out_dir / Path(r["path"]).name).exists() for r in third)
+    assert [r["status"] for r in batch_recompress([str(src_dir)], out_dir=out_dir, **options)] == ["skipped"] * 3
+
+
+def test_recompress_image_window_falls_back_outside_prediction():
+    rng = np.random.default_rng(9)
+    arr = np.clip(rng.normal(128, 40, (64, 64, 3)), 0, 255).astype(np.uint8)
+    img = Image.fromarray(arr)
+    options = dict(method="smallfry", preset="low", jpeg_max=98, loops=8, keep_metadata=False, quiet=True)
+
+    full = recompress_image(img, **options)
+    for window in ((40, 45), (96, 98), (full.quality - 2, full.quality + 2)):
+        guided = recompress_image(img, start=sum(window) // 2, window=window, **options)
+        assert guided.quality == full.quality, window
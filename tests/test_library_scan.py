@@ -0,0 +1,57 @@
+from pathlib import Path
+import os
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from library_scan import load_or_scan, read_manifest, refresh_scan, scan_library
+from thumb_utils import generate_thumb_filename
+
+
+def _make_tree(root: Path):
+    (root / "sub dir").mkdir(parents=True)
+    for rel in ("a.JPG", "b.png", "notes.txt", "sub dir/c.jpeg", "sub dir/d.Jpg"):
+        (root / rel).write_bytes(b"x")
+
+
+def test_scan_matches_thumb_names(tmp_path: Path):
+    _make_tree(tmp_path)
+
+    flat = scan_library(tmp_path, recurse=False)
+    assert [e.path.name for e in flat] == ["a.JPG", "b.png"]
+
+    deep = scan_library(tmp_path, recurse=True)
+    assert [e.path.name for e in deep] == ["a.JPG", "b.png", "c.jpeg", "d.Jpg"]
+    for e in deep:
+        assert e.thumb == generate_thumb_filename(e.path)
+        assert e.size == 1
+
+
+def test_manifest_roundtrip_mismatch_and_refresh(tmp_path: Path):
+    src = tmp_path / "src"
+    _make_tree(src)
+    hour_ago = time.time_ns() - 3600 * 10**9
+    for directory in (src, src / "sub dir"):
+        os.utime(directory, ns=(hour_ago, hour_ago))
+    manifest = tmp_path / "data.manifest.jsonl"
+
+    entries = load_or_scan(src, True, manifest)
+    assert manifest.exists()
+    scan = read_manifest(manifest, src, True)
+    assert scan.entries == entries
+    assert set(scan.dirs) == {str(src.resolve()), str((src / "sub dir").resolve())}
+    assert read_manifest(manifest, src, False) is None
+    assert refresh_scan(scan, True) == (scan, 0)
+
+    # Only the directories that changed are rescanned; new ones are walked.
+    (src / "sub dir" / "d.Jpg").unlink()
+    (src / "new").mkdir()
+    (src / "new" / "e.png").write_bytes(b"x")
+    refreshed, rescanned = refresh_scan(scan, True)
+    assert rescanned == 2 and refreshed.entries == scan_library(src, True)
+    assert load_or_scan(src, True, manifest) == refreshed.entries
+    assert read_manifest(manifest, src, True).entries == refreshed.entries
+
+    (src / "sub dir" / "c.jpeg").unlink()
+    (src / "sub dir").rmdir()
+    assert [e.path.name for e in load_or_scan(src, True, manifest)] == ["a.JPG", "b.png", "e.png"]
@@ -0,0 +1,45 @@
+from pathlib import Path
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from library_watch import LibraryWatcher
+
+
+def _write(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    ns = time.time_ns() - 60 * 10**9
+    os.utime(path, ns=(ns, ns))
+
+
+def _next(watcher: LibraryWatcher):
+    stop = threading.Event()
+    timer = threading.Timer(10, stop.set)
+    timer.start()
+    try:
+        changes = watcher.next_changes(stop)
+    finally:
+        timer.cancel()
+    assert changes is not None, "timed out waiting for changes"
+    return [[e.path.name for e in group] for group in changes]
+
+
+@pytest.mark.parametrize("poll_interval", [0.05, None], ids=["polling", "inotify"])
+def test_reports_added_modified_and_deleted_images(tmp_path: Path, poll_interval):
+    _write(tmp_path / "a.jpg", b"a")
+    _write(tmp_path / "notes.txt", b"")
+    with LibraryWatcher(tmp_path, recurse=True, debounce=0.1, poll_interval=poll_interval) as watcher:
+        if poll_interval is None and watcher.mode != "inotify":
+            pytest.skip("inotify is not available")
+        _write(tmp_path / "sub" / "b.png", b"b")
+        _write(tmp_path / "a.jpg", b"changed")
+        assert _next(watcher) == [["b.png"], ["a.jpg"], []]
+
+        (tmp_path / "a.jpg").unlink()
+        (tmp_path / "sub" / "b.png").rename(tmp_path / "b.png")
+        assert _next(watcher) == [["b.png"], [], ["a.jpg", "b.png"]]
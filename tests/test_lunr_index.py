@@ -0,0 +1,98 @@
+from pathlib import Path
+import json
+import shutil
+import subprocess
+import sys
+import zlib
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+from lunr_index import ID_SEED, app_documents, build_index, data_fingerprint, murmurhash3_32, stem, write_index
+
+
+def _entries():
+    names = ["IMG_1.JPG", "Café 7.jpg", "yard-party.JPG", "IMG_1.JPG.JPG"]
+    tags = [["APPLE", "TREES"], ["CATS", "RUNNING", "THE"], ["YELLOW", "PARTIES", "2023"], ["APPLE"]]
+    return [
+        {"img": {"filename": n}, "question": {"content": {t: "1.0" for t in ts}}, "thumb": {"filename": "t.JPG"}}
+        for n, ts in zip(names, tags)
+    ]
+
+
+def test_stemmer_and_ids_match_the_browser():
+    assert [stem(w) for w in ["caresses", "ponies", "agreed", "hopping", "relational", "yellow", "running", "generalization"]] == [
+        "caress", "poni", "agre", "hop", "relat", "yellow", "run", "gener"
+    ]
+    # Values from app.js's murmurhash3_32_gc.
+    assert [murmurhash3_32(k, ID_SEED) for k in ["IMG_1.JPG", "Café 7.jpg", "abc"]] == [2821135720, 806496154, 2599784193]
+
+
+def test_index_structure(tmp_path: Path):
+    index = build_index(app_documents(_entries()))
+    assert index["fields"] == ["title", "searchTerms", "tags"] and index["pipeline"] == ["trimmer", "stopWordFilter", "stemmer"]
+    store = index["documentStore"]
+    assert store["length"] == 4 and store["save"] is False
+    ref = murmurhash3_32("Café 7.jpg", ID_SEED)
+    # "the" is a stop word.
+    assert store["docInfo"][ref]["searchTerms"] == 2
+    root = index["index"]["searchTerms"]["root"]
+    appl = root["a"]["p"]["p"]["l"]
+    assert appl["df"] == 2 and set(appl["docs"]) == {murmurhash3_32("IMG_1.JPG", ID_SEED), murmurhash3_32("IMG_1.JPG.JPG", ID_SEED)}
+
+    counts = {"APPLE": 2, "TREES": 1, "CATS": 1, "RUNNING": 1, "THE": 1, "YELLOW": 1, "PARTIES": 1, "2023": 1}
+    assert list(app_documents(iter(_entries()), counts)) == list(app_documents(_entries()))
+    size = write_index(tmp_path / "data.index.json", _entries())
+    assert size == (tmp_path / "data.index.json").stat().st_size
+    assert "data" not in json.loads((tmp_path / "data.index.json").read_text())
+
+    data = tmp_path / "data.json"
+    data.write_text(json.dumps({"questions": _entries()}))
+    write_index(tmp_path / "data.index.json", _entries(), data_file=data)
+    recorded = json.loads((tmp_path / "data.index.json").read_text())["data"]
+    assert recorded == {"bytes": data.stat().st_size, "crc32": zlib.crc32(data.read_bytes())}
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs node to run app.js")
+def test_app_fingerprints_data_like_the_pipeline(tmp_path: Path):
+    data = tmp_path / "data.json"
+    data.write_text('{"questions": [{"img": {"filename": "Caf\u00e9.JPG"}}]}\n', encoding="utf-8")
+    script = """
+    const fs = require("fs");
+    const src = fs.readFileSync(process.argv[1] + "/app.js", "utf8");
+    eval(src.slice(src.indexOf("function murmurhash3_32_gc")));
+    const bytes = new TextEncoder().encode(fs.readFileSync(process.argv[2], "utf8"));
+    process.stdout.write(JSON.stringify({bytes: bytes.length, crc32: crc32(bytes)}));
+    """
+    out = subprocess.run(["node", "-e", script, str(REPO_ROOT), str(data)], capture_output=True, text=True, check=True).stdout
+    assert json.loads(out) == data_fingerprint(data)
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs node to run elasticlunr")
+def test_matches_index_built_by_elasticlunr(tmp_path: Path):
+    data = tmp_path / "data.json"
+    data.write_text(json.dumps({"questions": _entries()}))
+    script = """
+    require(process.argv[1] + "/elasticlunr.min.js");
+    const fs = require("fs");
+    const src = fs.readFileSync(process.argv[1] + "/app.js", "utf8");
+    eval(src.slice(src.indexOf("function murmurhash3_32_gc")));
+    const raw = JSON.parse(fs.readFileSync(process.argv[2], "utf8")).questions;
+    const idx = lunr(function () {
+      this.setRef("id"); this.addField("title"); this.addField("searchTerms"); this.addField("tags");
+      this.saveDocument(false);
+    });
+    const counts = {};
+    raw.forEach(r => { for (const t in r.question.content) counts[t] = (counts[t] || 0) + 1; });
+    raw.forEach(r => idx.addDoc({
+      id: murmurhash3_32_gc(r.img.filename, 11091974),
+      title: r.img.filename.replace(".JPG", ""),
+      searchTerms: Object.keys(r.question.content).join(" "),
+      tags: Object.keys(r.question.content).map(k =>
+        '<a title="' + counts[k] + ' results for ' + k + '" style="cursor:pointer" onclick="searchTerm(\\'' + k + '\\')">' + k + '</a>'),
+    }));
+    process.stdout.write(JSON.stringify(idx.toJSON()));
+    """
+    out = subprocess.run(["node", "-e", script, str(REPO_ROOT), str(data)], capture_output=True, text=True, check=True).stdout
+    assert json.loads(out) == json.loads(json.dumps(build_index(app_documents(_entries()))))
@@ -0,0 +1,39 @@
+from pathlib import Path
+import sys
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from quality_model import MIN_SAMPLES, QualityModel, image_features, setting_key
+
+
+def test_image_features_are_cheap_statistics():
+    flat = image_features(Image.new("RGB", (64, 64), "gray"))
+    rng = np.random.default_rng(0)
+    noisy = image_features(Image.fromarray(rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)))
+    assert len(flat) == len(noisy)
+    assert flat[1] == 0.0 and noisy[1] > 0.1  # contrast
+    assert flat[4] == 1.0 and noisy[4] == 0.0  # share of flat blocks
+
+
+def test_quality_model_predicts_from_similar_images(tmp_path: Path):
+    key = setting_key("smallfry", 100.75)
+    model = QualityModel(tmp_path / "model.json")
+    assert model.predict(key, [0.0] * 6, 40, 98) is None
+
+    # Two clusters of images: flat ones settle at 40, busy ones at 93/94.
+    for i in range(MIN_SAMPLES):
+        model.add(key, [0.5, 0.01, 0.01, 0.01, 0.9 + i / 1000, 11.0], 40)
+        model.add(key, [0.5, 0.3 + i / 1000, 0.2, 0.3, 0.0, 11.0], 93 + i % 2)
+    start, (low, high) = model.predict(key, [0.5, 0.31, 0.2, 0.3, 0.0, 11.0], 40, 98)
+    assert 93 <= start <= 94 and low <= 93 and high >= 94 and high - low <= 4
+    start, window = model.predict(key, [0.5, 0.0, 0.0, 0.0, 1.0, 11.0], 40, 98)
+    assert start == 40 and window[0] == 40
+
+    model.save()
+    loaded = QualityModel.load(tmp_path / "model.json")
+    assert len(loaded) == len(model)
+    busy = [0.5, 0.31, 0.2, 0.3, 0.0, 11.0]
+    assert loaded.predict(key, busy, 40, 98) == model.predict(key, busy, 40, 98)
+    assert QualityModel.load(tmp_path / "missing.json").predict(key, [0.0] * 6, 40, 98) is None
@@ -0,0 +1,37 @@
+from pathlib import Path
+import json
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from search_index import TagIndex, query_terms
+
+
+def _entry(name, tags):
+    return {
+        "img": {"filename": f"{name}.JPG"},
+        "question": {"content": {t: "1.0" for t in tags}},
+        "thumb": {"filename": f"{name}.THUMB.JPG"},
+    }
+
+
+def test_search_intersects_postings_and_paginates():
+    entries = [_entry(f"IMG_{i}", ["TREE"] + (["APPLE"] if i % 2 else []) + (["BLOSSOM"] if i % 3 == 0 else [])) for i in range(30)]
+    index = TagIndex(entries)
+    assert index.tag_counts == {"TREE": 30, "APPLE": 15, "BLOSSOM": 10}
+
+    result = index.search("apple blossom")
+    assert result.terms == ["APPLE", "BLOSSOM"]
+    assert list(result.ids) == [3, 9, 15, 21, 27]
+    assert index.search("apple, missing").total == 0
+    assert index.search("  ").total == 0
+
+    page = json.loads(index.search_json("tree", offset=28, limit=5))
+    assert page["total"] == 30 and page["offset"] == 28
+    assert [e["img"]["filename"] for e in page["results"]] == ["IMG_28.JPG", "IMG_29.JPG"]
+
+    tags = json.loads(index.tags_json(prefix="b"))
+    assert tags == {"total": 1, "tags": [{"name": "BLOSSOM", "count": 10}]}
+
+
+def test_query_terms_are_upper_case_and_distinct():
+    assert query_terms("apple tree,Apple+bloom") == ["APPLE", "TREE", "BLOOM"]
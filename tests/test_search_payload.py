@@ -0,0 +1,57 @@
+from pathlib import Path
+import json
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from search_payload import MANIFEST_NAME, append_search_payload, read_search_payload, write_search_payload
+
+
+def _entries(n):
+    return [
+        {
+            "img": {"filename": f"IMG_{i}.JPG"},
+            "question": {"content": {t: "1.0" for t in ["TREE", "APPLE", "DOG"][: 1 + i % 3]}},
+            "thumb": {"filename": f"IMG_{i}_ab12cd34.THUMB.JPG"},
+        }
+        for i in range(n)
+    ]
+
+
+def test_payload_round_trips_and_replaces_stale_shards(tmp_path: Path):
+    out = tmp_path / "data.shards"
+    entries = _entries(7)
+    result = write_search_payload(out, iter(entries), shard_size=3)
+    assert result.count == 7 and len(result.shards) == 3
+    manifest = json.loads((out / MANIFEST_NAME).read_text())
+    assert manifest["tags"] == ["TREE", "APPLE", "DOG"] and manifest["tag_counts"] == [7, 4, 2]
+    shard = json.loads((out / manifest["shards"][1]).read_text())
+    assert shard["start"] == 3 and shard["ntags"] == [1, 2, 3] and shard["tags"] == [0, 0, 1, 0, 1, 2]
+    assert read_search_payload(out) == entries
+
+    # Unchanged shards keep their names.  Ones no longer listed survive one
+    # more write, for clients holding the previous manifest, and are then
+    # removed along with their compressed siblings.
+    stale = out / result.shards[2]
+    (out / (stale.name + ".gz")).write_bytes(b"")
+    entries = _entries(6)
+    second = write_search_payload(out, entries, shard_size=3)
+    assert second.shards == result.shards[:2]
+    assert stale.exists() and (out / (stale.name + ".gz")).exists()
+    assert read_search_payload(out) == entries
+    write_search_payload(out, entries, shard_size=3)
+    assert not stale.exists() and not (out / (stale.name + ".gz")).exists()
+
+
+def test_append_rewrites_only_the_last_partial_shard(tmp_path: Path):
+    out = tmp_path / "data.shards"
+    entries = _entries(10)
+    assert append_search_payload(out, entries) is None
+    first = write_search_payload(out, entries[:7], shard_size=3)
+    # A payload that is not the expected length is out of date: not extended.
+    assert append_search_payload(out, entries[7:], count=6) is None
+    assert read_search_payload(out) == entries[:7]
+    result = append_search_payload(out, iter(entries[7:]), count=7)
+    assert result.count == 10 and len(result.shards) == 4
+    assert result.shards[:2] == first.shards[:2] and result.shards[2] != first.shards[2]
+    assert result.shards == write_search_payload(tmp_path / "full", entries, shard_size=3).shards
+    assert read_search_payload(out) == entries
@@ -0,0 +1,210 @@
+from pathlib import Path
+import http.client
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from serve import IMMUTABLE_CACHE_CONTROL, make_server
+
+
+@pytest.fixture
+def site(tmp_path: Path):
+    (tmp_path / "index.html").write_text("<html>hello</html>")
+    (tmp_path / "data.json").write_text('{"images": []}')
+    thumbs = tmp_path / "img" / "thumbs"
+    thumbs.mkdir(parents=True)
+    (thumbs / "photo_ab12cd34.THUMB.JPG").write_bytes(b"\xff\xd8fake jpeg\xff\xd9")
+    server = make_server(0, tmp_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+    yield tmp_path, conn
+    conn.close()
+    server.shutdown()
+    server.server_close()
+
+
+def _get(conn, path, headers=None):
+    conn.request("GET", path, headers=headers or {})
+    response = conn.getresponse()
+    return response, response.read()
+
+
+def test_validators_and_conditional_requests(site):
+    root, conn = site
+    response, body = _get(conn, "/data.json")
+    assert response.status == 200 and body == b'{"images": []}'
+    etag = response.getheader("ETag")
+    assert etag.startswith('"') and response.getheader("Last-Modified")
+    assert response.getheader("Cache-Control") == "no-cache"
+
+    # Same keep-alive connection throughout.
+    response, body = _get(conn, "/data.json", {"If-None-Match": etag})
+    assert response.status == 304 and body == b"" and response.getheader("ETag") == etag
+    last_modified = response.getheader("Last-Modified")
+    response, _ = _get(conn, "/data.json", {"If-Modified-Since": last_modified})
+    assert response.status == 304
+    response, _ = _get(conn, "/data.json", {"If-None-Match": '"stale"', "If-Modified-Since": last_modified})
+    assert response.status == 200
+
+    response, body = _get(conn, "/")
+    assert response.status == 200 and b"hello" in body and response.getheader("ETag")
+    response, _ = _get(conn, "/missing.json")
+    assert response.status == 404
+
+
+def test_regenerated_thumbnail_is_revalidated_and_refetched(site):
+    import os
+
+    root, conn = site
+    thumb = root / "img" / "thumbs" / "photo_ab12cd34.THUMB.JPG"
+    response, body = _get(conn, "/img/thumbs/photo_ab12cd34.THUMB.JPG")
+    assert response.status == 200 and body.startswith(b"\xff\xd8")
+    assert response.getheader("Cache-Control") == "no-cache"
+    etag = response.getheader("ETag")
+    response, _ = _get(conn, "/img/thumbs/photo_ab12cd34.THUMB.JPG", {"If-None-Match": etag})
+    assert response.status == 304
+
+    # Regenerated in place (e.g. with -C or by --watch), under the same name.
+    thumb.write_bytes(b"\xff\xd8new jpeg\xff\xd9")
+    os.utime(thumb, ns=(1, 2_000_000_000_000_000_000))
+    response, body = _get(conn, "/img/thumbs/photo_ab12cd34.THUMB.JPG", {"If-None-Match": etag})
+    assert response.status == 200 and body == b"\xff\xd8new jpeg\xff\xd9"
+    assert response.getheader("ETag") != etag
+    assert "immutable" not in response.getheader("Cache-Control")
+
+
+def test_content_negotiation_uses_fresh_siblings_and_compresses_on_the_fly(site):
+    import gzip
+    import os
+
+    from precompress import precompress_file
+
+    root, conn = site
+    payload = b'{"questions": [' + b'{"tag": "cat"}, ' * 500 + b'{}]}'
+    (root / "data.json").write_bytes(payload)
+    (root / "app.js").write_text("var x = 1;\n" * 400)
+
+    precompress_file(root / "data.json", ["gzip"])
+    response, body = _get(conn, "/data.json", {"Accept-Encoding": "gzip, deflate"})
+    assert response.getheader("Content-Encoding") == "gzip"
+    assert response.getheader("Vary") == "Accept-Encoding"
+    assert gzip.decompress(body) == payload
+    gz_etag = response.getheader("ETag")
+    response, _ = _get(conn, "/data.json", {"Accept-Encoding": "gzip", "If-None-Match": gz_etag})
+    assert response.status == 304
+
+    response, body = _get(conn, "/data.json", {"Accept-Encoding": "identity"})
+    assert response.getheader("Content-Encoding") is None and body == payload
+    assert response.getheader("ETag") != gz_etag
+
+    # A sibling older than its source is ignored and the source is compressed
+    # on the fly instead.
+    sibling = root / "data.json.gz"
+    sibling.write_bytes(gzip.compress(b"stale"))
+    os.utime(sibling, ns=(0, 0))
+    response, body = _get(conn, "/data.json", {"Accept-Encoding": "gzip;q=1, br;q=0"})
+    assert response.getheader("Content-Encoding") == "gzip" and gzip.decompress(body) == payload
+
+    response, body = _get(conn, "/app.js", {"Accept-Encoding": "*"})
+    assert response.getheader("Content-Encoding") in ("gzip", "br")
+    response, body = _get(conn, "/img/thumbs/photo_ab12cd34.THUMB.JPG", {"Accept-Encoding": "gzip"})
+    assert response.getheader("Content-Encoding") is None and response.getheader("Vary") is None
+
+
+def test_acceptable_encodings_follows_q_values():
+    from serve import acceptable_encodings
+
+    assert acceptable_encodings("gzip, br", ["br", "gzip"]) == ["br", "gzip"]
+    assert acceptable_encodings("gzip;q=1.0, br;q=0.5", ["br", "gzip"]) == ["gzip", "br"]
+    assert acceptable_encodings("*;q=0.1, gzip;q=0", ["br", "gzip"]) == ["br"]
+    assert acceptable_encodings(None, ["gzip"]) == []
+
+
+def test_search_api(tmp_path: Path):
+    import gzip
+    import json
+
+    entries = [
+        {"img": {"filename": f"IMG_{i}.JPG"}, "question": {"content": {"TREE": "1.0", **({"APPLE": "1.0"} if i % 2 else {})}},
+         "thumb": {"filename": f"IMG_{i}.THUMB.JPG"}}
+        for i in range(100)
+    ]
+    (tmp_path / "data.json").write_text(json.dumps({"questions": entries}))
+    server = make_server(0, tmp_path, data_file=tmp_path / "data.json", poll_interval=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+    try:
+        response, body = _get(conn, "/api/search?q=tree+apple&offset=10&limit=5")
+        assert response.status == 200 and response.getheader("Content-Type") == "application/json"
+        page = json.loads(body)
+        assert page["total"] == 50 and page["query"] == ["TREE", "APPLE"]
+        assert [e["img"]["filename"] for e in page["results"]] == [f"IMG_{i}.JPG" for i in (21, 23, 25, 27, 29)]
+
+        response, body = _get(conn, "/api/tags", {"Accept-Encoding": "gzip"})
+        tags = json.loads(gzip.decompress(body) if response.getheader("Content-Encoding") else body)
+        assert tags["tags"] == [{"name": "TREE", "count": 100}, {"name": "APPLE", "count": 50}]
+
+        response, body = _get(conn, "/api/search?q=tree&limit=10000", {"Accept-Encoding": "gzip"})
+        assert response.getheader("Content-Encoding") == "gzip"
+        assert len(json.loads(gzip.decompress(body))["results"]) == 100
+
+        response, _ = _get(conn, "/api/search?q=tree&limit=many")
+        assert response.status == 400
+        response, _ = _get(conn, "/api/nope")
+        assert response.status == 404
+    finally:
+        conn.close()
+        server.shutdown()
+        server.server_close()
+
+
+def test_data_file_is_reloaded_when_it_changes(tmp_path: Path):
+    import gzip
+    import json
+    import os
+
+    data_file = tmp_path / "data.json"
+    old = {"questions": [{"img": {"filename": "A.JPG"}, "question": {"content": {"CAT": "1.0"}}, "thumb": {"filename": "A.THUMB.JPG"}}]}
+    data_file.write_text(json.dumps(old))
+    server = make_server(0, tmp_path, data_file=data_file, poll_interval=0)
+    watcher = server.data_watcher
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+    try:
+        old_snapshot = watcher.snapshot
+        assert watcher.check() is False
+        response, body = _get(conn, "/data.json", {"Accept-Encoding": "gzip"})
+        assert gzip.decompress(body) == data_file.read_bytes()
+        old_etag = response.getheader("ETag")
+
+        # A half-written file is rejected and the old snapshot kept.
+        data_file.write_text('{"questions": [')
+        assert watcher.check() is False and watcher.snapshot is old_snapshot
+        response, body = _get(conn, "/api/search?q=cat")
+        assert json.loads(body)["total"] == 1
+
+        new = {"questions": old["questions"] + [
+            {"img": {"filename": "B.JPG"}, "question": {"content": {"DOG": "1.0"}}, "thumb": {"filename": "B.THUMB.JPG"}}
+        ]}
+        data_file.write_text(json.dumps(new))
+        os.utime(data_file, ns=(1, 2_000_000_000_000_000_000))
+        assert watcher.check() is True
+        response, body = _get(conn, "/api/tags")
+        assert [t["name"] for t in json.loads(body)["tags"]] == ["CAT", "DOG"]
+        response, body = _get(conn, "/data.json", {"If-None-Match": old_etag})
+        assert response.status == 200 and json.loads(body) == new
+        assert response.getheader("ETag") != old_etag
+    finally:
+        conn.close()
+        server.shutdown()
+        server.server_close()
+
+
+def test_content_hashed_names_are_immutable():
+    from serve import cache_control_for
+
+    assert cache_control_for("/site/data.shards/shard-00003-0123456789abcdef.json") == IMMUTABLE_CACHE_CONTROL
+    assert cache_control_for("/site/data.shards/manifest.json") == "no-cache"
@@ -0,0 +1,24 @@
+from pathlib import Path
+import subprocess
+import sys
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+HEAVY = ("torch", "transformers", "spacy", "skimage", "jpeglib")
+
+
+def _imported(modules, heavy):
+    code = (
+        f"import sys, {', '.join(modules)}\n"
+        f"print(','.join(m for m in {heavy!r} if m in sys.modules))\n"
+    )
+    return subprocess.run(
+        [sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    ).stdout.strip()
+
+
+def test_cli_modules_do_not_import_heavy_dependencies():
+    assert _imported(["run_pipeline", "make_thumbs", "offline_tags", "jpeg_recompress"], HEAVY) == ""
+
+
+def test_serve_only_needs_the_standard_library():
+    assert _imported(["serve"], HEAVY + ("numpy", "PIL")) == ""
@@ -2,6 +2,35 @@ from pathlib import Path
 import hashlib
 
 
+def resolved_path_hash(resolved: str) -> str:
+    """Hash an already resolved path string (see :func:`folder_hash`)."""
+    return hashlib.blake2s(resolved.encode("utf-8"), digest_size=4).hexdigest()
+
+
 def folder_hash(path: Path) -> str:
     """Return a short, deterministic hash for the given directory path."""
-    return hashlib.blake2s(str(path.resolve()).encode("utf-8"), digest_size=4).hexdigest()
+    return resolved_path_hash(str(path.resolve()))
+
+
+def _sanitize(part: str) -> str:
+    return part.replace(' ', '_').replace('.', '_')
+
+
+def thumb_prefix(resolved_dir: Path) -> str:
+    """Return the sanitized filename prefix shared by images in ``resolved_dir``."""
+    relative = resolved_dir.relative_to(resolved_dir.anchor)
+    return '_'.join(_sanitize(part) for part in relative.parts)
+
+
+def thumb_name_in_dir(prefix: str, dir_hash: str, name: str) -> str:
+    """Build a thumbnail filename from a precomputed directory prefix and hash."""
+    sanitized = f"{prefix}_{_sanitize(name)}" if prefix else _sanitize(name)
+    return f"{sanitized}_{dir_hash}.THUMB.JPG"
+
+
+def generate_thumb_filename(img_path: Path) -> str:
+    """Generate a thumbnail filename using the full image path with a short hash."""
+    absolute = img_path.resolve()
+    return thumb_name_in_dir(
+        thumb_prefix(absolute.parent), resolved_path_hash(str(absolute.parent)), absolute.name
+    )